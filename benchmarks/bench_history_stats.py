@@ -0,0 +1,81 @@
+"""Time to record one run and compute the 30/90-day trend stats from the task history.
+
+Fills a throw-away history with --days of runs over --tasks synthetic tasks
+(each task is open for a few days, then completed or left overdue), then times
+record_tasks() for one run and productivity_stats() over both windows.
+
+    python benchmarks/bench_history_stats.py --days 90 --tasks 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LIFESYNC_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-history-")
+
+from src.digest.history import record_tasks
+from src.digest.stats import productivity_stats, stats_html
+from src.get_notion.models import Priority, Task, TaskFlag
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+
+
+def make_tasks(count, rng):
+    tasks = []
+    for i in range(count):
+        start = TODAY - timedelta(days=rng.randint(0, 100))
+        due = start + timedelta(days=rng.randint(0, 7))
+        tasks.append((f"page-{i:06d}", start, due, rng.random() < 0.7, rng.choice(list(Priority)),
+                      rng.random() < 0.5))
+    return tasks
+
+
+def buckets_on(day, tasks):
+    """Tasks visible on one run day, completed on their due day when they ever get done."""
+    visible = []
+    for page_id, start, due, gets_done, priority, eta in tasks:
+        if not start <= day <= due + timedelta(days=7):
+            continue
+        flags = TaskFlag.ETA if eta else TaskFlag.NONE
+        if gets_done and day >= due:
+            flags |= TaskFlag.COMPLETED
+        visible.append(Task(page_id, page_id, "Task", datetime.combine(start, datetime.min.time(), TZ),
+                            datetime.combine(due, datetime.min.time(), TZ), priority, None, flags, "", ""))
+    return {"in_progress": visible}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--tasks", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    tasks = make_tasks(args.tasks, rng)
+    for offset in range(args.days, 0, -1):
+        day = TODAY - timedelta(days=offset)
+        record_tasks("bench", day, buckets_on(day, tasks))
+
+    started = time.perf_counter()
+    rows = record_tasks("bench", TODAY, buckets_on(TODAY, tasks))
+    record_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    stats = productivity_stats("bench", TODAY)
+    stats_ms = (time.perf_counter() - started) * 1000
+
+    print(f"\n{args.days + 1} runs, {args.tasks} tasks")
+    print(f"record one run ({rows} rows): {record_ms:.1f} ms")
+    print(f"30/90-day stats:               {stats_ms:.1f} ms")
+    for window, s in stats.items():
+        print(f"  {window:>2}d: {s}")
+    print(f"\n{stats_html(stats)}")
+
+
+if __name__ == "__main__":
+    main()
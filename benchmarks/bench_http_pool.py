@@ -0,0 +1,159 @@
+"""Weather + mail throughput: one-shot requests vs the shared session vs the async pool.
+
+Starts a local stand-in for the OpenWeather and Mailgun APIs (fixed latency per
+request, HTTP/1.1 keep-alive), points the clients at it and runs the per-user
+HTTP work of a digest (resolve location, forecast, send mail) for N users:
+
+- oneshot:  the old behaviour, a new connection for every requests.get/post
+- session:  sequential, over the shared keep-alive requests.Session
+- async:    all users concurrently over the shared httpx.AsyncClient
+
+    python benchmarks/bench_http_pool.py --users 50 --latency 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024  # headers and body in one segment, no delayed-ACK stalls on keep-alive
+    latency = 0.0
+    connections = set()
+    deliveries = []  # (recipient, scheduled UTC datetime) for messages sent with o:deliverytime
+
+    def _reply(self, payload, status=200):
+        time.sleep(self.latency)
+        StandIn.connections.add(self.client_address)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith("/forecast"):
+            now = int(time.time())
+            slot = {"main": {"temp": 20, "feels_like": 19, "temp_min": 18, "temp_max": 22, "humidity": 60},
+                    "weather": [{"description": "clear sky"}], "wind": {"speed": 3}, "pop": 0.1}
+            self._reply({"list": [dict(slot, dt=now + i * 10800) for i in range(16)]})
+        else:
+            city_id = int(query["id"][0]) if "id" in query else sum(map(ord, query["q"][0]))
+            self._reply({"id": city_id, "name": query.get("q", ["city"])[0], "coord": {"lat": 0, "lon": 0},
+                         "main": {"temp": 20, "feels_like": 19, "humidity": 60},
+                         "weather": [{"description": "clear sky"}], "wind": {"speed": 3}})
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        if "o:deliverytime" in form:
+            # Mailgun takes an RFC 2822 date, no more than 3 days ahead
+            try:
+                scheduled = parsedate_to_datetime(form["o:deliverytime"][0])
+            except (TypeError, ValueError):
+                scheduled = None
+            now = datetime.now(timezone.utc)
+            if scheduled is None or scheduled.tzinfo is None or not now - timedelta(minutes=1) <= scheduled <= now + timedelta(days=3):
+                self._reply({"message": f"Invalid o:deliverytime: {form['o:deliverytime'][0]}"}, 400)
+                return
+            StandIn.deliveries.append((form["to"][0], scheduled))
+        self._reply({"id": "<bench@stand-in>", "message": "Queued. Thank you."})
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    request_queue_size = 256  # the default backlog of 5 drops SYNs when many clients connect at once
+
+
+def start_server(latency):
+    StandIn.latency = latency
+    server = StandInServer(("127.0.0.1", 0), StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=40, help="stand-in latency per request, ms")
+    args = parser.parse_args()
+
+    server = start_server(args.latency / 1000)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cache_dir = tempfile.mkdtemp(prefix="bench-http-")
+    os.environ.update({
+        "OPENWEATHER_API_BASE": base, "OPENWEATHER_API_KEY": "bench",
+        "MAILGUN_API_BASE": base, "MAILGUN_API_KEY": "bench", "MAILGUN_DOMAIN": "bench.local",
+        "LIFESYNC_CACHE_DIR": cache_dir, "WEATHER_MODE": "forecast",
+        "HTTP_MAX_CONNECTIONS": str(min(args.users, 100)),
+    })
+
+    import requests
+    from src.get_weather import get_weather_forecast, get_weather_forecast_async
+    from src.send_email.email_notifier import send_email, send_email_async
+    from src.utils import http_pool
+
+    users = [(f"City {i}", f"user{i}@bench.local") for i in range(args.users)]
+
+    def reset():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        StandIn.connections.clear()
+
+    def run_sync():
+        for location, receiver in users:
+            get_weather_forecast(location, 8)
+            send_email("<p>bench</p>", receiver, "Bench", 8)
+
+    async def run_async():
+        async def one(location, receiver):
+            await get_weather_forecast_async(location, 8)
+            await send_email_async("<p>bench</p>", receiver, "Bench", 8)
+        await asyncio.gather(*(one(location, receiver) for location, receiver in users))
+        await http_pool.close_async_client()
+
+    def oneshot():
+        # requests.get/post open a fresh connection per call, as before the pool
+        original = http_pool.session
+        http_pool.session = lambda: requests
+        try:
+            run_sync()
+        finally:
+            http_pool.session = original
+
+    results = []
+    for name, run in (("oneshot", oneshot), ("session", run_sync), ("async", lambda: asyncio.run(run_async()))):
+        reset()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        results.append((name, elapsed, len(StandIn.connections)))
+
+    server.shutdown()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    requests_made = args.users * 3
+    print(f"\n{args.users} users, {requests_made} requests, {args.latency:g} ms stand-in latency")
+    print(f"{'mode':<10}{'total s':>10}{'req/s':>10}{'connections':>14}")
+    for name, elapsed, connections in results:
+        print(f"{name:<10}{elapsed:>10.2f}{requests_made / elapsed:>10.1f}{connections:>14}")
+
+
+if __name__ == "__main__":
+    main()
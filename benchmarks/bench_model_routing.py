@@ -0,0 +1,99 @@
+"""Compare per-stage model routing policies on the same digest fixtures.
+
+Each policy maps the pipeline stages (analysis, html) to a model. Every
+fixture is run once per policy against the real provider, and the recorded
+usage is reported as latency and estimated token cost per stage.
+
+    python benchmarks/bench_model_routing.py \
+        --policy single=analysis:gpt-4o,html:gpt-4o \
+        --policy fast-analysis=analysis:gpt-4o-mini,html:gpt-4o
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ai_operations import ai_client
+from src.ai_operations.model_router import STAGES, estimate_cost
+from src.get_notion.models import Event, Task
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "digest_inputs.json")
+
+
+def parse_policy(text):
+    """'name=analysis:model,html:model' -> (name, {stage: model})"""
+    name, _, spec = text.partition("=")
+    models = dict(part.split(":", 1) for part in spec.split(","))
+    missing = set(STAGES) - set(models)
+    if missing:
+        raise argparse.ArgumentTypeError(f"policy {name} is missing stages: {sorted(missing)}")
+    return name, models
+
+
+def load_data(fixture):
+    """Turn the fixture's plain dicts into the Task/Event objects the fetchers return."""
+    tz = datetime.fromisoformat(fixture["local_time"]).tzinfo
+    data = {}
+    for key, value in fixture["data"].items():
+        if key.endswith("_tasks"):
+            value = [Task.from_dict(item, tz) for item in value]
+        elif key.endswith("_events"):
+            value = [Event.from_dict(item, tz) for item in value]
+        data[key] = value
+    return data
+
+
+def run_fixture(kind, fixture, models):
+    if kind == "morning":
+        from src.ai_operations.ai_morning_advice import email_advice_with_ai
+    else:
+        from src.ai_operations.ai_night_advice import email_advice_with_ai
+    email_advice_with_ai(
+        load_data(fixture),
+        models,
+        fixture["present_location"],
+        fixture["user_career"],
+        datetime.fromisoformat(fixture["local_time"]),
+        fixture["schedule_prompt"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--policy", action="append", type=parse_policy, required=True)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    rows = []
+    for name, models in args.policy:
+        for kind, cases in fixtures.items():
+            for fixture in cases:
+                for _ in range(args.repeat):
+                    first_entry = len(ai_client.USAGE_LOG)
+                    started = time.perf_counter()
+                    run_fixture(kind, fixture, models)
+                    wall = time.perf_counter() - started
+                    entries = ai_client.USAGE_LOG[first_entry:]
+                    row = {"policy": name, "fixture": fixture["name"], "wall_s": wall}
+                    for stage in STAGES:
+                        stage_entries = [e for e in entries if e["stage"] == stage]
+                        row[f"{stage}_s"] = sum(e["latency"] or 0 for e in stage_entries)
+                        row[f"{stage}_tokens"] = sum(e["prompt_tokens"] + e["completion_tokens"] for e in stage_entries)
+                    row["cost_usd"] = sum(estimate_cost(e) for e in entries)
+                    rows.append(row)
+
+    header = ["policy", "fixture", "wall_s"] + [f"{s}_{m}" for s in STAGES for m in ("s", "tokens")] + ["cost_usd"]
+    print("\n" + "\t".join(header))
+    for row in rows:
+        print("\t".join(f"{row[h]:.4f}" if isinstance(row[h], float) else str(row[h]) for h in header))
+
+
+if __name__ == "__main__":
+    main()
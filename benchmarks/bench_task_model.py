@@ -0,0 +1,120 @@
+"""Memory and fetch-path time of Task objects versus the previous per-task dicts.
+
+Generates synthetic Notion query rows, then for each representation measures
+the memory held by 10k parsed tasks (tracemalloc) and the time to turn the rows
+into digest buckets. The dict path is timed as the code before Task did it:
+classification on the parsed datetimes, inside the same loop that formats them.
+
+    python benchmarks/bench_task_model.py --tasks 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.get_notion.models import Task
+from src.get_notion.task_from_notion import classify_tasks
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        start = datetime(2025, 3, 10, 0, 0, tzinfo=timezone.utc) + timedelta(hours=rng.randint(-72, 72))
+        end = start + timedelta(hours=rng.randint(1, 48)) if rng.random() < 0.7 else None
+        rows.append({
+            "id": f"page-{i:06d}",
+            "last_edited_time": "2025-03-09T12:00:00.000Z",
+            "properties": {
+                "Name": {"title": [{"text": {"content": f"Task number {i}"}}]},
+                "Date": {"date": {"start": start.isoformat().replace("+00:00", "Z"),
+                                  "end": end.isoformat().replace("+00:00", "Z") if end else None}},
+                "Priority": {"select": {"name": rng.choice(["High", "Medium", "Low"])}},
+                "Type": {"select": {"name": "Task"}},
+                "剩余天数": {"number": rng.randint(0, 30)},
+                "# ETA": {"checkbox": rng.random() < 0.5},
+                "Complete": {"checkbox": rng.random() < 0.3},
+            },
+        })
+    return rows
+
+
+def _legacy_row(row):
+    """The per-row dict fetch_tasks_from_notion built before Task existed, with the datetimes it classified on."""
+    props = row.get('properties', {})
+    date_prop = props.get('Date', {}).get('date', {})
+    start_local = datetime.fromisoformat(date_prop['start'].replace('Z', '+00:00')).astimezone(TZ)
+    end_local = datetime.fromisoformat(date_prop['end'].replace('Z', '+00:00')).astimezone(TZ) if date_prop.get('end') else None
+    task = {
+        'Name': ''.join(t.get('text', {}).get('content', '') for t in props.get('Name', {}).get('title', [])).strip(),
+        'Type': props.get('Type', {}).get('select', {}).get('name', 'Task'),
+        'Start': start_local.strftime('%Y-%m-%d %H:%M'),
+        'End': end_local.strftime('%Y-%m-%d %H:%M') if end_local else 'N/A',
+        'Priority': props.get('Priority', {}).get('select', {}).get('name', 'NA'),
+        'RemainingDays': props.get('剩余天数', {}).get('number', None),
+        'ETA': props.get('# ETA', {}).get('checkbox', False),
+        'Completed': props.get('Complete', {}).get('checkbox', False),
+    }
+    return task, start_local, end_local
+
+
+def fetch_dicts(rows):
+    """Rows to buckets as the legacy loop did: parse, format and classify each row in one pass."""
+    buckets = {"today_due": [], "in_progress": [], "future": [], "completed": []}
+    for row in rows:
+        task, start_local, end_local = _legacy_row(row)
+        if task['Completed']:
+            buckets["completed"].append(task)
+        elif end_local and end_local.date() == TODAY:
+            buckets["today_due"].append(task)
+        elif start_local.date() <= TODAY:
+            buckets["in_progress"].append(task)
+        else:
+            buckets["future"].append(task)
+    return buckets
+
+
+def fetch_tasks(rows):
+    """Rows to buckets through Task.from_notion_row and classify_tasks."""
+    return classify_tasks([Task.from_notion_row(row, TZ) for row in rows], TODAY, include_completed=True)
+
+
+def measure(name, rows, fetch, repeat):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    buckets = fetch(rows)
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del buckets
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetch(rows)
+        timings.append(time.perf_counter() - started)
+    per_10k = held / len(rows) * 10_000
+    print(f"{name:<8} memory/10k tasks: {per_10k / 1024 / 1024:7.2f} MiB   "
+          f"rows -> buckets (best of {repeat}): {min(timings) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.tasks)
+    measure("dict", rows, fetch_dicts, args.repeat)
+    measure("Task", rows, fetch_tasks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Check that precomputed digests are scheduled for each user's local delivery hour.
+
+Runs send_email() with the deliver_at that precompute mode computes for a spread
+of TIME_ZONE offsets against the local Mailgun stand-in (see bench_http_pool.py),
+which rejects a malformed, past or more than 3 days ahead o:deliverytime and
+records the rest. Every recorded time must fall on the morning/night hour in the
+user's own time zone, and be the next such hour after the off-peak run. A night
+digest is only scheduled on the user's current local date; after tonight's hour
+it is sent right away.
+
+    python benchmarks/check_scheduled_delivery.py --offsets -10 -4 0 5 8 14
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_http_pool import StandIn, start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offsets", type=int, nargs="+", default=[-10, -7, -4, 0, 1, 5, 8, 9, 12, 14])
+    args = parser.parse_args()
+
+    server = start_server(0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "MAILGUN_API_BASE": base, "MAILGUN_API_KEY": "check", "MAILGUN_DOMAIN": "check.local",
+        "LIFESYNC_CACHE_DIR": tempfile.mkdtemp(prefix="check-delivery-"),
+    })
+
+    import requests
+    from config import MORNING_DELIVERY_HOUR, NIGHT_DELIVERY_HOUR
+    from src.digest.scheduler import next_delivery, same_day_delivery
+    from src.send_email.email_notifier import send_email
+
+    utc_now = datetime.now(timezone.utc)
+    expected, immediate = {}, 0
+    for digest, hour in (("morning", MORNING_DELIVERY_HOUR), ("night", NIGHT_DELIVERY_HOUR)):
+        delivery = next_delivery if digest == "morning" else same_day_delivery
+        for offset in args.offsets:
+            receiver = f"{digest}{offset:+d}@check.local"
+            deliver_at = delivery(offset, hour, utc_now)
+            if deliver_at is None:
+                immediate += 1
+                print(f"⏩ {receiver:<24} past tonight's {hour:02d}:00 local, sent now")
+                continue
+            send_email("<p>check</p>", receiver, "Check", offset, deliver_at=deliver_at)
+            expected[receiver] = (digest, offset, hour)
+
+    failures, on_time = [], 0
+    recorded = dict(StandIn.deliveries)
+    for receiver, (digest, offset, hour) in expected.items():
+        scheduled = recorded.get(receiver)
+        if scheduled is None:
+            failures.append(f"{receiver}: not scheduled")
+            continue
+        local = scheduled.astimezone(timezone(timedelta(hours=offset)))
+        if (local.hour, local.minute) != (hour, 0):
+            failures.append(f"{receiver}: delivers at {local.isoformat()}, expected {hour:02d}:00 local")
+        elif not utc_now < scheduled <= utc_now + timedelta(days=1):
+            failures.append(f"{receiver}: {scheduled.isoformat()} is not the next {hour:02d}:00 local")
+        elif digest == "night" and local.date() != utc_now.astimezone(local.tzinfo).date():
+            failures.append(f"{receiver}: night digest scheduled for {local.date()}, not today")
+        else:
+            on_time += 1
+            print(f"✅ {receiver:<24} {scheduled.isoformat()} UTC = {local.strftime('%Y-%m-%d %H:%M')} local")
+
+    # The stand-in itself must refuse times Mailgun would refuse
+    for value in ("not a date", "Mon, 01 Jan 2001 07:00:00 +0000",
+                  (utc_now + timedelta(days=4)).strftime("%a, %d %b %Y %H:%M:%S +0000")):
+        response = requests.post(f"{base}/check.local/messages", data={"to": "bad@check.local", "o:deliverytime": value})
+        if response.status_code != 400:
+            failures.append(f"stand-in accepted o:deliverytime {value!r}")
+
+    server.shutdown()
+    print(f"\n{on_time}/{len(expected)} deliveries on the local hour, {immediate} night digests sent now")
+    if failures:
+        print("\n".join(f"❌ {failure}" for failure in failures))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
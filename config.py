@@ -9,9 +9,99 @@ ENV_DATABASE_ID = os.getenv("ENV_DATABASE_ID")
 # Mailbox config
 MAILGUN_API_KEY = os.getenv("MAILGUN_API_KEY")
 MAILGUN_DOMAIN = os.getenv("MAILGUN_DOMAIN")
+MAILGUN_API_BASE = os.getenv("MAILGUN_API_BASE", "https://api.mailgun.net/v3").rstrip("/")
 
 # OpenAI GPT api
 AI_API_KEY = os.getenv("AI_API_KEY")
 
 # Weather API
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
\ No newline at end of file
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+OPENWEATHER_API_BASE = os.getenv("OPENWEATHER_API_BASE", "https://api.openweathermap.org/data/2.5").rstrip("/")
+
+# Night digest: generate each section with its own prompt, concurrently
+NIGHT_SECTION_PARALLEL = os.getenv("NIGHT_SECTION_PARALLEL", "false").lower() in ("1", "true", "yes")
+NIGHT_SECTION_RETRIES = int(os.getenv("NIGHT_SECTION_RETRIES", "2"))
+
+# Per-stage model defaults (fall back to each user's GPT_VERSION when unset)
+AI_MODEL_ANALYSIS = os.getenv("AI_MODEL_ANALYSIS")
+AI_MODEL_HTML = os.getenv("AI_MODEL_HTML")
+
+# Streaming and per-stage output caps (max_tokens; 0 means no cap)
+AI_STREAMING = os.getenv("AI_STREAMING", "false").lower() in ("1", "true", "yes")
+STAGE_MAX_TOKENS = {
+    "analysis": int(os.getenv("AI_MAX_TOKENS_ANALYSIS", "1500")) or None,
+    "html": int(os.getenv("AI_MAX_TOKENS_HTML", "4000")) or None,
+}
+
+# LLM ledger (tokens, latency, cost per call) and per-user daily token budgets (0 = unlimited;
+# a DAILY_TOKEN_BUDGET column in the config table overrides it per user)
+LLM_LEDGER = os.getenv("LLM_LEDGER", "true").lower() in ("1", "true", "yes")
+USER_DAILY_TOKEN_BUDGET = int(os.getenv("USER_DAILY_TOKEN_BUDGET", "0"))
+# Past this share of the budget every stage uses BUDGET_DOWNGRADE_MODEL; at the budget digests render without AI
+BUDGET_DOWNGRADE_MODEL = os.getenv("BUDGET_DOWNGRADE_MODEL", "")
+BUDGET_DOWNGRADE_RATIO = float(os.getenv("BUDGET_DOWNGRADE_RATIO", "0.8"))
+
+# Local cache directory for schemas, snapshots and other state kept between runs
+CACHE_DIR = os.getenv("LIFESYNC_CACHE_DIR", ".cache")
+# The user config snapshot holds every user's Notion token and address, so it lives
+# outside CACHE_DIR (which the workflows upload to the Actions cache)
+CONFIG_SNAPSHOT_DIR = os.getenv("LIFESYNC_CONFIG_DIR", CACHE_DIR.rstrip("/\\") + "-config")
+
+# Task query window around the local day; one query fills every digest bucket
+TASK_LOOKBACK_DAYS = int(os.getenv("TASK_LOOKBACK_DAYS", "7"))
+TASK_LOOKAHEAD_DAYS = int(os.getenv("TASK_LOOKAHEAD_DAYS", "7"))
+
+# Weather: "forecast" (one 5-day/3-hour call shared by morning and night) or "current"
+WEATHER_MODE = os.getenv("WEATHER_MODE", "forecast").lower()
+WEATHER_CACHE_TTL_HOURS = float(os.getenv("WEATHER_CACHE_TTL_HOURS", "12"))
+
+# User config table: incremental sync by last_edited_time, full re-read this often.
+# Only a persistent CONFIG_SNAPSHOT_DIR (worker.py, a server) benefits; the GitHub
+# workflows start without a snapshot and always read the whole table.
+USER_CONFIG_FULL_REFRESH_HOURS = float(os.getenv("USER_CONFIG_FULL_REFRESH_HOURS", "24"))
+
+# Shared HTTP connection pool for weather and mail (sync session and async client)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+
+# Digest scheduling: parallel users, local delivery hours and deadline tier width
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "1"))
+MORNING_DELIVERY_HOUR = int(os.getenv("MORNING_DELIVERY_HOUR", "7"))
+NIGHT_DELIVERY_HOUR = int(os.getenv("NIGHT_DELIVERY_HOUR", "21"))
+DIGEST_DEADLINE_WINDOW_MINUTES = int(os.getenv("DIGEST_DEADLINE_WINDOW_MINUTES", "60"))
+# Precompute mode: generate off-peak and let Mailgun deliver at the local hour (o:deliverytime)
+DIGEST_PRECOMPUTE = os.getenv("DIGEST_PRECOMPUTE", "false").lower() in ("1", "true", "yes")
+
+# Night digest: send only the task changes since the morning snapshot when one exists
+NIGHT_TASK_DIFF = os.getenv("NIGHT_TASK_DIFF", "true").lower() in ("1", "true", "yes")
+
+# Keep a local task history and add a trend section (no model call) to both digests
+TASK_HISTORY = os.getenv("TASK_HISTORY", "true").lower() in ("1", "true", "yes")
+
+# Open tasks sent to the model in full, best-ranked first; the rest are sent as counts (0 = all)
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "25"))
+
+# Task page bodies as descriptions: off by default, first N blocks, bounded concurrency
+FETCH_TASK_BODIES = os.getenv("FETCH_TASK_BODIES", "false").lower() in ("1", "true", "yes")
+PAGE_BODY_BLOCKS = int(os.getenv("PAGE_BODY_BLOCKS", "10"))
+PAGE_FETCH_WORKERS = int(os.getenv("PAGE_FETCH_WORKERS", "3"))
+
+# Night run writes the next morning's digest ahead; the morning sends it when its inputs are unchanged
+SPECULATIVE_DRAFTS = os.getenv("SPECULATIVE_DRAFTS", "false").lower() in ("1", "true", "yes")
+
+# On-demand worker (worker.py): bind address and optional bearer token for triggers
+WORKER_HOST = os.getenv("WORKER_HOST", "127.0.0.1")
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8765"))
+WORKER_TOKEN = os.getenv("WORKER_TOKEN", "")
+
+# HTTP cassettes for reproducible runs: LIFESYNC_CASSETTE=record|replay (unset = live traffic)
+CASSETTE_MODE = os.getenv("LIFESYNC_CASSETTE", "")
+CASSETTE_DIR = os.getenv("LIFESYNC_CASSETTE_DIR", "cassettes")
+CASSETTE_LATENCY_SCALE = float(os.getenv("LIFESYNC_CASSETTE_LATENCY", "1.0"))
+
+# --profile output: cProfile/tracemalloc results per run, user and stage
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Write the generated schedule back to each user's SCHEDULE_PAGE_ID page; Notion allows ~3 requests/s per token
+NOTION_WRITEBACK = os.getenv("NOTION_WRITEBACK", "false").lower() in ("1", "true", "yes")
+NOTION_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", "3"))
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import pytz
 from datetime import datetime
 from typing import Dict, Any, List, Union
@@ -16,89 +17,213 @@ def safe_get(dictionary, *keys, default=None):
 
 # ----- Configuration -----
 def validate_config(user_data):
-    """Check for required keys in each user's config"""
-    required_keys = {
-        'USER_ID', 'PRESENT_LOCATION', 'USER_NOTION_TOKEN',
-        'USER_DATABASE_ID', 'GPT_VERSION', 'TIME_ZONE',
-        'EMAIL_RECEIVER', 'EMAIL_TITLE', 'USER_CAREER',
-        'SCHEDULE_PROMPT', 'USER_NAME' 
-    }
-    
+    """Report the validation errors precomputed for each user's config"""
     for user_id, config in user_data.items():
-        missing = required_keys - set(config.keys())
-        if missing:
-            print(f"⛔ User {user_id} missing keys: {missing}")
-            continue  # Skip invalid users
+        for warning in config.warnings:
+            print(f"⚠️ User {user_id}: {warning}")
+        if config.errors["morning"]:
+            print(f"⛔ User {user_id} missing keys: {config.errors['morning']}")
         
 # ----- Data Fetching -----
 def fetch_user_data() -> dict:
     try:
-        from src.get_env.env_from_notion import get_user_env_vars
-        data = get_user_env_vars()
-        print("\n=== RAW NOTION DATA ===")
-        print(f"Type: {type(data)}")
-        print(f"Content: {data}")
+        from src.get_env.user_config import load_user_configs
+        data = load_user_configs()
+        print("\n=== USER CONFIGS ===")
+        for user_id, config in data.items():
+            print(f"{user_id}: UTC{config.tz_offset:+d}, models {config.stage_models}")
         print("=====================")
         return data
     except Exception as e:
         raise RuntimeError(f"Data fetch failed: {str(e)}") from e
 
 
-def fetch_weather_data(location: str, tz_offset: int) -> Dict:
+def fetch_weather_data(location: str, tz_offset: int, now: datetime = None) -> Dict:
     """Get weather data with error handling"""
     try:
         from src.get_weather import get_weather_forecast
-        return get_weather_forecast(location, tz_offset)
+        return get_weather_forecast(location, tz_offset, now)
     except Exception as e:
         print(f"Weather API error: {str(e)}")
         return {}
 
 def fetch_tasks(config: Dict, date: datetime.date, tz_offset: int) -> Dict:
-    """Fetch tasks from Notion with error handling"""
+    """Fetch tasks from Notion with error handling.
+
+    Tasks already completed today are fetched too: the digest ignores them, but
+    the snapshot the night run diffs against must know they were done by now.
+    """
     try:
         from src.get_notion.task_from_notion import fetch_tasks_from_notion
         return fetch_tasks_from_notion(
             date,
             config["USER_NOTION_TOKEN"],
             config["USER_DATABASE_ID"],
-            tz_offset
+            tz_offset,
+            include_completed=True
         )
     except Exception as e:
         print(f"Task fetch error: {str(e)}")
         return {}
 
 # ----- Email Processing -----
-def generate_email_content(data: Dict, config: Dict) -> str:
+def generate_shared_analysis(data: Dict, stage_models: Dict, local_time: datetime) -> str:
+    """Analyse the task buckets once for every user sharing this task database"""
+    try:
+        from src.ai_operations.ai_morning_advice import build_shared_analysis
+        return build_shared_analysis(data, stage_models, local_time)
+    except Exception as e:
+        print(f"Shared analysis error: {str(e)}")
+        return None
+
+def generate_email_content(data: Dict, config, stage_models: Dict, local_time: datetime,
+                           shared_analysis: str = None) -> str:
     """Generate email body with AI advice"""
     try:
         from src.ai_operations.ai_morning_advice import email_advice_with_ai
         return email_advice_with_ai(
             data,
-            config["GPT_VERSION"],
+            stage_models,
             config["PRESENT_LOCATION"],
             config["USER_CAREER"],
-            datetime.now(pytz.utc).astimezone(
-                pytz.FixedOffset(int(config["TIME_ZONE"]) * 60)
-        ),
-        config["SCHEDULE_PROMPT"]
+            local_time,
+            config["SCHEDULE_PROMPT"],
+            shared_analysis=shared_analysis
         )
     except Exception as e:
         print(f"AI generation error: {str(e)}")
         return "Could not generate email content"
 
-def send_digest_email(content: str, config: Dict) -> None:
-    """Send email with error handling"""
+def send_digest_email(content: str, config, deliver_at: datetime = None) -> bool:
+    """Send email with error handling; deliver_at schedules it with Mailgun. True once Mailgun accepted it"""
     try:
         from src.send_email.email_notifier import send_email
         send_email(
             body=content,
             email_receiver=config["EMAIL_RECEIVER"],
             email_title=config["EMAIL_TITLE"],
-            timeoffset=int(config["TIME_ZONE"])
+            timeoffset=config.tz_offset,
+            deliver_at=deliver_at
         )
-        print("✅ Email sent successfully")
+        print("✅ Email scheduled successfully" if deliver_at else "✅ Email sent successfully")
+        return True
     except Exception as e:
         print(f"Email sending failed: {str(e)}")
+        return False
+
+def write_schedule_to_notion(content: str, config, local_date) -> None:
+    """Mirror the recommended schedule into the user's Notion page"""
+    try:
+        from src.get_notion.schedule_writeback import write_schedule
+        write_schedule(
+            config["USER_NOTION_TOKEN"],
+            config.schedule_page,
+            f"morning:{local_date}",
+            f"☀️ {local_date} Morning Briefing",
+            content
+        )
+    except Exception as e:
+        print(f"Notion write-back failed: {str(e)}")
+
+# ----- Per-user Digest -----
+def process_user(user_id, config, utc_now: datetime, shared, history, run: str, precompute: bool = False) -> bool:
+    """Fetch, generate and send one user's digest, recording stage durations.
+
+    With precompute the digest is written for the user's next local delivery
+    time and handed to Mailgun to release then. Returns True once Mailgun
+    accepted the email.
+    """
+    from src.digest.grouping import group_key
+    from src.digest.scheduler import next_delivery
+    from src.digest.snapshot import save_morning_snapshot
+    from src.digest.stats import record_and_render
+    from src.digest.ranking import OPEN_BUCKETS, selection_key
+    from src.digest.drafts import morning_ai_data, input_fingerprint, take_draft
+    from src.ai_operations import ledger
+    from src.ai_operations.ai_morning_advice import render_without_ai
+    from src.get_notion.page_content import attach_descriptions
+    from config import (TASK_HISTORY, PROMPT_TOP_K, FETCH_TASK_BODIES, MORNING_DELIVERY_HOUR, SPECULATIVE_DRAFTS,
+                        NOTION_WRITEBACK)
+
+    print(f"\n👤 Processing user: {config['USER_NAME']}")
+
+    try:
+        # Calculate local time
+        tz_offset = config.tz_offset
+        deliver_at = next_delivery(tz_offset, MORNING_DELIVERY_HOUR, utc_now) if precompute else None
+        local_time = config.local_time(deliver_at or utc_now)
+        print(f"⏰ Local time: {local_time.strftime('%Y-%m-%d %H:%M')}" + (" (scheduled delivery)" if deliver_at else ""))
+
+        with history.stage(user_id, "fetch"):
+            # Fetch external data
+            print("\n🌤️ Fetching weather data...")
+            weather = fetch_weather_data(
+                config["PRESENT_LOCATION"],
+                tz_offset,
+                deliver_at
+            )
+
+            print("\n📋 Fetching tasks...")
+            key = group_key(config["USER_DATABASE_ID"], local_time.date(), tz_offset)
+            tasks = shared.get_or_compute(("tasks",) + key, lambda: fetch_tasks(
+                config,
+                local_time.date(),
+                tz_offset
+            ))
+            # The night run diffs against what the morning digest saw
+            if tasks and any(tasks.values()):
+                shared.get_or_compute(("snapshot",) + key, lambda: save_morning_snapshot(key, tasks))
+
+        # Prepare AI input
+        history.record_tasks(user_id, sum(len(safe_get(tasks, bucket, default=[]))
+                                          for bucket in ("today_due", "in_progress", "future")))
+        with history.stage(user_id, "prepare"):
+            # Rank locally; only the top PROMPT_TOP_K open tasks go to the model in full
+            ai_data = morning_ai_data(safe_get(weather, "today", default={}), tasks, config, local_time.date(), PROMPT_TOP_K)
+            if FETCH_TASK_BODIES:
+                attach_descriptions(config["USER_NOTION_TOKEN"], [task for bucket in OPEN_BUCKETS for task in ai_data[bucket]])
+
+            # The night run may already have written this digest from the same inputs
+            draft = None
+            if SPECULATIVE_DRAFTS:
+                draft = take_draft(user_id, local_time.date(), input_fingerprint(ai_data, config, local_time.date()))
+                print("\n♻️ Inputs unchanged since the night run, sending the stored draft" if draft
+                      else "\n🔁 No matching night draft, regenerating")
+
+        # Generate and send email
+        email_body = draft
+        if email_body is None:
+            # Over the daily token budget: a cheaper model, or no model at all
+            stage_models = ledger.budget_models(user_id, local_time.date(), config.stage_models, config.token_budget)
+            if stage_models is None:
+                email_body = render_without_ai(ai_data, local_time)
+            else:
+                print("\n💡 Generating email content...")
+                with ledger.tagged(user_id, run, local_time.date()):
+                    with history.stage(user_id, "analysis"):
+                        shared_analysis = shared.get_or_compute(
+                            ("analysis", stage_models["analysis"]) + key + selection_key(ai_data),
+                            lambda: generate_shared_analysis(ai_data, stage_models, local_time)
+                        )
+                    with history.stage(user_id, "html"):
+                        email_body = generate_email_content(ai_data, config, stage_models, local_time, shared_analysis)
+        if TASK_HISTORY:
+            # Trends come from the local history, not from the model
+            email_body += shared.get_or_compute(("history",) + key,
+                                                lambda: record_and_render(key[0], local_time.date(), tasks))
+
+        print("\n📨 Sending email...")
+        with history.stage(user_id, "send"):
+            sent = send_digest_email(email_body, config, deliver_at)
+
+        if NOTION_WRITEBACK and config.schedule_page:
+            with history.stage(user_id, "writeback"):
+                write_schedule_to_notion(email_body, config, local_time.date())
+        return sent
+
+    except Exception as e:
+        print(f"❌ Error processing user {user_id}: {str(e)}")
+        return False
 
 # ----- Main Workflow -----
 def main() -> None:
@@ -106,6 +231,10 @@ def main() -> None:
     print("🚀 Starting morning digest process")
     
     try:
+        # Record or replay all HTTP traffic when LIFESYNC_CASSETTE is set
+        from src.utils.cassette import install
+        install("morning")
+
         # Initialize core components
         utc_now = datetime.now(pytz.utc)
         print(f"UTC Time: {utc_now.isoformat()}")
@@ -116,54 +245,45 @@ def main() -> None:
         print(f"Loaded users: {list(user_data.keys())}")  # Add this line
         validate_config(user_data)
 
+        # Users pointing at the same task database on the same local date share
+        # one fetch and one analysis; only the final HTML call is per user
+        from src.digest.grouping import GroupCache
+        shared = GroupCache()
+
+        # Resolve every distinct location once and fetch weather per city, not per user
+        from src.get_weather import prefetch_weather
+        prefetch_weather(config.get("PRESENT_LOCATION") for config in user_data.values())
+
+        # Earliest local delivery time first, longest job first within a tier
+        from src.digest.scheduler import schedule, run_jobs
+        from config import DIGEST_WORKERS, MORNING_DELIVERY_HOUR, DIGEST_PRECOMPUTE
+        # Precompute: run off-peak and let Mailgun deliver at each user's local hour
+        precompute = DIGEST_PRECOMPUTE or "--precompute" in sys.argv
         for user_id, config in user_data.items():
-            if user_id == "MISSING_USER_ID":
-                print("⚠️ Skipping invalid user configuration")
-                continue
-
-            print(f"\n👤 Processing user: {config['USER_NAME']}")
-            
-            try:
-                # Calculate local time
-                tz_offset = int(config["TIME_ZONE"].strip())
-                local_time = utc_now.astimezone(
-                    pytz.FixedOffset(tz_offset * 60)
-                )
-                print(f"⏰ Local time: {local_time.strftime('%Y-%m-%d %H:%M')}")
-
-                # Fetch external data
-                print("\n🌤️ Fetching weather data...")
-                weather = fetch_weather_data(
-                    config["PRESENT_LOCATION"],
-                    tz_offset
-                )
-
-                print("\n📋 Fetching tasks...")
-                tasks = fetch_tasks(
-                    config,
-                    local_time.date(),
-                    tz_offset
-                )
-
-                # Prepare AI input
-                ai_data = {
-                    "weather": safe_get(weather, "today", default={}),
-                    "today_tasks": safe_get(tasks, "today_due", default=[]),
-                    "in_progress_tasks": safe_get(tasks, "in_progress", default=[]),
-                    "future_tasks": safe_get(tasks, "future", default=[])
-                }
-
-                # Generate and send email
-                print("\n💡 Generating email content...")
-                email_body = generate_email_content(ai_data, config)
-                
-                print("\n📨 Sending email...")
-                send_digest_email(email_body, config)
-
-            except Exception as e:
-                print(f"❌ Error processing user {user_id}: {str(e)}")
-                continue
-        
+            if not config.is_valid("morning"):
+                print(f"⚠️ Skipping invalid user configuration: {user_id}")
+        # Every LLM call is written to the ledger, tagged with this run and the user
+        from src.ai_operations.ledger import start_run
+        run = start_run("morning")
+        jobs, history = schedule(user_data, "morning", MORNING_DELIVERY_HOUR, DIGEST_WORKERS, utc_now, precompute)
+
+        # --profile: cProfile and tracemalloc around every stage, one user at a time
+        workers = DIGEST_WORKERS
+        if "--profile" in sys.argv:
+            from src.utils.profiling import Profiler
+            history.profiler = Profiler(run)
+            workers = 1
+
+        run_jobs(jobs, workers,
+                 lambda job: process_user(job.user_id, user_data[job.user_id], utc_now, shared, history, run, precompute))
+        history.save()
+        if history.profiler:
+            history.profiler.report()
+
+        from src.ai_operations.ai_client import print_usage_summary
+        print_usage_summary()
+        print(f"Shared fetch/analysis cache: {shared.hits} reused, {shared.misses} computed")
+
         print(f"Loaded {len(user_data)} user configurations")
         print("User IDs:", user_data.keys())
         print("\n🎉 Morning digest process completed successfully")
@@ -1,13 +1,29 @@
-import re 
+import sys
 import pytz
 from datetime import datetime
 from src.send_email.format_email import format_email
 from src.get_notion.task_from_notion import fetch_tasks_from_notion
 from src.send_email.email_notifier import send_email
-from src.ai_operations.ai_night_advice import email_advice_with_ai
-from src.get_weather import get_weather_forecast
-from src.get_env.env_from_notion import get_user_env_vars
+from src.ai_operations.ai_night_advice import email_advice_with_ai, build_shared_analysis, render_without_ai
+from src.ai_operations import ai_morning_advice, ledger
+from src.ai_operations.ai_client import print_usage_summary
+from src.get_weather import get_weather_forecast, prefetch_weather
+from src.get_env.user_config import load_user_configs
 from src.get_notion.event_from_notion import fetch_event_from_notion
+from src.digest.grouping import GroupCache, group_key
+from src.digest.fetching import fetch_concurrently
+from src.digest.scheduler import schedule, run_jobs, next_delivery, same_day_delivery
+from src.digest.snapshot import load_morning_snapshot, diff_tasks
+from src.digest.stats import record_and_render
+from src.digest.ranking import OPEN_BUCKETS, keywords, select_top_k, selection_key
+from src.digest.drafts import morning_ai_data, input_fingerprint, save_draft
+from src.get_notion.page_content import attach_descriptions
+from src.get_notion.schedule_writeback import write_schedule
+from src.utils import cassette
+from src.utils.profiling import Profiler
+from config import (DIGEST_WORKERS, NIGHT_DELIVERY_HOUR, NIGHT_TASK_DIFF, TASK_HISTORY, PROMPT_TOP_K,
+                    FETCH_TASK_BODIES, DIGEST_PRECOMPUTE, MORNING_DELIVERY_HOUR, SPECULATIVE_DRAFTS,
+                    NOTION_WRITEBACK, NIGHT_SECTION_PARALLEL)
 
 def safe_get(dictionary, *keys, default=None):
     """Safely retrieve nested dictionary values."""
@@ -18,10 +34,6 @@ def safe_get(dictionary, *keys, default=None):
             return default
     return dictionary
 
-# Get current UTC time
-utc_now = datetime.now(pytz.utc)
-user_data = get_user_env_vars()
-
 def validate_user_config(user_data):
     """Ensure at least one valid user configuration exists"""
     valid_users = [uid for uid in user_data if uid != "MISSING_USER_ID"]
@@ -29,79 +41,56 @@ def validate_user_config(user_data):
     if not valid_users:
         raise SystemExit("⛔ CRITICAL ERROR: No valid user configurations found. "
                          "Check Notion database for USER_ID and TIME_ZONE values.")
-validate_user_config(user_data)
 
-for user_id in user_data:
-    if user_id == "MISSING_USER_ID":
-        print(f"⛔ Configuration Error - Fix these issues:")
-        print(f"1. Ensure USER_ID is a 'Title' property in Notion")
-        print(f"2. Verify TIME_ZONE is set (e.g., '-4')")
-        print(f"3. Check integration has database access")
-        raise SystemExit("Critical configuration error - see details above")
 
+def process_user(user_id, user_info, utc_now, shared, history, run, precompute=False):
+    """Fetch, generate and send one user's night digest, recording stage durations.
+
+    shared is the run's GroupCache, history its DurationHistory and run the ledger run id.
+    Returns True once Mailgun accepted the email.
+    """
     try:
-        # Extract user properties with safety checks
-        user_info = user_data[user_id]
-        required_keys = [
-            "USER_NOTION_TOKEN", "USER_DATABASE_ID", "USER_EVENT_DATABASE_ID",
-            "GPT_VERSION", "PRESENT_LOCATION", "USER_NAME", "USER_CAREER",
-            "SCHEDULE_PROMPT", "TIME_ZONE", "EMAIL_RECEIVER", "EMAIL_TITLE"
-        ]
-        
-        # Validate required keys
-        for key in required_keys:
-            if key not in user_info:
-                raise ValueError(f"Missing required key: {key}")
-
-        # Process time zone
-        time_zone_str = user_info["TIME_ZONE"].strip()
-        if not re.match(r"^[+-]?\d+$", time_zone_str):
-            print(f"⚠️ Invalid TIME_ZONE '{time_zone_str}' for {user_id}. Using UTC.")
-            time_zone_offset = 0
-        else:
-            time_zone_offset = int(time_zone_str)
-
-        # Convert to local time
-        tz_str = f'Etc/GMT{"+" if time_zone_offset < 0 else "-"}{abs(time_zone_offset)}'
-        local_time = utc_now.astimezone(pytz.timezone(tz_str))
+        # Typed config: TIME_ZONE, stage models and validation errors were parsed once on load
+        for warning in user_info.warnings:
+            print(f"⚠️ {user_id}: {warning}")
+
+        time_zone_offset = user_info.tz_offset
+        # In precompute mode the digest is written for, and released at, tonight's local night hour;
+        # past it, today's digest is sent now rather than written for a day that has not started
+        deliver_at = same_day_delivery(time_zone_offset, NIGHT_DELIVERY_HOUR, utc_now) if precompute else None
+        if precompute and deliver_at is None:
+            print(f"⏩ {user_id}: tonight's delivery hour has passed, sending now")
+        local_time = user_info.local_time(deliver_at or utc_now)
         custom_date = local_time.date()
         print(f"\nProcessing {user_id} ({user_info['USER_NAME']})")
-        print(f"Local time: {local_time}")
-
-        # Fetch data with error handling
-        try:
-            tasks = fetch_tasks_from_notion(
-                custom_date,
-                user_info["USER_NOTION_TOKEN"],
-                user_info["USER_DATABASE_ID"],
-                time_zone_offset,
-                include_completed=True
-            )
-        except Exception as e:
-            print(f"❌ Failed to fetch tasks: {str(e)}")
-            tasks = {}
+        print(f"Local time: {local_time}" + (" (scheduled delivery)" if deliver_at else ""))
 
-        try:
-            events = fetch_event_from_notion(
-                custom_date,
-                user_info["USER_NOTION_TOKEN"],
-                user_info["USER_EVENT_DATABASE_ID"],
-                time_zone_offset,
-                include_completed=True
-            )
-        except Exception as e:
-            print(f"❌ Failed to fetch events: {str(e)}")
-            events = {}
-
-        # Get weather data safely
-        try:
-            forecast_data = get_weather_forecast(
-                user_info["PRESENT_LOCATION"],
-                time_zone_offset
-            )
-        except Exception as e:
-            print(f"❌ Weather API error: {str(e)}")
-            forecast_data = {}
+        # Fetch tasks, events and weather concurrently; each falls back to {} on error
+        task_key = group_key(user_info["USER_DATABASE_ID"], custom_date, time_zone_offset)
+        event_key = group_key(user_info["USER_EVENT_DATABASE_ID"], custom_date, time_zone_offset)
+        with history.stage(user_id, "fetch"):
+            fetched = fetch_concurrently({
+                "tasks": lambda: shared.get_or_compute(("tasks",) + task_key, lambda: fetch_tasks_from_notion(
+                    custom_date,
+                    user_info["USER_NOTION_TOKEN"],
+                    user_info["USER_DATABASE_ID"],
+                    time_zone_offset,
+                    include_completed=True
+                )),
+                "events": lambda: shared.get_or_compute(("events",) + event_key, lambda: fetch_event_from_notion(
+                    custom_date,
+                    user_info["USER_NOTION_TOKEN"],
+                    user_info["USER_EVENT_DATABASE_ID"],
+                    time_zone_offset,
+                    include_completed=True
+                )),
+                "weather": lambda: get_weather_forecast(
+                    user_info["PRESENT_LOCATION"],
+                    time_zone_offset,
+                    deliver_at
+                ),
+            })
+        tasks, events, forecast_data = fetched["tasks"], fetched["events"], fetched["weather"]
 
         # Prepare data with fallback values
         data = {
@@ -116,37 +105,76 @@ for user_id in user_data:
             "completed_events": safe_get(events, "completed", default=[])
         }
 
-        # Generate AI advice
+        with history.stage(user_id, "prepare"):
+            # Only the changes since the morning digest go into the prompt when its snapshot exists
+            morning = load_morning_snapshot(task_key) if NIGHT_TASK_DIFF and tasks else None
+            if morning is not None:
+                data["task_diff"] = diff_tasks(morning, tasks)
+                print(data["task_diff"].summary())
+
+            history.record_tasks(user_id, sum(len(data[k]) for k in ("today_tasks", "in_progress_tasks", "future_tasks")))
+            # Rank locally; only the top PROMPT_TOP_K open tasks go to the model in full
+            data = select_top_k(data, PROMPT_TOP_K, custom_date,
+                                keywords(user_info["SCHEDULE_PROMPT"], user_info["USER_CAREER"]))
+            if FETCH_TASK_BODIES:
+                attach_descriptions(user_info["USER_NOTION_TOKEN"], [task for bucket in OPEN_BUCKETS for task in data[bucket]])
+
+        # Generate AI advice; over the daily token budget a cheaper model is used, or none at all
         try:
-            advice = email_advice_with_ai(
-                data,
-                user_info["GPT_VERSION"],
-                user_info["PRESENT_LOCATION"],
-                user_info["USER_CAREER"],
-                local_time,
-                user_info["SCHEDULE_PROMPT"]
-            )
-            print("AI Advice generated successfully")
+            stage_models = ledger.budget_models(user_id, custom_date, user_info.stage_models, user_info.token_budget)
+            if stage_models is None:
+                advice = render_without_ai(data)
+            else:
+                with ledger.tagged(user_id, run, custom_date):
+                    # Section-parallel generation builds its own prompts and would discard the analysis
+                    shared_analysis = None
+                    if not NIGHT_SECTION_PARALLEL:
+                        with history.stage(user_id, "analysis"):
+                            shared_analysis = shared.get_or_compute(
+                                ("analysis", stage_models["analysis"]) + task_key + event_key + selection_key(data),
+                                lambda: build_shared_analysis(data, stage_models, local_time)
+                            )
+                    with history.stage(user_id, "html"):
+                        advice = email_advice_with_ai(
+                            data,
+                            stage_models,
+                            user_info["PRESENT_LOCATION"],
+                            user_info["USER_CAREER"],
+                            local_time,
+                            user_info["SCHEDULE_PROMPT"],
+                            shared_analysis=shared_analysis
+                        )
+                print("AI Advice generated successfully")
         except Exception as e:
             print(f"❌ AI advice generation failed: {str(e)}")
             advice = "No advice generated due to system error"
 
+        if TASK_HISTORY:
+            # Trends come from the local history, not from the model
+            advice += shared.get_or_compute(("history",) + task_key,
+                                            lambda: record_and_render(task_key[0], custom_date, tasks))
+
         # Prepare and send email
-        email_body = format_email(
-            advice,
-            user_info["USER_NAME"],
-            "日程晚报",
-            "night"
-        )
+        with history.stage(user_id, "format"):
+            email_body = format_email(
+                advice,
+                user_info["USER_NAME"],
+                "日程晚报",
+                "night"
+            )
         
         # In your email sending section
+        sent = False
         try:
-            send_email(
-                body=email_body,
-                email_receiver=user_data[user_id]["EMAIL_RECEIVER"],
-                email_title=user_data[user_id]["EMAIL_TITLE"],
-                timeoffset=time_zone_offset
-            )
+            with history.stage(user_id, "send"):
+                send_email(
+                    body=email_body,
+                    email_receiver=user_info["EMAIL_RECEIVER"],
+                    email_title=user_info["EMAIL_TITLE"],
+                    timeoffset=time_zone_offset,
+                    deliver_at=deliver_at
+                )
+            sent = True
         except KeyError as e:
             print(f"⚠️ Missing email configuration for user {user_id}: {str(e)}")
         except ValueError as e:
@@ -154,8 +182,130 @@ for user_id in user_data:
         except Exception as e:
             print(f"🔥 Unexpected error sending email: {str(e)}")
 
+        # Mirror tonight's timeline into the user's Notion page
+        if NOTION_WRITEBACK and user_info.schedule_page:
+            try:
+                with history.stage(user_id, "writeback"):
+                    write_schedule(user_info["USER_NOTION_TOKEN"], user_info.schedule_page,
+                                   f"night:{custom_date}", f"🌙 {custom_date} 日程晚报", advice)
+            except Exception as e:
+                print(f"⚠️ Notion write-back failed for {user_id}: {str(e)}")
+
+        # Tonight's email is out; use the warm data to write tomorrow morning's digest ahead of time
+        if SPECULATIVE_DRAFTS and user_info.is_valid("morning"):
+            with history.stage(user_id, "draft"):
+                write_morning_draft(user_id, user_info, deliver_at or utc_now, shared, run)
+        return sent
+
     except Exception as e:
         print(f"🔥 Critical error processing {user_id}: {str(e)}")
-        continue
+        return False
+
+
+def write_morning_draft(user_id, user_info, after, shared, run):
+    """Generate the next morning digest now and store it with a fingerprint of its inputs.
+
+    The morning run sends it without a model call when its freshly fetched
+    inputs give the same fingerprint, and regenerates otherwise.
+    """
+    try:
+        time_zone_offset = user_info.tz_offset
+        morning_at = next_delivery(time_zone_offset, MORNING_DELIVERY_HOUR, after)
+        morning_time = user_info.local_time(morning_at)
+        morning_date = morning_time.date()
+
+        task_key = group_key(user_info["USER_DATABASE_ID"], morning_date, time_zone_offset)
+        tasks = shared.get_or_compute(("morning_tasks",) + task_key, lambda: fetch_tasks_from_notion(
+            morning_date,
+            user_info["USER_NOTION_TOKEN"],
+            user_info["USER_DATABASE_ID"],
+            time_zone_offset
+        ))
+        # The forecast is already cached from tonight's fetch
+        weather = get_weather_forecast(user_info["PRESENT_LOCATION"], time_zone_offset, morning_at)
+        data = morning_ai_data(safe_get(weather, "today", default={}), tasks, user_info, morning_date, PROMPT_TOP_K)
+        if FETCH_TASK_BODIES:
+            attach_descriptions(user_info["USER_NOTION_TOKEN"], [task for bucket in OPEN_BUCKETS for task in data[bucket]])
+
+        # Draft tokens count against the morning's day; a spent budget leaves the morning to render without AI
+        stage_models = ledger.budget_models(user_id, morning_date, user_info.stage_models, user_info.token_budget)
+        if stage_models is None:
+            return
+        with ledger.tagged(user_id, run, morning_date):
+            shared_analysis = shared.get_or_compute(
+                ("morning_analysis", stage_models["analysis"]) + task_key + selection_key(data),
+                lambda: ai_morning_advice.build_shared_analysis(data, stage_models, morning_time)
+            )
+            body = ai_morning_advice.email_advice_with_ai(
+                data,
+                stage_models,
+                user_info["PRESENT_LOCATION"],
+                user_info["USER_CAREER"],
+                morning_time,
+                user_info["SCHEDULE_PROMPT"],
+                shared_analysis=shared_analysis
+            )
+        if body.startswith("Could not generate"):
+            print(f"⚠️ Morning draft for {user_id} not stored: generation failed")
+            return
+        save_draft(user_id, morning_date, input_fingerprint(data, user_info, morning_date), body)
+        print(f"📝 Morning draft for {user_id} stored for {morning_time.strftime('%Y-%m-%d %H:%M')}")
+    except Exception as e:
+        print(f"⚠️ Morning draft for {user_id} failed: {str(e)}")
+
+
+def main():
+    # Record or replay all HTTP traffic when LIFESYNC_CASSETTE is set
+    cassette.install("night")
+
+    # Get current UTC time
+    utc_now = datetime.now(pytz.utc)
+    user_data = load_user_configs()
+    # Precompute: run off-peak and let Mailgun deliver at each user's local night hour
+    precompute = DIGEST_PRECOMPUTE or "--precompute" in sys.argv
+    validate_user_config(user_data)
+
+    # Users pointing at the same databases on the same local date share one fetch
+    # and one analysis; only the final HTML call is per user
+    shared = GroupCache()
+
+    # Resolve every distinct location once and fetch weather per city, not per user
+    prefetch_weather(info.get("PRESENT_LOCATION") for info in user_data.values())
+
+    if "MISSING_USER_ID" in user_data:
+        print(f"⛔ Configuration Error - Fix these issues:")
+        print(f"1. Ensure USER_ID is a 'Title' property in Notion")
+        print(f"2. Verify TIME_ZONE is set (e.g., '-4')")
+        print(f"3. Check integration has database access")
+        raise SystemExit("Critical configuration error - see details above")
+
+    # Validation errors were precomputed on load; invalid users are left out of the schedule
+    for user_id, user_info in user_data.items():
+        if user_info.errors["night"]:
+            print(f"🔥 Critical error processing {user_id}: {'; '.join(user_info.errors['night'])}")
+
+    # Every LLM call is written to the ledger, tagged with this run and the user
+    run = ledger.start_run("night")
+
+    # Earliest local delivery time first, longest job first within a tier
+    jobs, history = schedule(user_data, "night", NIGHT_DELIVERY_HOUR, DIGEST_WORKERS, utc_now, precompute)
+
+    # --profile: cProfile and tracemalloc around every stage, one user at a time
+    workers = DIGEST_WORKERS
+    if "--profile" in sys.argv:
+        history.profiler = Profiler(run)
+        workers = 1
+
+    run_jobs(jobs, workers,
+             lambda job: process_user(job.user_id, user_data[job.user_id], utc_now, shared, history, run, precompute))
+    history.save()
+    if history.profiler:
+        history.profiler.report()
+
+    print_usage_summary()
+    print(f"Shared fetch/analysis cache: {shared.hits} reused, {shared.misses} computed")
+    print("\nNightly email processing completed")
+
 
-print("\nNightly email processing completed")
+if __name__ == "__main__":
+    main()
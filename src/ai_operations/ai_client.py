@@ -0,0 +1,242 @@
+import re
+import threading
+import time
+import openai  # 用于GPT模型
+from zhipuai import ZhipuAI  # 导入ZhipuAI以使用GLM模型
+from config import AI_API_KEY, AI_STREAMING, STAGE_MAX_TOKENS  # 导入API密钥
+from src.ai_operations import ledger
+
+# Token usage of every call made in this process, used to report the prompt-cache hit rate
+USAGE_LOG = []
+_usage_lock = threading.Lock()
+
+
+def _field(obj, *keys, default=0):
+    """Read a nested usage field from either a dict-like (openai) or attribute (zhipuai) response."""
+    for key in keys:
+        if obj is None:
+            return default
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        else:
+            obj = getattr(obj, key, None)
+    return obj if obj is not None else default
+
+
+def record_usage(ai_version, response, stage=None, latency=None, ttft=None, streamed_tokens=None, stopped_early=False,
+                 prompt_text=None, completion_text=None):
+    """Store prompt, completion and cached token counts from a provider response.
+
+    For streamed calls response is the final usage chunk (or None when the stream
+    was cut short), and streamed_tokens is the number of content chunks received.
+    Without usage the counts are estimated from prompt_text and completion_text
+    and the entry is marked "estimated".
+    """
+    usage = _field(response, "usage", default=None)
+    entry = {
+        "model": ai_version,
+        "stage": stage,
+        "latency": latency,
+        "ttft": ttft,
+        "stopped_early": stopped_early,
+        "prompt_tokens": _field(usage, "prompt_tokens"),
+        "completion_tokens": _field(usage, "completion_tokens") or (streamed_tokens or 0),
+        "cached_tokens": _field(usage, "prompt_tokens_details", "cached_tokens"),
+        "estimated": False,
+    }
+    if usage is None and prompt_text is not None:
+        # No cache information either, so the whole prompt is priced as uncached
+        entry["prompt_tokens"] = estimate_tokens(prompt_text)
+        entry["completion_tokens"] = max(entry["completion_tokens"], estimate_tokens(completion_text))
+        entry["estimated"] = True
+    with _usage_lock:
+        USAGE_LOG.append(entry)
+    # Persist with the user/run tags of the calling digest
+    ledger.record(entry)
+    return entry
+
+
+def usage_summary():
+    """Aggregate the recorded usage into totals and a prompt-cache hit rate."""
+    with _usage_lock:
+        entries = list(USAGE_LOG)
+    prompt_tokens = sum(e["prompt_tokens"] for e in entries)
+    cached_tokens = sum(e["cached_tokens"] for e in entries)
+    ttfts = [e["ttft"] for e in entries if e["ttft"] is not None]
+    return {
+        "calls": len(entries),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(e["completion_tokens"] for e in entries),
+        "cached_tokens": cached_tokens,
+        "cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        "avg_ttft": sum(ttfts) / len(ttfts) if ttfts else 0.0,
+        "stopped_early": sum(1 for e in entries if e["stopped_early"]),
+        "estimated": sum(1 for e in entries if e.get("estimated")),
+    }
+
+
+def print_usage_summary():
+    summary = usage_summary()
+    print(f"\n📊 LLM calls: {summary['calls']}, prompt tokens: {summary['prompt_tokens']} "
+          f"(cached: {summary['cached_tokens']}, hit rate: {summary['cache_hit_rate']:.1%}), "
+          f"completion tokens: {summary['completion_tokens']}, avg time to first token: {summary['avg_ttft']:.2f}s, "
+          f"stopped early: {summary['stopped_early']} (token counts estimated: {summary['estimated']})")
+
+
+class _HtmlClosed:
+    """Stop condition for html_closed(); scans each streamed character once.
+
+    It is called with the whole text so far, but only looks at what arrived
+    since the previous call (plus a few characters, in case a tag was split
+    across chunks).
+    """
+    TAG = re.compile(r"<div(?=[\s>/])|</div>")
+    SPLIT_TAG = len("</div>") - 1
+
+    def __init__(self, expected_blocks):
+        self.expected_blocks = expected_blocks
+        self._reset()
+
+    def _reset(self):
+        self.pos = self.depth = self.closed = 0
+
+    def __call__(self, text):
+        if len(text) < self.pos:
+            self._reset()  # reused for a new stream
+        last = self.pos
+        for tag in self.TAG.finditer(text, self.pos):
+            last = tag.end()
+            if tag.group() != "</div>":
+                self.depth += 1
+            elif self.depth:  # closing tags before the first <div> are ignored
+                self.depth -= 1
+                if self.depth == 0:
+                    self.closed += 1
+                    if self.closed >= self.expected_blocks:
+                        self.pos = last
+                        return last
+        self.pos = max(last, len(text) - self.SPLIT_TAG)
+        return False
+
+
+def html_closed(expected_blocks=1):
+    """Build a stop condition that fires once the first expected_blocks top-level <div> blocks are closed.
+
+    The condition returns the offset just past the final closing tag, so the
+    caller can drop whatever the model streamed after it.
+    """
+    return _HtmlClosed(expected_blocks)
+
+
+# Rough tokens per character when a stream ends without its usage chunk: CJK
+# characters are about one token each, other text about four characters per token
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    text = text or ""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+_zhipu = None
+
+
+def _zhipu_client():
+    """One ZhipuAI client per process; its HTTP connections are reused across calls."""
+    global _zhipu
+    with _usage_lock:
+        if _zhipu is None:
+            _zhipu = ZhipuAI(api_key=AI_API_KEY)
+        return _zhipu
+
+
+def _create(ai_version, messages, temperature, max_tokens, stream):
+    kwargs = {"model": ai_version, "messages": messages, "temperature": temperature}
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    if stream:
+        kwargs["stream"] = True
+
+    if "gpt" in ai_version.lower():
+        openai.api_key = AI_API_KEY
+        if stream:
+            # Ask for a trailing usage chunk so streamed calls still report token counts
+            kwargs["stream_options"] = {"include_usage": True}
+        return openai.ChatCompletion.create(**kwargs)
+    elif "glm" in ai_version.lower():
+        return _zhipu_client().chat.completions.create(**kwargs)
+    raise ValueError(f"Unsupported AI version: {ai_version}")
+
+
+def _consume_stream(response, started, stop_when):
+    """Read a streamed completion chunk by chunk; stop as soon as stop_when(text) is satisfied.
+
+    stop_when is only consulted on chunks that may close a tag.
+    """
+    text = ""
+    ttft = None
+    content_chunks = 0
+    usage_chunk = None
+    stopped_early = False
+    for chunk in response:
+        if _field(chunk, "usage", default=None):
+            usage_chunk = chunk
+        choices = _field(chunk, "choices", default=None) or []
+        if not choices:
+            continue
+        content = _field(choices[0], "delta", "content", default="")
+        if not content:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        text += content
+        content_chunks += 1
+        if stop_when and ">" in content:
+            end = stop_when(text)
+            if end:
+                stopped_early = True
+                if not isinstance(end, bool):
+                    text = text[:end]
+                break
+    if stopped_early and hasattr(response, "close"):
+        response.close()
+    return text, usage_chunk, ttft, content_chunks, stopped_early
+
+
+def chat_completion(system_content, prompt, ai_version, temperature=0.3, stage=None,
+                    max_tokens=None, stream=None, stop_when=None):
+    """Send one system/user exchange to the configured model and return the raw text.
+
+    Keep system_content and the start of prompt identical across calls so the
+    provider's automatic prefix cache can reuse them; put per-user data last.
+
+    max_tokens defaults to the stage's cap from STAGE_MAX_TOKENS. With streaming
+    (AI_STREAMING, or stream=True) tokens are consumed as they arrive, and
+    stop_when(text) can end the generation early, e.g. html_closed().
+    """
+    messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": prompt}
+    ]
+    if max_tokens is None:
+        max_tokens = STAGE_MAX_TOKENS.get(stage)
+    if stream is None:
+        stream = AI_STREAMING
+
+    started = time.perf_counter()
+    response = _create(ai_version, messages, temperature, max_tokens, stream)
+
+    if stream:
+        text, usage_chunk, ttft, content_chunks, stopped_early = _consume_stream(response, started, stop_when)
+        record_usage(ai_version, usage_chunk, stage=stage, latency=time.perf_counter() - started,
+                     ttft=ttft, streamed_tokens=content_chunks, stopped_early=stopped_early,
+                     prompt_text=system_content + prompt, completion_text=text)
+        return text.strip()
+
+    latency = time.perf_counter() - started
+    # Without streaming the first token is only visible once the whole completion arrives
+    record_usage(ai_version, response, stage=stage, latency=latency, ttft=latency)
+    if not response.choices:
+        return ""
+    return response.choices[0].message.content.strip()
@@ -1,142 +1,193 @@
-import openai
-from zhipuai import ZhipuAI
-from config import AI_API_KEY
 from src.ai_operations.ai_iterator import iterator
+from src.ai_operations.ai_client import chat_completion, html_closed
+from src.ai_operations.model_router import stage_model
+from src.get_notion.models import format_items
+from src.digest.ranking import omitted_summary
 import re
 
-def email_advice_with_ai(data, ai_version, present_location, user_career, local_time, schedule_prompt=""):
-    print("\nGenerating morning advice...")
-    try:
-        # ========== Weather Data Handling ==========
-        # Safely extract weather information with defaults
-        weather_info = data.get('weather', {})
-        weather_str = (
-            f"Temperature: {weather_info.get('temp', 'N/A')}°C\n"
-            f"Conditions: {weather_info.get('description', 'No data')}\n"
-            f"Humidity: {weather_info.get('humidity', 'N/A')}%\n"
-            f"Wind Speed: {weather_info.get('wind_speed', 'N/A')} m/s"
-        )
-
-        # ========== Task Data Handling ==========
-        def get_task_details(task_list):
-            return "\n".join([f"- {task.get('Name', 'Unnamed Task')} "
-                            f"(Priority: {task.get('Priority', 'N/A')}, "
-                            f"Days Left: {task.get('RemainingDays', 'N/A')}, "
-                            f"ETA: {'✅' if task.get('ETA') else '⚠️'})" 
-                            for task in task_list])
-
-        # ========== Construct Prompts ==========
-        prompt_info = f"""
-        1. Core Information:
-        - Location: {present_location}
-        - Local Time: {local_time.strftime('%Y-%m-%d %H:%M')}
-        - User Profession: {user_career}
-        - Schedule Preferences: {schedule_prompt}
-
-        2. Weather Conditions:
-        {weather_str}
-
-        3. Tasks:
-        * Urgent (Today's Deadline):
-        {get_task_details(data.get('today_tasks', []))}
-
-        * In Progress:
-        {get_task_details(data.get('in_progress_tasks', []))}
-
-        * Future Tasks:
-        {get_task_details(data.get('future_tasks', []))}
-        """
+# ========== Static Prompt Prefix ==========
+# Everything below is identical for every user and every run. It goes first in
+# each request so the provider's prompt-prefix cache can reuse it; per-user
+# data is appended after it.
+SYSTEM_PROMPT = """You are a professional scheduling assistant. Generate morning briefings that:
+        - Prioritize tasks based on urgency and importance
+        - Consider weather impacts on outdoor activities
+        - Align with the user's professional context
+        - Highlight time-sensitive commitments
+        Output clean HTML without markdown formatting."""
 
-        analysis_prompt = f"""
-        Analyze this schedule considering:
+ANALYSIS_INSTRUCTIONS = """
+        Analyze the task list given after the instructions, considering:
         1. Task priority levels (High/Medium/Low)
         2. Remaining days until deadlines
         3. ETA status indicators
-        4. Current weather conditions
-        5. User's professional context: {user_career}
-        
+
         Provide:
         - Time-sensitive priority ranking
-        - Weather-impacted activity recommendations
         - ETA risk assessment for urgent tasks
         """
 
-        ai_analysis = iterator(analysis_prompt, ai_version)
+HTML_SKELETON = """
+        Fill in the following HTML structure using the schedule data and analysis given after it.
+        Replace every [placeholder]; repeat the <li> block once per urgent task (today's deadline),
+        and leave the list empty if there are none. Personalise the recommended schedule for the
+        user's profession and schedule preferences, and add weather-impacted activity recommendations.
 
-        # ========== HTML Template ==========
-        html_template = f"""
         <div class="morning-brief">
-            <h1>Morning Briefing - {local_time.strftime('%A, %B %d')}</h1>
-            
+            <h1>Morning Briefing - [Weekday, Month Day of the local time]</h1>
+
             <div class="weather-section">
                 <h2>🌤️ Current Weather</h2>
-                <p>Temperature: {weather_info.get('temp', 'N/A')}°C</p>
-                <p>Conditions: {weather_info.get('description', 'No data')}</p>
-                <p>Humidity: {weather_info.get('humidity', 'N/A')}%</p>
-                <p>Wind: {weather_info.get('wind_speed', 'N/A')} m/s</p>
+                <p>Temperature: [temperature]°C</p>
+                <p>Conditions: [conditions]</p>
+                <p>Humidity: [humidity]%</p>
+                <p>Wind: [wind speed] m/s</p>
             </div>
 
             <div class="task-priorities">
                 <h2>🔝 Priority Tasks</h2>
                 <ul>
-                    {"".join([f'''
-                    <li class="priority-{task.get('Priority', 'medium').lower()}">
-                        <h3>{task.get('Name', 'Unnamed Task')}</h3>
+                    <li class="priority-[high|medium|low]">
+                        <h3>[Task name]</h3>
                         <div class="task-meta">
-                            <span class="eta">{'✅ On Track' if task.get('ETA') else '⚠️ Needs Attention'}</span>
-                            <span class="days-remaining">{task.get('RemainingDays', 'N/A')} days remaining</span>
+                            <span class="eta">[✅ On Track if ETA is set, otherwise ⚠️ Needs Attention]</span>
+                            <span class="days-remaining">[Days left] days remaining</span>
                         </div>
-                        {f'<p class="task-desc">{task.get("Description", "")}</p>' if task.get("Description") else ''}
+                        <p class="task-desc">[Description; omit this paragraph when there is none]</p>
                     </li>
-                    ''' for task in data.get('today_tasks', [])])}
                 </ul>
             </div>
 
             <div class="schedule-recommendations">
                 <h2>⏳ Recommended Schedule</h2>
                 <div class="ai-analysis">
-                    {ai_analysis}
+                    [Recommended schedule built from the analysis]
                 </div>
             </div>
         </div>
         """
 
-        # ========== AI Configuration ==========
-        system_prompt = """You are a professional scheduling assistant. Generate morning briefings that:
-        - Prioritize tasks based on urgency and importance
-        - Consider weather impacts on outdoor activities
-        - Align with the user's professional context
-        - Highlight time-sensitive commitments
-        Output clean HTML without markdown formatting."""
 
-        # ========== API Handling ==========
-        if "gpt" in ai_version.lower():
-            response = openai.ChatCompletion.create(
-                model=ai_version,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": html_template}
-                ],
-                temperature=0.3
-            )
-            content = response.choices[0].message.content
-        elif "glm" in ai_version.lower():
-            client = ZhipuAI(AI_API_KEY)
-            response = client.chat.completions.create(
-                model=ai_version,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": html_template}
-                ],
-                temperature=0.3
+def _task_info(data, local_time):
+    """The user-independent part of the prompt: the date and the task buckets."""
+    return f"""
+        Date: {local_time.strftime('%Y-%m-%d')} ({local_time.strftime('%A, %B %d')})
+
+        Tasks:
+        * Urgent (Today's Deadline):
+        {format_items(data.get('today_tasks', []), empty='None')}
+
+        * In Progress:
+        {format_items(data.get('in_progress_tasks', []), empty='None')}
+
+        * Future Tasks:
+        {format_items(data.get('future_tasks', []), empty='None')}
+        {_omitted_line(data)}"""
+
+
+OMITTED_LABELS = {"today_tasks": "Urgent", "in_progress_tasks": "In Progress", "future_tasks": "Future"}
+
+
+def _omitted_line(data):
+    """Counts of the lower-ranked tasks left out of the lists above, if any."""
+    summary = omitted_summary(data, OMITTED_LABELS)
+    return f"* Not listed (lower-ranked, counts only): {summary}" if summary else ""
+
+
+def render_without_ai(data, local_time):
+    """The briefing filled in locally from the task data, for users whose daily token budget is spent."""
+    weather = data.get('weather', {})
+    urgent = "".join(task.to_html() for task in data.get('today_tasks', []))
+    later = "".join(task.to_html() for bucket in ('in_progress_tasks', 'future_tasks') for task in data.get(bucket, []))
+    omitted = omitted_summary(data, OMITTED_LABELS)
+    return f"""<div class="morning-brief">
+            <h1>Morning Briefing - {local_time.strftime('%A, %B %d')}</h1>
+
+            <div class="weather-section">
+                <h2>🌤️ Current Weather</h2>
+                <p>Temperature: {weather.get('temp', 'N/A')}°C</p>
+                <p>Conditions: {weather.get('description', 'No data')}</p>
+                <p>Humidity: {weather.get('humidity', 'N/A')}%</p>
+                <p>Wind: {weather.get('wind_speed', 'N/A')} m/s</p>
+            </div>
+
+            <div class="task-priorities">
+                <h2>🔝 Priority Tasks</h2>
+                <ul>{urgent}</ul>
+            </div>
+
+            <div class="schedule-recommendations">
+                <h2>⏳ In Progress and Upcoming</h2>
+                <ul>{later}</ul>
+                {f"<p>Not listed: {omitted}</p>" if omitted else ""}
+                <p>Today's AI usage budget is spent, so this briefing lists your tasks without recommendations.</p>
+            </div>
+        </div>"""
+
+
+def build_shared_analysis(data, ai_version, local_time):
+    """Analyse the task buckets only, so users sharing a task database can reuse the result."""
+    return iterator(ANALYSIS_INSTRUCTIONS + _task_info(data, local_time), stage_model(ai_version, "analysis"))
+
+
+def email_advice_with_ai(data, ai_version, present_location, user_career, local_time, schedule_prompt="", shared_analysis=None):
+    """ai_version is one model name, or a stage->model mapping from model_router.resolve_stage_models.
+
+    shared_analysis is the output of build_shared_analysis when it was already
+    computed for another user on the same task database and date.
+    """
+    print("\nGenerating morning advice...")
+    try:
+        # ========== Weather Data Handling ==========
+        # Safely extract weather information with defaults
+        weather_info = data.get('weather', {})
+        weather_str = (
+            f"Temperature: {weather_info.get('temp', 'N/A')}°C\n"
+            f"Conditions: {weather_info.get('description', 'No data')}\n"
+            f"Humidity: {weather_info.get('humidity', 'N/A')}%\n"
+            f"Wind Speed: {weather_info.get('wind_speed', 'N/A')} m/s"
+        )
+        if 'temp_min' in weather_info:
+            # Daily aggregates from the forecast endpoint
+            weather_str += (
+                f"\nToday's Range: {weather_info['temp_min']}~{weather_info['temp_max']}°C\n"
+                f"Rain Probability: {weather_info.get('rain_probability', 0):.0%}\n"
+                f"Wind Peak: {weather_info.get('wind_peak', 'N/A')} m/s"
             )
-            content = response.choices[0].message.content
-        else:
-            raise ValueError(f"Unsupported AI version: {ai_version}")
+
+        # ========== Dynamic Prompt Suffix ==========
+        # Ordered from most to least stable so consecutive runs share as much prefix as possible
+        prompt_info = f"""
+        1. Core Information:
+        - User Profession: {user_career}
+        - Schedule Preferences: {schedule_prompt}
+        - Location: {present_location}
+        - Local Time: {local_time.strftime('%Y-%m-%d %H:%M')}
+
+        2. Weather Conditions:
+        {weather_str}
+
+        3. Schedule:
+        {_task_info(data, local_time)}
+        """
+
+        if shared_analysis is None:
+            shared_analysis = build_shared_analysis(data, ai_version, local_time)
+
+        html_prompt = f"""{HTML_SKELETON}
+        Schedule data:
+        {prompt_info}
+
+        Analysis:
+        {shared_analysis or ''}
+        """
+
+        content = chat_completion(SYSTEM_PROMPT, html_prompt, stage_model(ai_version, "html"), stage="html",
+                                  stop_when=html_closed())
 
         # ========== Clean Output ==========
         return re.sub(r'<body>|</body>|```html?|```', '', content.strip())
 
     except Exception as e:
         print(f"Generation error: {str(e)}")
-        return "Could not generate morning briefing due to system error"
\ No newline at end of file
+        return "Could not generate morning briefing due to system error"
@@ -1,68 +1,15 @@
-import openai
-from zhipuai import ZhipuAI
-from config import AI_API_KEY
+from config import NIGHT_SECTION_PARALLEL, NIGHT_SECTION_RETRIES
 from src.ai_operations.ai_iterator import iterator
+from src.ai_operations.ai_client import chat_completion, html_closed
+from src.ai_operations.model_router import stage_model
+from src.get_notion.models import format_items
+from src.digest.ranking import omitted_summary
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import re
 
-def email_advice_with_ai(data, ai_version, present_location, user_career, local_time, schedule_prompt=""):
-    print("\nGenerating advice with gpt...")
-    try:
-        prompt_info = f"""
-        1. 基础信息：
-        - 天气信息：{data['weather']}
-        - 雇主职业：{user_career}
-        - 雇主所在地：{present_location}
-        - 现在的时间：{local_time}
-        - 雇主的时间安排需求，如有冲突可适当调整：{schedule_prompt}
-
-        2. 时间安排：
-        - 今日进行中的日程：{data['in_progress_events']}
-        - 明天的日程：{data['tomorrow_events']}
-        - 后天及以后的日程：{data['upcoming_events']}
-
-        3. 今天完成的日程和任务：
-        - 今日完成的日程（如果没有就忽略）：{data['completed_events']}
-        - 今日完成的任务（如果没有就忽略）：{data['completed_tasks']}
-
-        4. 今天还没做完的任务：
-        - 任务：今日到期的紧急任务，必须今日内安排，但是还没做完的任务：{data['today_tasks']}
-
-        5. 其他任务：
-        - 任务：已经开始的任务，可以提醒要做：{data['in_progress_tasks']}
-        - 任务：即将开始的任务，可以提醒要做：{data['future_tasks']}
-        """
-
-        prompt_for_iter = f"""
-        私人秘书即将向用户总结今天的任务进展，并提前告知明天（或未来）的安排（分析越详细越好，"日程"可以告诉我时间，"任务"和其他的东西不用告诉我具体时间）。请根据以下要求进行分析：
-        
-        你要做的事情 一：
-        1. 总结今天完成了哪些事情（包括日程和任务）
-        2. 对每个已完成的事项进行简要点评，表扬完成得好的，对未完全达标的给出改进建议
-        3. 如果今天没有完成任何事项，直接说明"今天暂无完成的事项（任务）"
-
-        你要做的事情 二：
-        判断还有没有未完成的任务，如果有，就对于每个任务详细分析：
-        1. 每个任务是什么，详细解析一下
-        2. 怎么看待该任务的紧急程度
-        3. 任务的实际执行建议
-        如果没有未完成的任务，直接说明"暂无未完成的任务"
-
-        你要做的事情 三：
-        如果有明天的日程安排，列出具体安排；如果没有，直接说明"明天暂无已安排的日程"
-
-        你要做的事情 四：
-        如果有未来任务，根据紧急程度排序；如果没有，直接说明"暂无未来待办任务"
-
-        以下是相关信息：
-        {prompt_info}
-        """
-        
-        ai_schedule = iterator(prompt_for_iter, ai_version)
-
-        prompt = f"""
-        请你作为私人秘书，生成一封结构清晰的晚报邮件。请严格按照以下HTML结构输出：
-
-        1. 今日总结：
+# ========== 晚报各板块的HTML结构 ==========
+SUMMARY_SECTION = """
         <div class="section">
             <div class="section-header">
                 <h2><strong>📋 今日总结</strong></h2>
@@ -72,7 +19,7 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                     <h3>完成概述</h3>
                     <p>[简要总结今天的完成情况]</p>
                 </div>
-                
+
                 <ul class="timeline">
                     <li class="timeline-item">
                         <div class="timeline-time">[完成时间(不写日期，只写时间)]</div>
@@ -87,9 +34,9 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                 </ul>
             </div>
         </div>
-        注意：如果没有已完成事项，就不写后面的完成事项timeline的block。
+        注意：如果没有已完成事项，就不写后面的完成事项timeline的block。"""
 
-        2. 待处理事项：
+PENDING_SECTION = """
         <div class="section">
             <div class="section-header">
                 <h2><strong>📝 待处理事项</strong></h2>
@@ -99,7 +46,7 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                     <h3>未完成事项说明</h3>
                     <p>[简要说明未完成原因和处理建议]</p>
                 </div>
-                
+
                 <ul class="timeline">
                     <li class="timeline-item">
                         <div class="timeline-time">[预计时间]</div>
@@ -113,9 +60,9 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                     </li>
                 </ul>
             </div>
-        </div>
+        </div>"""
 
-        3. 明日预览：
+TOMORROW_SECTION = """
         <div class="section">
             <div class="section-header">
                 <h2><strong>🌅 明日预览</strong></h2>
@@ -140,9 +87,9 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                     </li>
                 </ul>
             </div>
-        </div>
+        </div>"""
 
-        4. 建议事项：
+ADVICE_SECTION = """
         <div class="section">
             <div class="section-header">
                 <h2><strong>💡 建议事项</strong></h2>
@@ -153,7 +100,54 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
                     <li>[明天需要特别注意的事项]</li>
                 </ul>
             </div>
-        </div>
+        </div>"""
+
+# ========== 固定的提示词前缀 ==========
+# 以下内容对所有用户、每次运行都完全相同，放在请求最前面以命中模型服务商的前缀缓存；
+# 用户相关的数据一律追加在后面。
+SYSTEM_CONTENT = """作为私人秘书，你需要生成一份全面的晚间总结报告。要求：
+        1. 严格遵循提供的HTML结构
+        2. 客观评价今日完成情况
+        3. 对未完成事项提供建设性建议
+        4. 做好明日工作的预判和建议
+        5. 保持专业、积极、鼓励的语气
+        6. 所有建议要具体且可执行
+        直接输出HTML内容，不要添加任何额外的开场白或结束语。"""
+
+ANALYSIS_INSTRUCTIONS = """
+        私人秘书即将向用户总结今天的任务进展，并提前告知明天（或未来）的安排（分析越详细越好，"日程"可以告诉我时间，"任务"和其他的东西不用告诉我具体时间）。请根据以下要求进行分析：
+
+        你要做的事情 一：
+        1. 总结今天完成了哪些事情（包括日程和任务）
+        2. 对每个已完成的事项进行简要点评，表扬完成得好的，对未完全达标的给出改进建议
+        3. 如果今天没有完成任何事项，直接说明"今天暂无完成的事项（任务）"
+
+        你要做的事情 二：
+        判断还有没有未完成的任务，如果有，就对于每个任务详细分析：
+        1. 每个任务是什么，详细解析一下
+        2. 怎么看待该任务的紧急程度
+        3. 任务的实际执行建议
+        如果没有未完成的任务，直接说明"暂无未完成的任务"
+
+        你要做的事情 三：
+        如果有明天的日程安排，列出具体安排；如果没有，直接说明"明天暂无已安排的日程"
+
+        你要做的事情 四：
+        如果有未来任务，根据紧急程度排序；如果没有，直接说明"暂无未来待办任务"
+
+        以下是相关信息：
+        """
+
+NIGHT_HTML_INSTRUCTIONS = f"""
+        请你作为私人秘书，生成一封结构清晰的晚报邮件。请严格按照以下HTML结构输出：
+
+        1. 今日总结：{SUMMARY_SECTION}
+
+        2. 待处理事项：{PENDING_SECTION}
+
+        3. 明日预览：{TOMORROW_SECTION}
+
+        4. 建议事项：{ADVICE_SECTION}
 
         注意要点：
         1. 今日总结要客观公正，既肯定成绩也指出不足
@@ -165,46 +159,232 @@ def email_advice_with_ai(data, ai_version, present_location, user_career, local_
            - task-priority-medium：明日待办事项
         5. 所有建议要具体且可执行
         6. 语气要专业、积极、鼓励
+        """
+
+# 分板块生成时使用：(标题, HTML结构, 板块要求, 需要的数据字段)
+NIGHT_SECTIONS = [
+    ("📋 今日总结", SUMMARY_SECTION,
+     """总结今天完成了哪些事情（包括日程和任务），对每个已完成的事项进行简要点评，表扬完成得好的，对未完全达标的给出改进建议。
+        今日总结要客观公正，既肯定成绩也指出不足。已完成的事项使用 task-priority-low 标签。
+        如果今天没有完成任何事项，直接说明"今天暂无完成的事项（任务）"。""",
+     ["completed_events", "completed_tasks"]),
+    ("📝 待处理事项", PENDING_SECTION,
+     """判断还有没有未完成的任务，如果有，就对于每个任务说明它是什么、怎么看待它的紧急程度，并给出具体可行的执行建议。
+        待处理的紧急事项使用 task-priority-high 标签。
+        如果没有未完成的任务，直接说明"暂无未完成的任务"。""",
+     ["today_tasks", "in_progress_tasks"]),
+    ("🌅 明日预览", TOMORROW_SECTION,
+     """如果有明天的日程安排，列出具体安排（"日程"可以写时间）；如果没有，直接说明"明天暂无已安排的日程"。
+        明日预览要突出重点，并给出准备建议。明日待办事项使用 task-priority-medium 标签。""",
+     ["weather", "tomorrow_events", "upcoming_events"]),
+    ("💡 建议事项", ADVICE_SECTION,
+     """基于今日完成情况给出改进建议，指出明天需要特别注意的事项。
+        如果有未来任务，根据紧急程度排序提醒；如果没有，直接说明"暂无未来待办任务"。""",
+     ["completed_tasks", "today_tasks", "tomorrow_events", "future_tasks"]),
+]
+
+SECTION_SYSTEM_CONTENT = """作为私人秘书，你需要生成晚间总结报告中的一个板块。要求：
+        1. 严格遵循提供的HTML结构，只输出这一个板块
+        2. 保持专业、积极、鼓励的语气
+        3. 所有建议要具体且可执行
+        直接输出HTML内容，不要添加任何额外的开场白或结束语。"""
+
+
+def _clean_html(content):
+    return re.sub(r'<body>|</body>|```html?|```', '', content.strip())
+
+
+# Task buckets a section reads; replaced by the morning-to-night diff when there is one
+TASK_KEYS = ("completed_tasks", "today_tasks", "in_progress_tasks", "future_tasks")
+
+
+def _format_value(value):
+    """Task/event buckets are serialised line by line, a task diff as its change set; anything else (weather) as is."""
+    if isinstance(value, list):
+        return format_items(value)
+    return value.to_prompt() if hasattr(value, "to_prompt") else value
+
+
+def _section_keys(keys, data):
+    if data.get("task_diff") is None or not any(key in TASK_KEYS for key in keys):
+        return keys
+    return [key for key in keys if key not in TASK_KEYS] + ["task_diff"]
+
+
+def _is_valid_section(html, title):
+    """A section is usable when it carries its own header and its <div> tags balance."""
+    if not html.lstrip().startswith('<div class="section">') or title not in html:
+        return False
+    return len(re.findall(r'<div\b', html)) == len(re.findall(r'</div>', html))
+
+
+def generate_section(section, data, ai_version, present_location, user_career, local_time, schedule_prompt=""):
+    """Generate one digest section, retrying only this section when the output is malformed."""
+    title, skeleton, instructions, keys = section
+    section_info = "\n".join(f"        - {key}：{_format_value(data.get(key, []))}" for key in _section_keys(keys, data))
+    prompt = f"""
+        请你作为私人秘书，生成晚报邮件中的"{title}"板块。请严格按照以下HTML结构输出：
+        {skeleton}
+
+        板块要求：
+        {instructions}
+
+        基础信息：
+        - 雇主职业：{user_career}
+        - 雇主的时间安排需求，如有冲突可适当调整：{schedule_prompt}
+        - 雇主所在地：{present_location}
+        - 现在的时间：{local_time}
 
         相关信息：
+{section_info}
+        """
+
+    for attempt in range(1 + NIGHT_SECTION_RETRIES):
+        try:
+            html = _clean_html(chat_completion(SECTION_SYSTEM_CONTENT, prompt, stage_model(ai_version, "html"),
+                                               stage="html", stop_when=html_closed()))
+            if _is_valid_section(html, title):
+                return html
+            print(f"⚠️ Section {title} malformed (attempt {attempt + 1}), retrying...")
+        except Exception as e:
+            print(f"⚠️ Section {title} failed (attempt {attempt + 1}): {e}")
+    return ""
+
+
+def email_advice_by_sections(data, ai_version, present_location, user_career, local_time, schedule_prompt=""):
+    """Generate the four night sections concurrently and join them in template order."""
+    print("\nGenerating night advice by sections...")
+    with ThreadPoolExecutor(max_workers=len(NIGHT_SECTIONS)) as executor:
+        # Each section thread carries the caller's ledger tags
+        futures = [
+            executor.submit(contextvars.copy_context().run, generate_section, section, data, ai_version,
+                            present_location, user_career, local_time, schedule_prompt)
+            for section in NIGHT_SECTIONS
+        ]
+        sections = [future.result() for future in futures]
+    print("Generated.\n")
+    return "\n".join(html for html in sections if html) or "There was an error generating advice."
+
+
+def _task_lines(data):
+    """Task part of the prompt: the change set since the morning snapshot when there is one, else full buckets."""
+    if data.get("task_diff") is not None:
+        return f"""
+        3. 今天任务的变化（只列出自早报以来的变化）：
+        {data['task_diff'].to_prompt()}
+        """
+    return f"""
+        3. 今天完成的任务：
+        - 今日完成的任务（如果没有就忽略）：{format_items(data['completed_tasks'])}
+
+        4. 今天还没做完的任务：
+        - 任务：今日到期的紧急任务，必须今日内安排，但是还没做完的任务：{format_items(data['today_tasks'])}
+
+        5. 其他任务：
+        - 任务：已经开始的任务，可以提醒要做：{format_items(data['in_progress_tasks'])}
+        - 任务：即将开始的任务，可以提醒要做：{format_items(data['future_tasks'])}
+        {_omitted_line(data)}"""
+
+
+OMITTED_LABELS = {"today_tasks": "今日到期", "in_progress_tasks": "已经开始", "future_tasks": "即将开始"}
+
+
+def _omitted_line(data):
+    """Counts of the lower-ranked tasks left out of the lists above, if any."""
+    summary = omitted_summary(data, OMITTED_LABELS, "{label} {count} 项")
+    return f"- 另有优先级较低、未列出的任务：{summary}" if summary else ""
+
+
+def _build_task_info(data, local_time):
+    """The user-independent part of the prompt: the local date plus task and event buckets."""
+    return f"""
+        - 今天的日期：{local_time.strftime('%Y-%m-%d')}
+
+        2. 时间安排：
+        - 今日进行中的日程：{format_items(data['in_progress_events'])}
+        - 明天的日程：{format_items(data['tomorrow_events'])}
+        - 后天及以后的日程：{format_items(data['upcoming_events'])}
+        - 今日完成的日程（如果没有就忽略）：{format_items(data['completed_events'])}
+        {_task_lines(data)}"""
+
+
+def _build_prompt_info(data, present_location, user_career, local_time, schedule_prompt):
+    """Per-user data, ordered from the most to the least stable field, appended after the static prompt."""
+    return f"""
+        1. 基础信息：
+        - 雇主职业：{user_career}
+        - 雇主的时间安排需求，如有冲突可适当调整：{schedule_prompt}
+        - 雇主所在地：{present_location}
+        - 天气信息：{data['weather']}
+        - 现在的时间：{local_time}
+        {_build_task_info(data, local_time)}"""
+
+
+def _fallback_section(title, items, note=""):
+    entries = "".join(item.to_html() for item in items)
+    return f"""
+        <div class="section">
+            <div class="section-header"><h2><strong>{title}</strong></h2></div>
+            <div class="section-content">
+                {f'<div class="overview-card"><p>{note}</p></div>' if note else ""}
+                <ul class="timeline">{entries}</ul>
+            </div>
+        </div>"""
+
+
+def render_without_ai(data):
+    """晚报的非AI版本：预算用完时直接用任务和日程数据填充四个板块。"""
+    weather = data.get('weather') or {}
+    weather_note = (f"{weather.get('description', '')}，{weather.get('temp_min', 'N/A')}~{weather.get('temp_max', 'N/A')}°C"
+                    if weather else "")
+    omitted = omitted_summary(data, OMITTED_LABELS, "{label} {count} 项")
+    return "\n".join([
+        _fallback_section("📋 今日总结", data.get('completed_events', []) + data.get('completed_tasks', []),
+                          "" if data.get('completed_events') or data.get('completed_tasks') else "今天暂无完成的事项（任务）"),
+        _fallback_section("📝 待处理事项", data.get('today_tasks', []) + data.get('in_progress_tasks', [])),
+        _fallback_section("🌅 明日预览", data.get('tomorrow_events', []), weather_note),
+        _fallback_section("💡 建议事项", data.get('future_tasks', []),
+                          "今日AI额度已用完，本晚报仅列出事项，不含建议。" + (f"另有未列出的任务：{omitted}" if omitted else "")),
+    ])
+
+
+def build_shared_analysis(data, ai_version, local_time):
+    """Analyse tasks and events only, so users sharing a task database can reuse the result."""
+    return iterator(ANALYSIS_INSTRUCTIONS + _build_task_info(data, local_time), stage_model(ai_version, "analysis"))
+
+
+def email_advice_with_ai(data, ai_version, present_location, user_career, local_time, schedule_prompt="",
+                         section_parallel=None, shared_analysis=None):
+    """ai_version is one model name, or a stage->model mapping from model_router.resolve_stage_models.
+
+    shared_analysis is the output of build_shared_analysis when it was already
+    computed for another user on the same task database and date.
+    """
+    if section_parallel is None:
+        section_parallel = NIGHT_SECTION_PARALLEL
+    if section_parallel:
+        return email_advice_by_sections(data, ai_version, present_location, user_career, local_time, schedule_prompt)
+
+    print("\nGenerating advice with gpt...")
+    try:
+        prompt_info = _build_prompt_info(data, present_location, user_career, local_time, schedule_prompt)
+
+        if shared_analysis is None:
+            shared_analysis = build_shared_analysis(data, ai_version, local_time)
+
+        prompt = f"""{NIGHT_HTML_INSTRUCTIONS}
+        相关信息：
         {prompt_info}
 
         之前的分析建议：
-        {ai_schedule}
+        {shared_analysis or ''}
         """
 
-        system_content = """作为私人秘书，你需要生成一份全面的晚间总结报告。要求：
-        1. 严格遵循提供的HTML结构
-        2. 客观评价今日完成情况
-        3. 对未完成事项提供建设性建议
-        4. 做好明日工作的预判和建议
-        5. 保持专业、积极、鼓励的语气
-        6. 所有建议要具体且可执行
-        直接输出HTML内容，不要添加任何额外的开场白或结束语。"""
-
-        print(system_content+"\n"+prompt)
-        if "gpt" in ai_version.lower():
-            openai.api_key = AI_API_KEY
-            response = openai.ChatCompletion.create(
-                model=ai_version,
-                messages=[
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-        elif "glm" in ai_version.lower():
-            client = ZhipuAI(AI_API_KEY)
-            response = client.chat.completions.create(
-                model=ai_version,
-                messages=[
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
+        print(SYSTEM_CONTENT+"\n"+prompt)
+        content = chat_completion(SYSTEM_CONTENT, prompt, stage_model(ai_version, "html"), stage="html",
+                                  stop_when=html_closed(len(NIGHT_SECTIONS)))
         print("Generated.\n")
-        return re.sub(r'<body>|</body>|```html?|```', '', response['choices'][0]['message']['content'].strip() if response['choices'] else "No guidance provided.")
+        return _clean_html(content or "No guidance provided.")
     except Exception as e:
         print(f"Error interacting with model: {e}")
-        return "There was an error generating advice."
\ No newline at end of file
+        return "There was an error generating advice."
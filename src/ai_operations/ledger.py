@@ -0,0 +1,212 @@
+"""Per-call LLM ledger: tokens, model, latency and cost, tagged by user, stage and run.
+
+Rows live in a local SQLite file next to the other caches. Per-user daily token
+budgets are checked against it before a digest is generated.
+
+    python -m src.ai_operations.ledger --days 7
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import numpy as np
+from config import BUDGET_DOWNGRADE_MODEL, BUDGET_DOWNGRADE_RATIO, LLM_LEDGER
+from src.ai_operations.model_router import estimate_cost
+from src.utils.cache import cache_path
+
+LEDGER_DB = "llm_ledger.sqlite"
+RETENTION_DAYS = 90
+
+# Set around each user's digest; calls made outside a tagged block are recorded untagged
+_user = ContextVar("ledger_user", default=None)
+_run = ContextVar("ledger_run", default=None)
+_day = ContextVar("ledger_day", default=None)
+
+_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    ts                REAL    NOT NULL,
+    day               TEXT    NOT NULL,  -- user's local date (UTC date when untagged)
+    run               TEXT,
+    user_id           TEXT,
+    stage             TEXT,
+    model             TEXT,
+    prompt_tokens     INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens     INTEGER NOT NULL,
+    latency           REAL,
+    ttft              REAL,
+    cost              REAL    NOT NULL,
+    estimated         INTEGER NOT NULL DEFAULT 0  -- 1: no usage from the provider (stream cut short), counts estimated
+);
+CREATE INDEX IF NOT EXISTS llm_calls_user_day ON llm_calls (user_id, day);
+"""
+
+
+def _connect():
+    path = cache_path(LEDGER_DB)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_calls)")}
+    if "estimated" not in columns:
+        # Ledgers created before estimated counts were recorded
+        conn.execute("ALTER TABLE llm_calls ADD COLUMN estimated INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+
+def start_run(digest):
+    """Run id shared by every call of one digest run, e.g. "morning-20250310T2300Z"; drops expired rows."""
+    if LLM_LEDGER:
+        try:
+            prune()
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM ledger error: {str(e)}")
+    return f"{digest}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%MZ')}"
+
+
+@contextmanager
+def tagged(user_id, run, local_date):
+    """Attribute every call made inside the block (in this thread) to one user, run and local day."""
+    tokens = (_user.set(user_id), _run.set(run), _day.set(str(local_date)))
+    try:
+        yield
+    finally:
+        for var, token in zip((_user, _run, _day), tokens):
+            var.reset(token)
+
+
+def record(entry):
+    """Append one ai_client.record_usage entry; never lets a ledger error break the digest."""
+    if not LLM_LEDGER:
+        return
+    row = (
+        time.time(),
+        _day.get() or datetime.now(timezone.utc).date().isoformat(),
+        _run.get(), _user.get(), entry.get("stage"), entry.get("model"),
+        entry["prompt_tokens"], entry["completion_tokens"], entry["cached_tokens"],
+        entry.get("latency"), entry.get("ttft"), estimate_cost(entry), int(bool(entry.get("estimated"))),
+    )
+    try:
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.execute("INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM ledger error: {str(e)}")
+
+
+def tokens_used(user_id, local_date):
+    """Prompt + completion tokens recorded for one user on one local day, estimated rows included."""
+    with _lock:
+        conn = _connect()
+        try:
+            (total,) = conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM llm_calls "
+                "WHERE user_id = ? AND day = ?", (user_id, str(local_date))
+            ).fetchone()
+        finally:
+            conn.close()
+    return total
+
+
+def budget_models(user_id, local_date, stage_models, budget):
+    """Stage models to use under the user's daily token budget, or None when it is spent.
+
+    Past BUDGET_DOWNGRADE_RATIO of the budget every stage switches to
+    BUDGET_DOWNGRADE_MODEL (when set); at the budget the caller should render
+    without the model. A budget of 0 means unlimited.
+    """
+    if not budget or not LLM_LEDGER:
+        return stage_models
+    try:
+        used = tokens_used(user_id, local_date)
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM ledger error: {str(e)}")
+        return stage_models
+    if used >= budget:
+        print(f"💸 {user_id} used {used}/{budget} tokens today, rendering without the model")
+        return None
+    if BUDGET_DOWNGRADE_MODEL and used >= BUDGET_DOWNGRADE_RATIO * budget:
+        print(f"💸 {user_id} used {used}/{budget} tokens today, downgrading to {BUDGET_DOWNGRADE_MODEL}")
+        return {stage: BUDGET_DOWNGRADE_MODEL for stage in stage_models}
+    return stage_models
+
+
+def prune(days=RETENTION_DAYS):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM llm_calls WHERE ts < ?", (time.time() - days * 86400,))
+        finally:
+            conn.close()
+
+
+def report(days=7, by="user_id"):
+    """Calls, tokens, cost and p50/p95 latency per `by` value (user_id, stage, model or run) over the last days."""
+    if by not in ("user_id", "stage", "model", "run"):
+        raise ValueError(f"Cannot group the ledger by {by}")
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {by}, prompt_tokens, completion_tokens, cached_tokens, cost, latency, estimated FROM llm_calls "
+                "WHERE ts >= ?", (time.time() - days * 86400,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    groups = {}
+    for key, *values in rows:
+        groups.setdefault(key or "-", []).append(values)
+    summary = {}
+    for key, values in groups.items():
+        prompt, completion, cached, cost, latency, estimated = (np.array(column, dtype=float) for column in zip(*values))
+        latency = latency[~np.isnan(latency)]
+        summary[key] = {
+            "calls": len(values),
+            "prompt_tokens": int(prompt.sum()),
+            "completion_tokens": int(completion.sum()),
+            "cached_tokens": int(cached.sum()),
+            "cost": float(cost.sum()),
+            "estimated": int(estimated.sum()),
+            "p50_latency": float(np.percentile(latency, 50)) if latency.size else None,
+            "p95_latency": float(np.percentile(latency, 95)) if latency.size else None,
+        }
+    return dict(sorted(summary.items(), key=lambda item: -item[1]["cost"]))
+
+
+def _seconds(value):
+    return f"{value:.2f}s" if value is not None else "N/A"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--by", choices=("user_id", "stage", "model", "run"), default="user_id")
+    args = parser.parse_args()
+
+    summary = report(args.days, args.by)
+    if not summary:
+        print(f"No LLM calls recorded in the last {args.days} days")
+        return
+    print(f"{args.by:<28}{'calls':>7}{'est.':>6}{'prompt':>11}{'cached':>10}{'completion':>12}{'cost $':>10}"
+          f"{'p50':>9}{'p95':>9}")
+    for key, s in summary.items():
+        print(f"{str(key)[:27]:<28}{s['calls']:>7}{s['estimated']:>6}{s['prompt_tokens']:>11}{s['cached_tokens']:>10}"
+              f"{s['completion_tokens']:>12}{s['cost']:>10.4f}{_seconds(s['p50_latency']):>9}{_seconds(s['p95_latency']):>9}")
+    total = sum(s["cost"] for s in summary.values())
+    print(f"\nTotal estimated cost over {args.days} days: ${total:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from config import AI_MODEL_ANALYSIS, AI_MODEL_HTML
+
+# Pipeline stages that can run on their own model:
+# - analysis: the free-form iterator() pass that only feeds the final call
+# - html: the call (or night sections) that produces the email HTML
+STAGES = ("analysis", "html")
+
+# Per-user override columns in the Notion config table, and the global defaults from .env
+STAGE_CONFIG_KEYS = {
+    "analysis": "GPT_VERSION_ANALYSIS",
+    "html": "GPT_VERSION_HTML",
+}
+STAGE_DEFAULTS = {
+    "analysis": AI_MODEL_ANALYSIS,
+    "html": AI_MODEL_HTML,
+}
+
+# USD per 1M tokens: (input, cached input, output). Used for cost estimates only.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "glm-4": (1.40, 1.40, 1.40),
+    "glm-4-plus": (0.70, 0.70, 0.70),
+    "glm-4-air": (0.07, 0.07, 0.07),
+    "glm-4-flash": (0.0, 0.0, 0.0),
+}
+
+
+def _is_set(value):
+    return bool(value) and value.strip() not in ("", "MISSING")
+
+
+def resolve_stage_models(config):
+    """Map each stage to a model: per-user column, then global default, then GPT_VERSION."""
+    base = config.get("GPT_VERSION", "")
+    models = {}
+    for stage in STAGES:
+        user_value = config.get(STAGE_CONFIG_KEYS[stage], "")
+        if _is_set(user_value):
+            models[stage] = user_value.strip()
+        elif _is_set(STAGE_DEFAULTS[stage]):
+            models[stage] = STAGE_DEFAULTS[stage].strip()
+        else:
+            models[stage] = base
+    return models
+
+
+def stage_model(ai_version, stage):
+    """Accept either a single model name or a stage->model mapping from resolve_stage_models."""
+    if isinstance(ai_version, dict):
+        return ai_version.get(stage) or next(iter(ai_version.values()))
+    return ai_version
+
+
+def estimate_cost(entry):
+    """Estimated USD cost of one usage entry recorded by ai_client.record_usage."""
+    model = (entry.get("model") or "").lower()
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # Fall back to the longest known prefix, e.g. "gpt-4o-2024-08-06" -> "gpt-4o"
+        matches = [name for name in MODEL_PRICES if model.startswith(name)]
+        if not matches:
+            return 0.0
+        prices = MODEL_PRICES[max(matches, key=len)]
+    input_price, cached_price, output_price = prices
+    cached = entry.get("cached_tokens", 0)
+    uncached = max(entry.get("prompt_tokens", 0) - cached, 0)
+    return (uncached * input_price + cached * cached_price
+            + entry.get("completion_tokens", 0) * output_price) / 1_000_000
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import threading
+from src.digest.ranking import OPEN_BUCKETS, keywords, select_top_k
+from src.utils.cache import load_json, save_json
+
+DRAFTS_CACHE = "morning_drafts.json"
+_drafts_lock = threading.Lock()
+
+# Weather fields that go into the prompt, rounded so forecast jitter between
+# the night and morning runs does not count as a change
+WEATHER_ROUNDING = {
+    "temp": 0, "temp_min": 0, "temp_max": 0, "humidity": -1,
+    "wind_speed": 0, "wind_peak": 0, "rain_probability": 1,
+}
+
+
+def morning_ai_data(weather, tasks, config, today, top_k):
+    """The morning prompt input: today's weather summary and the top_k ranked open tasks."""
+    ai_data = {
+        "weather": weather or {},
+        "today_tasks": (tasks or {}).get("today_due", []),
+        "in_progress_tasks": (tasks or {}).get("in_progress", []),
+        "future_tasks": (tasks or {}).get("future", []),
+    }
+    return select_top_k(ai_data, top_k, today, keywords(config["SCHEDULE_PROMPT"], config["USER_CAREER"]))
+
+
+def _material_weather(weather):
+    material = {"description": weather.get("description")}
+    for name, digits in WEATHER_ROUNDING.items():
+        value = weather.get(name)
+        material[name] = round(float(value), digits) if isinstance(value, (int, float)) else value
+    return material
+
+
+def input_fingerprint(ai_data, config, local_date):
+    """Hash of everything the morning prompt is built from, for one user and local date."""
+    payload = {
+        "date": str(local_date),
+        "models": config.stage_models,
+        "user": [config["PRESENT_LOCATION"], config["USER_CAREER"], config["SCHEDULE_PROMPT"]],
+        "weather": _material_weather(ai_data.get("weather") or {}),
+        "tasks": {bucket: [task.to_prompt() for task in ai_data.get(bucket, [])] for bucket in OPEN_BUCKETS},
+        "omitted": ai_data.get("omitted_tasks") or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def save_draft(user_id, local_date, fingerprint, body):
+    """Store a speculative morning digest body; one draft per user, replacing older ones."""
+    with _drafts_lock:
+        drafts = load_json(DRAFTS_CACHE, {})
+        drafts[user_id] = {"date": str(local_date), "fingerprint": fingerprint, "body": body}
+        save_json(DRAFTS_CACHE, drafts)
+
+
+def take_draft(user_id, local_date, fingerprint):
+    """The stored draft body when it was made for this date from the same inputs, else None."""
+    draft = load_json(DRAFTS_CACHE, {}).get(user_id)
+    if draft and draft["date"] == str(local_date) and draft["fingerprint"] == fingerprint:
+        return draft["body"]
+    return None
@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch_concurrently(jobs):
+    """Run {name: callable} jobs in parallel threads and return {name: result}.
+
+    The data phase then costs the slowest job instead of the sum of all of them.
+    A job that raises yields {} so the digest can still be sent without it.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as pool:
+        futures = {name: pool.submit(job) for name, job in jobs.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"❌ Failed to fetch {name}: {str(e)}")
+            results[name] = {}
+    return results
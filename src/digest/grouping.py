@@ -0,0 +1,39 @@
+import threading
+from collections import defaultdict
+
+
+def database_key(database_id):
+    """Normalise a Notion database id so dashed and undashed spellings compare equal."""
+    return (database_id or "").strip().replace("-", "").lower()
+
+
+def group_key(database_id, local_date, tz_offset):
+    """Users with the same task database, local date and time zone see identical task data."""
+    return (database_key(database_id), local_date, tz_offset)
+
+
+class GroupCache:
+    """Compute each keyed value once per run, even when several workers ask for it at the same time.
+
+    A None result (a failed computation) is not kept: the next caller computes it again.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._locks = defaultdict(threading.Lock)
+        self._guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self._guard:
+            lock = self._locks[key]
+        with lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+            value = compute()
+            if value is not None:
+                self._values[key] = value
+            return value
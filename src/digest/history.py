@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from src.utils.cache import cache_path
+
+HISTORY_DB = "task_history.sqlite"
+RETENTION_DAYS = 120
+
+_lock = threading.Lock()
+
+# Every fetched task once: completed ones whatever their date, so late and early completions count
+HISTORY_BUCKETS = ("today_due", "in_progress", "future", "all_completed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_history (
+    database  TEXT    NOT NULL,
+    run_day   INTEGER NOT NULL,  -- local date.toordinal() of the run
+    page_id   TEXT    NOT NULL,
+    priority  INTEGER NOT NULL,  -- Priority enum value
+    due_day   INTEGER NOT NULL,  -- ordinal of End, or Start when there is no End
+    completed INTEGER NOT NULL,
+    eta       INTEGER NOT NULL,
+    PRIMARY KEY (database, run_day, page_id)
+) WITHOUT ROWID
+"""
+
+
+def _connect():
+    path = cache_path(HISTORY_DB)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def record_tasks(database, local_date, buckets):
+    """Append one run's classified tasks; the night run overwrites the morning row of the same day."""
+    run_day = local_date.toordinal()
+    rows = {}
+    for bucket in HISTORY_BUCKETS:
+        for task in buckets.get(bucket, []):
+            due = (task.end or task.start).date().toordinal()
+            rows[task.page_id] = (database, run_day, task.page_id, int(task.priority), due,
+                                  int(task.completed), int(task.eta))
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO task_history VALUES (?, ?, ?, ?, ?, ?, ?)", rows.values())
+                conn.execute("DELETE FROM task_history WHERE database = ? AND run_day < ?",
+                             (database, run_day - RETENTION_DAYS))
+        finally:
+            conn.close()
+    return len(rows)
+
+
+def load_columns(database, since_day):
+    """Rows from since_day on as NumPy columns; page ids become dense integer task indexes."""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT run_day, page_id, priority, due_day, completed, eta FROM task_history "
+                "WHERE database = ? AND run_day >= ? ORDER BY run_day",
+                (database, since_day)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    if not rows:
+        return None
+    run_day, page_id, priority, due_day, completed, eta = zip(*rows)
+    _, task = np.unique(np.array(page_id), return_inverse=True)
+    return {
+        "run_day": np.array(run_day, dtype=np.int32),
+        "task": task.astype(np.int32),
+        "priority": np.array(priority, dtype=np.int8),
+        "due_day": np.array(due_day, dtype=np.int32),
+        "completed": np.array(completed, dtype=bool),
+        "eta": np.array(eta, dtype=bool),
+    }
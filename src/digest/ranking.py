@@ -0,0 +1,90 @@
+import re
+import numpy as np
+
+# Relative weight of each signal in the relevance score (signals are scaled to 0..1)
+WEIGHTS = {
+    "priority": 3.0,
+    "remaining_days": 2.0,
+    "due": 2.5,
+    "needs_attention": 1.0,
+    "keywords": 1.5,
+}
+
+OPEN_BUCKETS = ("today_tasks", "in_progress_tasks", "future_tasks")
+
+_WORD = re.compile(r"[a-z0-9]+|[一-鿿]+")
+STOPWORDS = {"the", "and", "for", "with", "from", "this", "that", "are", "not", "missing"}
+
+
+def keywords(*texts):
+    """Lower-case words, plus character bigrams for CJK runs that have no spaces to split on."""
+    tokens = set()
+    for text in texts:
+        for match in _WORD.findall((text or "").lower()):
+            if match.isascii():
+                if len(match) > 2 and match not in STOPWORDS:
+                    tokens.add(match)
+            else:
+                tokens.update(match[i:i + 2] for i in range(max(len(match) - 1, 1)))
+    return tokens
+
+
+def score_tasks(tasks, today, user_keywords=frozenset()):
+    """Relevance score per task; higher goes to the model first."""
+    if not tasks:
+        return np.zeros(0)
+    priority = np.fromiter((int(t.priority) for t in tasks), dtype=float, count=len(tasks)) / 3
+    remaining = np.fromiter((np.nan if t.remaining_days is None else t.remaining_days for t in tasks),
+                            dtype=float, count=len(tasks))
+    due_in = np.fromiter((((t.end or t.start).date() - today).days for t in tasks), dtype=float, count=len(tasks))
+    needs_attention = np.fromiter((not t.eta for t in tasks), dtype=float, count=len(tasks))
+    overlap = np.fromiter((len(keywords(t.name) & user_keywords) for t in tasks), dtype=float, count=len(tasks))
+
+    remaining_score = np.where(np.isnan(remaining), 0.0, 1 / (1 + np.clip(np.nan_to_num(remaining), 0, None)))
+    # Overdue and due today score 1, then decay with the days left
+    due_score = 1 / (1 + np.clip(due_in, 0, None))
+    keyword_score = overlap / overlap.max() if overlap.max() > 0 else overlap
+
+    return (WEIGHTS["priority"] * priority
+            + WEIGHTS["remaining_days"] * remaining_score
+            + WEIGHTS["due"] * due_score
+            + WEIGHTS["needs_attention"] * needs_attention
+            + WEIGHTS["keywords"] * keyword_score)
+
+
+def select_top_k(data, k, today, user_keywords=frozenset()):
+    """Keep the k best open tasks across OPEN_BUCKETS in full; the rest become per-bucket counts.
+
+    Returns a copy of data with trimmed buckets and an "omitted_tasks" {bucket: count} entry.
+    Bucket order is preserved for the tasks that stay.
+    """
+    pool = [(bucket, task) for bucket in OPEN_BUCKETS for task in data.get(bucket, [])]
+    if not k or len(pool) <= k:
+        return data
+
+    scores = score_tasks([task for _, task in pool], today, user_keywords)
+    keep = np.zeros(len(pool), dtype=bool)
+    keep[np.argpartition(-scores, k - 1)[:k]] = True
+
+    ranked = dict(data)
+    ranked["omitted_tasks"] = {}
+    for bucket in OPEN_BUCKETS:
+        ranked[bucket] = []
+    for (bucket, task), kept in zip(pool, keep):
+        if kept:
+            ranked[bucket].append(task)
+        else:
+            ranked["omitted_tasks"][bucket] = ranked["omitted_tasks"].get(bucket, 0) + 1
+    return ranked
+
+
+def selection_key(data):
+    """Page ids sent in full, so a shared analysis is only reused for the same selection."""
+    return tuple(task.page_id for bucket in OPEN_BUCKETS for task in data.get(bucket, []))
+
+
+def omitted_summary(data, labels, template="{label} {count}"):
+    """One line naming how many lower-ranked tasks each bucket left out; "" when nothing was cut."""
+    omitted = data.get("omitted_tasks") or {}
+    return ", ".join(template.format(label=labels[bucket], count=count)
+                     for bucket, count in omitted.items() if count)
@@ -0,0 +1,197 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import pytz
+from config import DIGEST_DEADLINE_WINDOW_MINUTES
+from src.utils.cache import load_json, save_json
+
+DURATIONS_CACHE = "stage_durations.json"
+STAGES = ("fetch", "analysis", "html", "send")
+EWMA_ALPHA = 0.5
+
+# First-run guess of seconds per model call, by model-name prefix (longest match wins)
+MODEL_SECONDS = {
+    "gpt-4o-mini": 6.0,
+    "gpt-4o": 15.0,
+    "gpt-4.1-nano": 4.0,
+    "gpt-4.1-mini": 6.0,
+    "gpt-4.1": 15.0,
+    "gpt-3.5": 6.0,
+    "glm-4-flash": 5.0,
+    "glm-4-air": 8.0,
+    "glm-4": 15.0,
+}
+DEFAULT_MODEL_SECONDS = 12.0
+FETCH_SECONDS = 3.0
+SECONDS_PER_TASK = 0.05
+
+
+def model_seconds(model):
+    model = (model or "").lower()
+    matches = [name for name in MODEL_SECONDS if model.startswith(name)]
+    return MODEL_SECONDS[max(matches, key=len)] if matches else DEFAULT_MODEL_SECONDS
+
+
+class DurationHistory:
+    """Per-user stage durations (EWMA) and task counts from earlier runs of one digest."""
+
+    def __init__(self, digest):
+        self.digest = digest
+        self._all = load_json(DURATIONS_CACHE, {})
+        self._users = self._all.setdefault(digest, {})
+        self._lock = threading.Lock()
+        # Set to a profiling.Profiler to also profile every stage (--profile)
+        self.profiler = None
+
+    def record(self, user_id, stage, seconds):
+        with self._lock:
+            entry = self._users.setdefault(user_id, {})
+            previous = entry.get(stage)
+            entry[stage] = seconds if previous is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * previous
+
+    def record_tasks(self, user_id, count):
+        with self._lock:
+            self._users.setdefault(user_id, {})["tasks"] = count
+
+    @contextmanager
+    def stage(self, user_id, stage):
+        started = time.perf_counter()
+        try:
+            with self.profiler.stage(user_id, stage) if self.profiler else nullcontext():
+                yield
+        finally:
+            self.record(user_id, stage, time.perf_counter() - started)
+
+    def estimate(self, user_id, stage_models):
+        """Expected seconds for this user: recorded stages, falling back to model and task-count guesses."""
+        entry = self._users.get(user_id, {})
+        per_task = SECONDS_PER_TASK * entry.get("tasks", 0)
+        guesses = {
+            "fetch": FETCH_SECONDS,
+            "analysis": model_seconds(stage_models.get("analysis")) + per_task,
+            "html": model_seconds(stage_models.get("html")) + per_task,
+            "send": 1.0,
+        }
+        return sum(entry.get(stage, guesses[stage]) for stage in STAGES)
+
+    def save(self):
+        with self._lock:
+            save_json(DURATIONS_CACHE, self._all)
+
+
+def delivery_deadline(tz_offset, hour, now_utc):
+    """UTC time of the user's nearest local delivery hour.
+
+    A deadline up to 12 hours in the past is kept (the user is already late);
+    older ones roll over to the next day.
+    """
+    local_now = now_utc.astimezone(pytz.FixedOffset(tz_offset * 60))
+    local_deadline = local_now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if local_now - local_deadline > timedelta(hours=12):
+        local_deadline += timedelta(days=1)
+    return local_deadline.astimezone(pytz.utc)
+
+
+def next_delivery(tz_offset, hour, now_utc, lead_minutes=10):
+    """UTC time of the next local delivery hour at least lead_minutes from now (precompute mode)."""
+    local_now = now_utc.astimezone(pytz.FixedOffset(tz_offset * 60))
+    local_delivery = local_now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if local_delivery < local_now + timedelta(minutes=lead_minutes):
+        local_delivery += timedelta(days=1)
+    return local_delivery.astimezone(pytz.utc)
+
+
+def same_day_delivery(tz_offset, hour, now_utc, lead_minutes=10):
+    """next_delivery when it falls on the user's current local date, else None.
+
+    The night digest summarises its own day, so it can only be written ahead
+    for tonight; once tonight's hour has passed it is sent right away instead.
+    """
+    delivery = next_delivery(tz_offset, hour, now_utc, lead_minutes)
+    tz = pytz.FixedOffset(tz_offset * 60)
+    return delivery if delivery.astimezone(tz).date() == now_utc.astimezone(tz).date() else None
+
+
+@dataclass
+class DigestJob:
+    user_id: str
+    deadline: datetime
+    cost: float
+
+
+def order_jobs(jobs, window_minutes=None):
+    """Earliest deadline first; within one deadline window, longest job first (LPT).
+
+    Feeding this order to N workers that each take the next job when free is
+    LPT list scheduling inside every deadline tier.
+    """
+    window = timedelta(minutes=window_minutes or DIGEST_DEADLINE_WINDOW_MINUTES)
+    if not jobs:
+        return []
+    earliest = min(job.deadline for job in jobs)
+    return sorted(jobs, key=lambda job: ((job.deadline - earliest) // window, -job.cost))
+
+
+def predict(ordered, workers, now_utc):
+    """Simulate the list schedule: (makespan seconds, user_ids predicted to miss their deadline)."""
+    free_at = [0.0] * max(workers, 1)
+    heapq.heapify(free_at)
+    late = []
+    for job in ordered:
+        finish = heapq.heappop(free_at) + job.cost
+        heapq.heappush(free_at, finish)
+        if now_utc + timedelta(seconds=finish) > job.deadline:
+            late.append(job.user_id)
+    return max(free_at), late
+
+
+def run_jobs(ordered, workers, process):
+    """Run process(job) for each job, the next job going to whichever worker frees up first."""
+    if workers <= 1:
+        for job in ordered:
+            process(job)
+        return
+    # The executor's FIFO queue hands jobs out in submission order
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process, job) for job in ordered]
+    for job, future in zip(ordered, futures):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"❌ Error processing user {job.user_id}: {str(e)}")
+
+
+def schedule(configs, digest, delivery_hour, workers, now_utc=None, precompute=False):
+    """Build, order and report the jobs for every valid user; returns (ordered jobs, history).
+
+    In precompute mode each deadline is the user's next delivery time, which is
+    also when Mailgun will release the message (for the night digest only on
+    the current local date; see same_day_delivery).
+    """
+    now_utc = now_utc or datetime.now(pytz.utc)
+    history = DurationHistory(digest)
+    if not precompute:
+        deadline = delivery_deadline
+    elif digest == "night":
+        def deadline(tz_offset, hour, now):
+            return same_day_delivery(tz_offset, hour, now) or delivery_deadline(tz_offset, hour, now)
+    else:
+        deadline = next_delivery
+    jobs = [
+        DigestJob(
+            user_id=user_id,
+            deadline=deadline(config.tz_offset, delivery_hour, now_utc),
+            cost=history.estimate(user_id, config.stage_models),
+        )
+        for user_id, config in configs.items()
+        if config.is_valid(digest)
+    ]
+    ordered = order_jobs(jobs)
+    makespan, late = predict(ordered, workers, now_utc)
+    print(f"🗓️ {len(ordered)} users on {workers} worker(s): predicted {makespan:.0f}s, "
+          f"{len(late)} predicted past delivery time")
+    return ordered, history
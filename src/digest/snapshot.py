@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+from typing import List
+from src.get_notion.models import format_items
+from src.utils.cache import load_json, save_json
+
+# Buckets that hold every task once (tomorrow/upcoming only split future)
+SNAPSHOT_BUCKETS = ("today_due", "in_progress", "future", "completed")
+BUCKET_LABELS = {"today_due": "今日到期", "in_progress": "进行中", "future": "未来"}
+
+
+def _snapshot_name(key):
+    database, local_date, tz_offset = key
+    return f"snapshots/{database}_{local_date}_{tz_offset}.json"
+
+
+def _short(iso):
+    return iso[:16].replace("T", " ") if iso else ""
+
+
+def compact_tasks(buckets):
+    """{page_id: {"n": name, "b": bucket, "s": start, "e": end, "c": completed}} for classified tasks."""
+    compact = {}
+    for bucket in SNAPSHOT_BUCKETS:
+        for task in buckets.get(bucket, []):
+            compact[task.page_id] = {
+                "n": task.name,
+                "b": bucket,
+                "s": task.start.isoformat() if task.start else None,
+                "e": task.end.isoformat() if task.end else None,
+                "c": task.completed,
+            }
+    return compact
+
+
+def save_morning_snapshot(key, buckets):
+    """Store the morning's classified tasks for one grouping key (database, local date, offset); returns them."""
+    snapshot = compact_tasks(buckets)
+    save_json(_snapshot_name(key), snapshot)
+    return snapshot
+
+
+def load_morning_snapshot(key):
+    return load_json(_snapshot_name(key))
+
+
+@dataclass
+class TaskDiff:
+    """What changed in a task database between the morning snapshot and the night fetch."""
+    completed: List = field(default_factory=list)
+    added: List = field(default_factory=list)
+    rescheduled: List = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    open_counts: dict = field(default_factory=dict)
+    due_today: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def summary(self):
+        counts = "，".join(f"{BUCKET_LABELS[bucket]} {count} 项" for bucket, count in self.open_counts.items())
+        return (f"与早间快照相比：新完成 {len(self.completed)} 项，新增 {len(self.added)} 项，"
+                f"改期 {len(self.rescheduled)} 项，移出 {len(self.dropped)} 项，其余 {self.unchanged} 项无变化。"
+                f"当前未完成：{counts or '无'}。")
+
+    def to_prompt(self):
+        rescheduled = "\n".join(f"{task.to_prompt()}（原时间：{before}）" for task, before in self.rescheduled)
+        return f"""{self.summary()}
+        - 今日新完成的任务：{format_items(self.completed)}
+        - 今天新增的任务：{format_items(self.added)}
+        - 今天改期的任务：{rescheduled or '无'}
+        - 今天移出的任务：{'、'.join(self.dropped) or '无'}
+        - 今日到期仍未完成：{'、'.join(self.due_today) or '无'}"""
+
+
+def diff_tasks(snapshot, buckets):
+    """Structural diff by page_id: newly completed, added, rescheduled and dropped tasks.
+
+    The morning snapshot includes the tasks already completed by then, so only
+    completions after the morning run count as new.
+    """
+    diff = TaskDiff()
+    seen = set()
+    for bucket in SNAPSHOT_BUCKETS:
+        for task in buckets.get(bucket, []):
+            seen.add(task.page_id)
+            before = snapshot.get(task.page_id)
+            if task.completed:
+                if before is None or not before["c"]:
+                    diff.completed.append(task)
+                else:
+                    diff.unchanged += 1
+                continue
+
+            diff.open_counts[bucket] = diff.open_counts.get(bucket, 0) + 1
+            if bucket == "today_due":
+                diff.due_today.append(task.name)
+            if before is None:
+                diff.added.append(task)
+            elif (before["s"], before["e"]) != (task.start.isoformat() if task.start else None,
+                                                task.end.isoformat() if task.end else None):
+                previous = _short(before["s"]) + (f" → {_short(before['e'])}" if before["e"] else "")
+                diff.rescheduled.append((task, previous))
+            else:
+                diff.unchanged += 1
+
+    # Gone from the window without being completed here: deleted, or moved out of range
+    diff.dropped = [entry["n"] for page_id, entry in snapshot.items()
+                    if page_id not in seen and not entry["c"]]
+    return diff
@@ -0,0 +1,101 @@
+import numpy as np
+from src.digest.history import load_columns, record_tasks
+from src.get_notion.models import Priority
+
+WINDOWS = (30, 90)
+NEVER = np.iinfo(np.int32).max
+
+
+def _trailing_true(flags):
+    """Length of the run of True values at the end of a boolean array."""
+    if flags.all():
+        return int(flags.size)
+    return int(flags.size - 1 - np.flatnonzero(~flags)[-1])
+
+
+def window_stats(cols, today, window):
+    """Completion rate, overdue streak, per-priority throughput and ETA accuracy over the last `window` days."""
+    keep = cols["run_day"] > today - window
+    run_day, task = cols["run_day"][keep], cols["task"][keep]
+    if run_day.size == 0:
+        return None
+    due, done, eta, priority = cols["due_day"][keep], cols["completed"][keep], cols["eta"][keep], cols["priority"][keep]
+
+    n = int(task.max()) + 1
+    first_done = np.full(n, NEVER, dtype=np.int32)
+    np.minimum.at(first_done, task[done], run_day[done])
+    # Latest observation wins for due date and priority
+    task_due = np.zeros(n, dtype=np.int32)
+    task_due[task] = due
+    task_priority = np.zeros(n, dtype=np.int8)
+    task_priority[task] = priority
+    ever_eta = np.zeros(n, dtype=bool)
+    np.logical_or.at(ever_eta, task, eta)
+    seen = np.zeros(n, dtype=bool)
+    seen[task] = True
+
+    finished = first_done != NEVER
+    due_in_window = seen & (task_due <= today) & (task_due > today - window)
+    completion_rate = float(finished[due_in_window].mean()) if due_in_window.any() else None
+
+    weeks = window / 7
+    throughput = np.bincount(task_priority[finished], minlength=len(Priority)) / weeks
+
+    on_track = ever_eta & due_in_window
+    eta_accuracy = float((first_done[on_track] <= task_due[on_track]).mean()) if on_track.any() else None
+
+    # A run day counts towards the streak when any open task was already past due
+    overdue_days = np.unique(run_day[~done & (due < run_day)])
+    run_days = np.unique(run_day)
+    overdue_streak = _trailing_true(np.isin(run_days, overdue_days))
+
+    return {
+        "days": int(run_days.size),
+        "completion_rate": completion_rate,
+        "overdue_streak": overdue_streak,
+        "throughput": {p.label: round(float(throughput[p]), 2) for p in Priority},
+        "eta_accuracy": eta_accuracy,
+    }
+
+
+def productivity_stats(database, today):
+    """{window: stats} for WINDOWS, read from the task history of one database."""
+    cols = load_columns(database, today.toordinal() - max(WINDOWS) + 1)
+    if cols is None:
+        return {}
+    return {window: window_stats(cols, today.toordinal(), window) for window in WINDOWS}
+
+
+def _percent(value):
+    return f"{value:.0%}" if value is not None else "N/A"
+
+
+def stats_html(stats):
+    """Trend section rendered locally from productivity_stats(); empty when there is no history yet."""
+    rows = []
+    for window, s in stats.items():
+        if not s:
+            continue
+        throughput = ", ".join(f"{label} {value:g}" for label, value in s["throughput"].items() if value)
+        rows.append(
+            f'<li><strong>{window} days</strong> ({s["days"]} runs): '
+            f'completion {_percent(s["completion_rate"])}, '
+            f'ETA accuracy {_percent(s["eta_accuracy"])}, '
+            f'overdue streak {s["overdue_streak"]} runs, '
+            f'completed per week: {throughput or "0"}</li>'
+        )
+    if not rows:
+        return ""
+    return ('<div class="section"><div class="section-header"><h2><strong>📈 Trends</strong></h2></div>'
+            f'<div class="section-content"><ul class="important-notes">{"".join(rows)}</ul></div></div>')
+
+
+def record_and_render(database, local_date, buckets):
+    """Append this run to the history and return the trend section; "" on any failure."""
+    try:
+        if buckets and any(buckets.values()):
+            record_tasks(database, local_date, buckets)
+        return stats_html(productivity_stats(database, local_date))
+    except Exception as e:
+        print(f"⚠️ Task history error: {str(e)}")
+        return ""
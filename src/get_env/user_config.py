@@ -0,0 +1,179 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import pytz
+from dotenv import load_dotenv
+
+from config import CONFIG_SNAPSHOT_DIR, USER_CONFIG_FULL_REFRESH_HOURS, USER_DAILY_TOKEN_BUDGET
+from src.ai_operations.model_router import resolve_stage_models
+from src.get_notion.query import query_database
+from src.utils.cache import load_json, save_json
+from src.utils.http_pool import notion_client
+
+load_dotenv()
+
+# Holds every user's columns, tokens included: stored in CONFIG_SNAPSHOT_DIR, outside the cached CACHE_DIR
+CONFIG_SNAPSHOT = "user_config.json"
+
+# Columns each digest cannot run without
+MORNING_KEYS = [
+    "USER_ID", "PRESENT_LOCATION", "USER_NOTION_TOKEN", "USER_DATABASE_ID",
+    "GPT_VERSION", "TIME_ZONE", "EMAIL_RECEIVER", "EMAIL_TITLE",
+    "USER_CAREER", "SCHEDULE_PROMPT", "USER_NAME",
+]
+NIGHT_KEYS = MORNING_KEYS + ["USER_EVENT_DATABASE_ID"]
+REQUIRED_KEYS = {"morning": MORNING_KEYS, "night": NIGHT_KEYS}
+
+
+def row_fields(result):
+    """Plain-text value of every column in a config row; non-text columns are "MISSING"."""
+    properties = result["properties"]
+    return {
+        key: properties[key]["rich_text"][0]["plain_text"]
+        if properties[key].get("rich_text")
+        else "MISSING"
+        for key in properties
+    }
+
+
+def row_user_id(result):
+    title = result["properties"].get("USER_ID", {}).get("title") or []
+    return title[0]["plain_text"] if title else "MISSING_USER_ID"
+
+
+def parse_tz_offset(value):
+    """(offset hours, warning) for a TIME_ZONE cell; invalid values fall back to UTC."""
+    text = (value or "").strip()
+    if re.match(r"^[+-]?\d+$", text):
+        return int(text), None
+    return 0, f"Invalid TIME_ZONE '{text}', using UTC"
+
+
+@dataclass
+class UserConfig:
+    """One row of the config table, parsed and validated once."""
+    user_id: str
+    fields: Dict[str, str]
+    tz_offset: int
+    stage_models: Dict[str, str]
+    errors: Dict[str, List[str]]
+    warnings: List[str] = field(default_factory=list)
+    last_edited_time: str = ""
+
+    @classmethod
+    def from_fields(cls, user_id, fields, last_edited_time=""):
+        tz_offset, tz_warning = parse_tz_offset(fields.get("TIME_ZONE"))
+        errors = {
+            digest: [f"Missing required key: {key}" for key in keys if key not in fields]
+            for digest, keys in REQUIRED_KEYS.items()
+        }
+        return cls(
+            user_id=user_id,
+            fields=fields,
+            tz_offset=tz_offset,
+            stage_models=resolve_stage_models(fields),
+            errors=errors,
+            warnings=[tz_warning] if tz_warning else [],
+            last_edited_time=last_edited_time,
+        )
+
+    # Dict-style access keeps existing config["USER_NAME"] call sites working
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    @property
+    def tz(self):
+        return pytz.FixedOffset(self.tz_offset * 60)
+
+    def local_time(self, utc_now=None):
+        return (utc_now or datetime.now(pytz.utc)).astimezone(self.tz)
+
+    @property
+    def token_budget(self):
+        """Daily token budget: the DAILY_TOKEN_BUDGET column when it is a number, else the global default."""
+        value = self.fields.get("DAILY_TOKEN_BUDGET", "").strip()
+        return int(value) if value.isdigit() else USER_DAILY_TOKEN_BUDGET
+
+    @property
+    def schedule_page(self):
+        """Notion page the generated schedule is written back to (SCHEDULE_PAGE_ID column), or None."""
+        value = self.fields.get("SCHEDULE_PAGE_ID", "").strip()
+        return value if value and value != "MISSING" else None
+
+    def is_valid(self, digest):
+        return self.user_id != "MISSING_USER_ID" and not self.errors[digest]
+
+
+def _snapshot_rows(results):
+    return {
+        result["id"]: {
+            "user_id": row_user_id(result),
+            "fields": row_fields(result),
+            "last_edited_time": result.get("last_edited_time", ""),
+        }
+        for result in results
+    }
+
+
+def sync_snapshot(notion, database_id, full=False):
+    """Bring the local copy of the config table up to date and return its rows.
+
+    Between full refreshes only rows edited since the last sync are queried, so
+    an unchanged table costs one empty query. Deleted rows are dropped on the
+    next full refresh (every USER_CONFIG_FULL_REFRESH_HOURS).
+    """
+    snapshot = load_json(CONFIG_SNAPSHOT, directory=CONFIG_SNAPSHOT_DIR)
+    started = datetime.now(pytz.utc)
+    stale = (not snapshot or snapshot.get("database_id") != database_id
+             or time.time() - snapshot.get("full_at", 0) > USER_CONFIG_FULL_REFRESH_HOURS * 3600)
+
+    if full or stale:
+        rows = _snapshot_rows(query_database(notion, database_id))
+        snapshot = {"database_id": database_id, "full_at": time.time(), "rows": rows}
+        print(f"🔄 Config snapshot rebuilt ({len(rows)} rows)")
+    else:
+        # last_edited_time has minute precision; step back one minute to stay inclusive
+        since = datetime.fromisoformat(snapshot["synced_at"]) - timedelta(minutes=1)
+        changed = _snapshot_rows(query_database(notion, database_id, filter={
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": since.isoformat()},
+        }))
+        snapshot["rows"].update(changed)
+        print(f"🔄 Config snapshot: {len(changed)} changed rows")
+
+    snapshot["synced_at"] = started.isoformat()
+    save_json(CONFIG_SNAPSHOT, snapshot, directory=CONFIG_SNAPSHOT_DIR)
+    return snapshot["rows"]
+
+
+def load_user_configs(full_refresh=False) -> Dict[str, UserConfig]:
+    """{USER_ID: UserConfig} from the config table, via the incremental snapshot.
+
+    When Notion cannot be reached the last snapshot is used; without one the
+    result is empty and the digest scripts stop with their configuration error.
+    """
+    try:
+        notion = notion_client(os.getenv("ENV_NOTION_TOKEN"))
+        rows = sync_snapshot(notion, os.getenv("ENV_DATABASE_ID"), full=full_refresh)
+    except Exception as e:
+        print(f"❌ Error fetching user data from Notion: {str(e)}")
+        snapshot = load_json(CONFIG_SNAPSHOT, directory=CONFIG_SNAPSHOT_DIR)
+        if not snapshot or snapshot.get("database_id") != os.getenv("ENV_DATABASE_ID"):
+            return {}
+        rows = snapshot["rows"]
+        print(f"↩️ Using the config snapshot synced at {snapshot.get('synced_at')}")
+    configs = {}
+    for row in rows.values():
+        configs[row["user_id"]] = UserConfig.from_fields(row["user_id"], row["fields"], row["last_edited_time"])
+    return configs
+
@@ -0,0 +1,70 @@
+from datetime import timedelta
+import pytz
+from config import TASK_LOOKBACK_DAYS, TASK_LOOKAHEAD_DAYS
+from src.get_notion.models import Event
+from src.get_notion.query import local_window, query_window
+from src.utils.http_pool import notion_client
+
+# The only properties Event.from_notion_row reads
+EVENT_PROPERTIES = ["Name", "Date", "Complete"]
+
+EVENT_BUCKETS = ["in_progress", "tomorrow", "upcoming", "completed"]
+
+
+def classify_events(events, custom_date, include_completed=True):
+    """Sort events into the night digest buckets in a single pass.
+
+    in_progress holds open events that cover today; past open events are dropped.
+    """
+    tomorrow = custom_date + timedelta(days=1)
+    buckets = {name: [] for name in EVENT_BUCKETS}
+    for event in sorted(events, key=lambda e: e.start):
+        start_date = event.start.date()
+        end_date = event.end.date() if event.end else start_date
+        if event.completed:
+            if include_completed and start_date <= custom_date <= end_date:
+                buckets["completed"].append(event)
+        elif start_date <= custom_date <= end_date:
+            buckets["in_progress"].append(event)
+        elif start_date == tomorrow:
+            buckets["tomorrow"].append(event)
+        elif start_date > tomorrow:
+            buckets["upcoming"].append(event)
+    return buckets
+
+
+def fetch_event_from_notion(custom_date, USER_NOTION_TOKEN, USER_EVENT_DATABASE_ID, timezone_offset=8, include_completed=True,
+                            lookback_days=None, lookahead_days=None):
+    """Fetch calendar events on the same windowed, paginated query path as tasks."""
+    notion = notion_client(USER_NOTION_TOKEN)
+    print("\nFetching events from Notion...\n")
+
+    if lookback_days is None:
+        lookback_days = TASK_LOOKBACK_DAYS
+    if lookahead_days is None:
+        lookahead_days = TASK_LOOKAHEAD_DAYS
+
+    try:
+        user_tz = pytz.FixedOffset(timezone_offset * 60)
+        window_start, window_end = local_window(custom_date, user_tz, lookback_days, lookahead_days)
+        results = query_window(notion, USER_EVENT_DATABASE_ID, EVENT_PROPERTIES, window_start, window_end,
+                               exclude_completed=not include_completed)
+
+        events = []
+        for row in results:
+            try:
+                event = Event.from_notion_row(row, user_tz)
+                if event is None:
+                    print("Skipping event: No date property")
+                    continue
+                events.append(event)
+
+            except Exception as e:
+                print(f"Skipping event due to error: {str(e)}")
+                continue
+
+        return classify_events(events, custom_date, include_completed)
+
+    except Exception as e:
+        print(f"Event Error: {str(e)}")
+        return {k: [] for k in EVENT_BUCKETS}
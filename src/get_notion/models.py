@@ -0,0 +1,232 @@
+from dataclasses import dataclass
+from datetime import datetime
+from enum import IntEnum, IntFlag
+from html import escape
+from typing import Optional
+
+
+class Priority(IntEnum):
+    NA = 0
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+
+    @classmethod
+    def from_label(cls, label):
+        """Map a Notion select name ("High", "高", ...) to a Priority; unknown labels are NA."""
+        return _PRIORITY_LABELS.get((label or "").strip().lower(), cls.NA)
+
+    @property
+    def label(self):
+        return self.name.capitalize() if self is not Priority.NA else "NA"
+
+
+_PRIORITY_LABELS = {
+    "high": Priority.HIGH, "高": Priority.HIGH,
+    "medium": Priority.MEDIUM, "中": Priority.MEDIUM,
+    "low": Priority.LOW, "低": Priority.LOW,
+}
+
+
+class TaskFlag(IntFlag):
+    NONE = 0
+    ETA = 1
+    COMPLETED = 2
+
+
+def parse_notion_datetime(value, tz):
+    """Parse a Notion ISO date/datetime once into an aware datetime in tz."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        # Date-only values ("2025-03-10") are local midnight in the user's zone
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed.astimezone(tz)
+
+
+def _title(properties, key='Name'):
+    return ''.join(
+        t.get('text', {}).get('content', '')
+        for t in properties.get(key, {}).get('title', [])
+    ).strip()
+
+
+def _format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else 'N/A'
+
+
+@dataclass
+class Task:
+    """One Notion task row, parsed once: aware datetimes, enum priority and bit flags."""
+    __slots__ = ("page_id", "name", "type", "start", "end", "priority", "remaining_days",
+                 "flags", "last_edited_time", "description")
+
+    page_id: str
+    name: str
+    type: str
+    start: datetime
+    end: Optional[datetime]
+    priority: Priority
+    remaining_days: Optional[float]
+    flags: TaskFlag
+    last_edited_time: str
+    description: str  # page body text; filled by page_content.attach_descriptions
+
+    @classmethod
+    def from_notion_row(cls, row, tz):
+        """Build a Task from a databases.query result; returns None when it has no Date."""
+        props = row.get('properties', {})
+        date_prop = props.get('Date', {}).get('date') or {}
+        if not date_prop.get('start'):
+            return None
+        flags = TaskFlag.NONE
+        if props.get('# ETA', {}).get('checkbox', False):
+            flags |= TaskFlag.ETA
+        if props.get('Complete', {}).get('checkbox', False):
+            flags |= TaskFlag.COMPLETED
+        return cls(
+            page_id=row.get('id', ''),
+            name=_title(props) or "Untitled",
+            type=(props.get('Type', {}).get('select') or {}).get('name', 'Task'),
+            start=parse_notion_datetime(date_prop['start'], tz),
+            end=parse_notion_datetime(date_prop.get('end'), tz),
+            priority=Priority.from_label((props.get('Priority', {}).get('select') or {}).get('name')),
+            remaining_days=props.get('剩余天数', {}).get('number'),
+            flags=flags,
+            last_edited_time=row.get('last_edited_time', ''),
+            description='',
+        )
+
+    @classmethod
+    def from_dict(cls, data, tz=None):
+        """Build a Task from the legacy dict shape (Name, Start, End, Priority, ...), e.g. fixtures."""
+        flags = TaskFlag.NONE
+        if data.get('ETA'):
+            flags |= TaskFlag.ETA
+        if data.get('Completed'):
+            flags |= TaskFlag.COMPLETED
+        start = data.get('Start')
+        end = data.get('End')
+        return cls(
+            page_id=data.get('id', ''),
+            name=data.get('Name', 'Untitled'),
+            type=data.get('Type', 'Task'),
+            start=datetime.strptime(start, '%Y-%m-%d %H:%M').replace(tzinfo=tz) if start else None,
+            end=datetime.strptime(end, '%Y-%m-%d %H:%M').replace(tzinfo=tz) if end and end != 'N/A' else None,
+            priority=Priority.from_label(data.get('Priority')),
+            remaining_days=data.get('RemainingDays'),
+            flags=flags,
+            last_edited_time=data.get('last_edited_time', ''),
+            description=data.get('Description', ''),
+        )
+
+    @property
+    def eta(self):
+        return bool(self.flags & TaskFlag.ETA)
+
+    @property
+    def completed(self):
+        return bool(self.flags & TaskFlag.COMPLETED)
+
+    def to_dict(self):
+        """The legacy dict shape produced by fetch_tasks_from_notion before Task existed."""
+        return {
+            'Name': self.name,
+            'Type': self.type,
+            'Start': _format_time(self.start),
+            'End': _format_time(self.end),
+            'Priority': self.priority.label,
+            'RemainingDays': self.remaining_days,
+            'ETA': self.eta,
+            'Completed': self.completed,
+            'Description': self.description,
+        }
+
+    def to_prompt(self):
+        """Compact one-line form for prompts, plus an indented description line when the body was fetched."""
+        days = f", {self.remaining_days:g} days left" if self.remaining_days is not None else ""
+        when = f" {_format_time(self.start)}" if self.start else ""
+        if self.end:
+            when += f" → {_format_time(self.end)}"
+        line = (f"- {self.name} [{self.type}, Priority: {self.priority.label}{days}, "
+                f"ETA: {'✅' if self.eta else '⚠️'}]{when}")
+        return f"{line}\n  Description: {self.description}" if self.description else line
+
+    def to_html(self):
+        """<li> matching the priority-task markup of the morning briefing."""
+        eta = '✅ On Track' if self.eta else '⚠️ Needs Attention'
+        days = self.remaining_days if self.remaining_days is not None else 'N/A'
+        return (f'<li class="priority-{self.priority.label.lower()}"><h3>{escape(self.name)}</h3>'
+                f'<div class="task-meta"><span class="eta">{eta}</span>'
+                f'<span class="days-remaining">{days} days remaining</span></div>'
+                + (f'<p class="task-desc">{escape(self.description)}</p>' if self.description else '')
+                + '</li>')
+
+
+@dataclass
+class Event:
+    """One Notion calendar event row, parsed once."""
+    __slots__ = ("page_id", "name", "start", "end", "flags", "last_edited_time")
+
+    page_id: str
+    name: str
+    start: datetime
+    end: Optional[datetime]
+    flags: TaskFlag
+    last_edited_time: str
+
+    @classmethod
+    def from_notion_row(cls, row, tz):
+        props = row.get('properties', {})
+        date_prop = props.get('Date', {}).get('date') or {}
+        if not date_prop.get('start'):
+            return None
+        return cls(
+            page_id=row.get('id', ''),
+            name=_title(props) or "Untitled",
+            start=parse_notion_datetime(date_prop['start'], tz),
+            end=parse_notion_datetime(date_prop.get('end'), tz),
+            flags=TaskFlag.COMPLETED if props.get('Complete', {}).get('checkbox', False) else TaskFlag.NONE,
+            last_edited_time=row.get('last_edited_time', ''),
+        )
+
+    @classmethod
+    def from_dict(cls, data, tz=None):
+        start = data.get('Start')
+        end = data.get('End')
+        return cls(
+            page_id=data.get('id', ''),
+            name=data.get('Name', 'Untitled'),
+            start=datetime.strptime(start, '%Y-%m-%d %H:%M').replace(tzinfo=tz) if start else None,
+            end=datetime.strptime(end, '%Y-%m-%d %H:%M').replace(tzinfo=tz) if end and end != 'N/A' else None,
+            flags=TaskFlag.COMPLETED if data.get('Completed') else TaskFlag.NONE,
+            last_edited_time=data.get('last_edited_time', ''),
+        )
+
+    @property
+    def completed(self):
+        return bool(self.flags & TaskFlag.COMPLETED)
+
+    def to_dict(self):
+        return {
+            'Name': self.name,
+            'Start': _format_time(self.start),
+            'End': _format_time(self.end),
+            'Completed': self.completed,
+        }
+
+    def to_prompt(self):
+        end = f" → {_format_time(self.end)}" if self.end else ""
+        return f"- {self.name}: {_format_time(self.start)}{end}"
+
+    def to_html(self):
+        return (f'<li class="timeline-item"><div class="timeline-time">{_format_time(self.start)}</div>'
+                f'<div class="timeline-content"><h3 class="timeline-title">{escape(self.name)}</h3></div></li>')
+
+
+def format_items(items, empty="无"):
+    """Serialise a bucket of Task/Event objects for a prompt, one line each."""
+    if not items:
+        return empty
+    return "\n".join(item.to_prompt() for item in items)
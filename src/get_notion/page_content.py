@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import PAGE_BODY_BLOCKS, PAGE_FETCH_WORKERS
+from src.utils.cache import load_json, save_json
+from src.utils.http_pool import notion_client
+
+PAGE_CACHE = "page_bodies.json"
+MAX_DESCRIPTION_CHARS = 500
+_page_cache_lock = threading.Lock()
+
+# Block types whose text lives in block[type]["rich_text"]
+TEXT_BLOCKS = {
+    "paragraph", "heading_1", "heading_2", "heading_3", "bulleted_list_item",
+    "numbered_list_item", "to_do", "toggle", "quote", "callout", "code",
+}
+
+
+def block_text(block):
+    block_type = block.get("type")
+    if block_type not in TEXT_BLOCKS:
+        return ""
+    return "".join(t.get("plain_text", "") for t in block.get(block_type, {}).get("rich_text", [])).strip()
+
+
+def fetch_page_text(notion, page_id, max_blocks=None):
+    """Plain text of the first max_blocks top-level blocks of a page, one line per block."""
+    response = notion.blocks.children.list(block_id=page_id, page_size=max_blocks or PAGE_BODY_BLOCKS)
+    lines = [text for text in (block_text(block) for block in response.get("results", [])) if text]
+    return " / ".join(lines)[:MAX_DESCRIPTION_CHARS]
+
+
+def attach_descriptions(notion_token, tasks, max_blocks=None, workers=None):
+    """Fill task.description from each page body, at most `workers` requests in flight.
+
+    Bodies are cached by page id and last_edited_time, so a page is only
+    downloaded again after it was edited.
+    """
+    with _page_cache_lock:
+        cache = load_json(PAGE_CACHE, {})
+    todo = {}
+    for task in tasks:
+        cached = cache.get(task.page_id)
+        if cached and cached["edited"] == task.last_edited_time:
+            task.description = cached["text"]
+        elif task.page_id:
+            todo.setdefault(task.page_id, []).append(task)
+
+    if todo:
+        notion = notion_client(notion_token)
+
+        def fetch(page_id):
+            try:
+                return page_id, fetch_page_text(notion, page_id, max_blocks)
+            except Exception as e:
+                print(f"Skipping page body {page_id}: {str(e)}")
+                return page_id, None
+
+        fetched = {}
+        with ThreadPoolExecutor(max_workers=workers or PAGE_FETCH_WORKERS) as pool:
+            for page_id, text in pool.map(fetch, todo):
+                if text is None:
+                    continue
+                for task in todo[page_id]:
+                    task.description = text
+                fetched[page_id] = {"edited": todo[page_id][0].last_edited_time, "text": text}
+        # Re-read under the lock: other users' workers may have saved their pages meanwhile
+        with _page_cache_lock:
+            cache = load_json(PAGE_CACHE, {})
+            cache.update(fetched)
+            save_json(PAGE_CACHE, cache)
+
+    print(f"📄 Page bodies: {len(tasks) - sum(map(len, todo.values()))} cached, {len(todo)} fetched")
+    return tasks
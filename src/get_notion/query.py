@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import pytz
+from src.utils.cache import load_json, save_json
+
+SCHEMA_CACHE = "notion_property_ids.json"
+
+
+def date_window_filter(start_utc, end_utc, property_name="Date"):
+    """Rows whose date falls in [start_utc, end_utc)."""
+    return {
+        "property": property_name,
+        "date": {
+            "on_or_after": start_utc.isoformat(),
+            "before": end_utc.isoformat()
+        }
+    }
+
+
+def checkbox_filter(property_name, value):
+    return {"property": property_name, "checkbox": {"equals": value}}
+
+
+def compound_filter(*conditions):
+    """AND the given conditions, dropping empty ones; a single condition is returned as is."""
+    conditions = [c for c in conditions if c]
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"and": conditions}
+
+
+def property_ids(database, names):
+    """Map property names to the ids filter_properties expects, skipping ones the schema lacks."""
+    schema = database.get("properties", {})
+    missing = [name for name in names if name not in schema]
+    if missing:
+        print(f"⚠️ Database is missing properties: {missing}")
+    return {name: schema[name]["id"] for name in names if name in schema}
+
+
+def cached_property_ids(notion, database_id, names, refresh=False):
+    """property_ids() backed by a local cache, so a fetch costs one query instead of retrieve + query.
+
+    Pass refresh=True to re-read the schema, e.g. after a query rejected a stale id.
+    """
+    cache = load_json(SCHEMA_CACHE, {})
+    key = f"{database_id}:{','.join(names)}"
+    if refresh or key not in cache:
+        cache[key] = property_ids(notion.databases.retrieve(database_id), names)
+        save_json(SCHEMA_CACHE, cache)
+    return cache[key]
+
+
+def query_database(notion, database_id, filter=None, filter_properties=None, page_size=100):
+    """Run databases.query with the filter pushed to Notion, following pagination.
+
+    filter_properties limits each returned page to the listed property ids, which
+    keeps payloads (and JSON decoding) proportional to what the caller reads.
+    """
+    kwargs = {"database_id": database_id, "page_size": page_size}
+    if filter:
+        kwargs["filter"] = filter
+    if filter_properties:
+        kwargs["filter_properties"] = list(filter_properties)
+
+    results = []
+    while True:
+        response = notion.databases.query(**kwargs)
+        results.extend(response.get("results", []))
+        if not response.get("has_more"):
+            return results
+        kwargs["start_cursor"] = response["next_cursor"]
+
+
+def local_window(custom_date, user_tz, lookback_days, lookahead_days):
+    """UTC bounds of the local day widened by lookback_days before and lookahead_days after."""
+    today_start = datetime.combine(custom_date, datetime.min.time()).replace(tzinfo=user_tz)
+    window_start = today_start - timedelta(days=lookback_days)
+    window_end = today_start + timedelta(days=1 + lookahead_days)
+    return window_start.astimezone(pytz.utc), window_end.astimezone(pytz.utc)
+
+
+def query_window(notion, database_id, properties, window_start_utc, window_end_utc, exclude_completed=False):
+    """One paginated, projected query for every row dated inside the window.
+
+    Completed rows are filtered by Notion when exclude_completed is set and the
+    database has a Complete checkbox.
+    """
+    def run(refresh_schema=False):
+        projection = cached_property_ids(notion, database_id, properties, refresh=refresh_schema)
+        push_complete = exclude_completed and "Complete" in projection
+        return query_database(
+            notion,
+            database_id,
+            filter=compound_filter(
+                date_window_filter(window_start_utc, window_end_utc),
+                checkbox_filter("Complete", False) if push_complete else None
+            ),
+            filter_properties=projection.values()
+        )
+
+    try:
+        return run()
+    except Exception as e:
+        # A renamed or recreated property invalidates the cached ids; re-read the schema once
+        print(f"Retrying query with a fresh schema: {str(e)}")
+        return run(refresh_schema=True)
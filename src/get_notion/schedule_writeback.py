@@ -0,0 +1,202 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import List
+from src.utils.cache import load_json, save_json
+from src.utils.http_pool import notion_client
+from src.utils.rate_limit import limited, notion_limiter
+
+WRITEBACK_CACHE = "schedule_writeback.json"
+APPEND_BATCH = 100  # Notion's limit for children in one blocks.children.append
+MAX_TEXT_CHARS = 2000  # Notion's limit for one rich_text content
+RETENTION_DAYS = 30
+_writeback_lock = threading.Lock()
+
+# Timeline classes the digests' HTML skeletons use, and the item field each fills
+FIELD_CLASSES = {"timeline-time": "time", "timeline-title": "title", "task-label": "label", "timeline-desc": "desc"}
+VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "wbr"}
+DONE_LABELS = {"已完成", "done", "completed"}
+# Tags that hold one line of the morning's free-form schedule
+FREE_ITEM_TAGS = {"li", "p"}
+# "08:00 - 09:30 Deep work" style lines in the morning's free-form schedule
+TIME_PREFIX = re.compile(r"^\s*(\d{1,2}[:：]\d{2}(?:\s*[-–~至]\s*\d{1,2}[:：]\d{2})?)\s*[:：\-–]?\s*(.+)$", re.S)
+
+
+@dataclass
+class ScheduleItem:
+    section: str
+    time: str
+    title: str
+    label: str = ""
+    desc: str = ""
+
+    @property
+    def done(self):
+        return self.label.strip().lower() in DONE_LABELS
+
+    def text(self):
+        text = " ".join(part for part in (self.time, self.title) if part)
+        if self.desc:
+            text += f" — {self.desc}"
+        return text[:MAX_TEXT_CHARS]
+
+    def content_hash(self):
+        payload = [self.section, self.time, self.title, self.desc, self.done]
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()[:16]
+
+    def to_block(self):
+        return {
+            "object": "block",
+            "type": "to_do",
+            "to_do": {"rich_text": [{"type": "text", "text": {"content": self.text()}}], "checked": self.done},
+        }
+
+
+def _clean(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class _TimelineParser(HTMLParser):
+    """Collects timeline-item entries (night sections) and the <li>/<p> lines of the morning's recommended schedule.
+
+    The morning skeleton only fixes div.schedule-recommendations > div.ai-analysis;
+    what the model writes inside is free-form, so any list item or paragraph
+    there is a line. Each item is labelled with the <h2> heading it follows.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.items = []
+        self._stack = []  # (tag, classes)
+        self._section = []
+        self._item = None
+
+    def _inside(self, cls):
+        return any(cls in classes for _, classes in self._stack)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self.handle_data(" ")
+            return
+        classes = set((dict(attrs).get("class") or "").split())
+        if tag == "h2":
+            self._section = []
+        if "timeline-item" in classes or (tag in FREE_ITEM_TAGS and self._item is None
+                                          and self._inside("schedule-recommendations")):
+            self._item = {"field": {}, "free": "timeline-item" not in classes, "depth": len(self._stack)}
+        self._stack.append((tag, classes))
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return  # stray closing tag from model output
+        while self._stack:
+            open_tag, _ = self._stack.pop()
+            if open_tag == tag:
+                break
+        if self._item is not None and len(self._stack) <= self._item["depth"]:
+            self._finish_item()
+
+    def handle_data(self, data):
+        if any(open_tag == "h2" for open_tag, _ in self._stack):
+            self._section.append(data)
+        if self._item is None:
+            return
+        field = "title" if self._item["free"] else None
+        for _, classes in reversed(self._stack):
+            found = next((FIELD_CLASSES[cls] for cls in classes if cls in FIELD_CLASSES), None)
+            if found:
+                field = found
+                break
+        if field:
+            self._item["field"].setdefault(field, []).append(data)
+
+    def _finish_item(self):
+        fields = {name: _clean("".join(parts)) for name, parts in self._item.pop("field").items()}
+        when, title = fields.get("time", ""), fields.get("title", "")
+        if self._item["free"]:
+            match = TIME_PREFIX.match(title)
+            when, title = (match.group(1), _clean(match.group(2))) if match else ("", title)
+        if title:
+            self.items.append(ScheduleItem(_clean("".join(self._section)), when, title,
+                                           fields.get("label", ""), fields.get("desc", "")))
+        self._item = None
+
+
+def parse_schedule(html) -> List[ScheduleItem]:
+    """Structured items from a generated digest: every timeline entry, or the morning's schedule lines."""
+    parser = _TimelineParser()
+    parser.feed(html or "")
+    parser.close()
+    return parser.items
+
+
+def _heading_block(title):
+    return {
+        "object": "block",
+        "type": "heading_3",
+        "heading_3": {"rich_text": [{"type": "text", "text": {"content": title[:MAX_TEXT_CHARS]}}],
+                      "is_toggleable": True},
+    }
+
+
+def write_schedule(notion_token, page_id, key, heading, html):
+    """Mirror the schedule in a digest onto a Notion page with as few API calls as possible.
+
+    Each digest gets one toggle heading on the page; its items are appended under
+    it as to-do blocks, APPEND_BATCH per request. Items are hashed by content:
+    on a re-run (worker trigger, precompute then send) unchanged items are
+    skipped, new ones appended and ones no longer in the digest archived.
+    Returns (appended, archived, unchanged).
+    """
+    items = list({item.content_hash(): item for item in parse_schedule(html)}.items())
+    if not items:
+        return 0, 0, 0
+
+    notion = notion_client(notion_token)
+    bucket = notion_limiter(notion_token)
+    cache_key = f"{page_id}:{key}"
+    with _writeback_lock:
+        entry = dict(load_json(WRITEBACK_CACHE, {}).get(cache_key) or {"heading": None, "blocks": {}})
+
+    wanted = dict(items)
+    new = [(digest, item) for digest, item in items if digest not in entry["blocks"]]
+    stale = [digest for digest in entry["blocks"] if digest not in wanted]
+    if not new and not stale:
+        print(f"🗂️ Notion schedule unchanged ({len(items)} items)")
+        return 0, 0, len(items)
+
+    blocks = entry["blocks"] = dict(entry["blocks"])
+    try:
+        for digest in stale:
+            limited(bucket, notion.blocks.delete, block_id=blocks[digest])
+            del blocks[digest]
+
+        if new and entry["heading"] is None:
+            response = limited(bucket, notion.blocks.children.append, block_id=page_id,
+                               children=[_heading_block(heading)])
+            entry["heading"] = response["results"][0]["id"]
+        for start in range(0, len(new), APPEND_BATCH):
+            batch = new[start:start + APPEND_BATCH]
+            response = limited(bucket, notion.blocks.children.append, block_id=entry["heading"],
+                               children=[item.to_block() for _, item in batch])
+            for (digest, _), block in zip(batch, response["results"]):
+                blocks[digest] = block["id"]
+    finally:
+        # Whatever reached Notion is remembered, so a failed run is not duplicated by the next one
+        _save_entry(cache_key, entry)
+    print(f"🗂️ Notion schedule: {len(new)} appended, {len(stale)} archived, {len(items) - len(new)} unchanged")
+    return len(new), len(stale), len(items) - len(new)
+
+
+def _save_entry(cache_key, entry):
+    entry["saved"] = time.time()
+    with _writeback_lock:
+        cache = load_json(WRITEBACK_CACHE, {})
+        cache = {k: v for k, v in cache.items() if time.time() - v.get("saved", 0) < RETENTION_DAYS * 86400}
+        cache[cache_key] = entry
+        save_json(WRITEBACK_CACHE, cache)
@@ -1,100 +1,79 @@
-from notion_client import Client
-from datetime import datetime, timedelta
+from datetime import timedelta
 import pytz
-import json
-
-def fetch_tasks_from_notion(custom_date, USER_NOTION_TOKEN, USER_DATABASE_ID, timezone_offset=8, include_completed=False):
-    notion = Client(auth=USER_NOTION_TOKEN)
+from config import TASK_LOOKBACK_DAYS, TASK_LOOKAHEAD_DAYS
+from src.get_notion.models import Task
+from src.get_notion.query import local_window, query_window
+from src.utils.http_pool import notion_client
+
+# The only properties Task.from_notion_row reads; everything else is left on the server
+TASK_PROPERTIES = ["Name", "Date", "Priority", "Type", "剩余天数", "# ETA", "Complete"]
+
+TASK_BUCKETS = ["today_due", "in_progress", "future", "tomorrow", "upcoming", "completed", "all_completed"]
+
+
+def classify_tasks(tasks, custom_date, include_completed=False):
+    """Sort tasks into every digest bucket in a single pass.
+
+    future is tomorrow + upcoming (starting the day after tomorrow or later);
+    completed only holds tasks dated today, all_completed every completed task
+    in the window (for the task history, which also counts early and late ones).
+    """
+    tomorrow = custom_date + timedelta(days=1)
+    buckets = {name: [] for name in TASK_BUCKETS}
+    for task in tasks:
+        start_date = task.start.date()
+        end_date = task.end.date() if task.end else None
+        if task.completed:
+            if include_completed:
+                buckets["all_completed"].append(task)
+                if (end_date or start_date) == custom_date:
+                    buckets["completed"].append(task)
+        elif end_date == custom_date:
+            buckets["today_due"].append(task)
+        elif start_date <= custom_date:
+            buckets["in_progress"].append(task)
+        else:
+            buckets["future"].append(task)
+            buckets["tomorrow" if start_date == tomorrow else "upcoming"].append(task)
+    return buckets
+
+
+def fetch_tasks_from_notion(custom_date, USER_NOTION_TOKEN, USER_DATABASE_ID, timezone_offset=8, include_completed=False,
+                            lookback_days=None, lookahead_days=None):
+    """Fetch every task in the look-back/look-ahead window with one paginated query and classify it."""
+    notion = notion_client(USER_NOTION_TOKEN)
     print("\nFetching tasks from Notion...\n")
 
-    try:
-        # Debug database schema
-        db = notion.databases.retrieve(USER_DATABASE_ID)
-        print("Task Database Properties:", json.dumps(db.get('properties', {}), indent=2))
+    if lookback_days is None:
+        lookback_days = TASK_LOOKBACK_DAYS
+    if lookahead_days is None:
+        lookahead_days = TASK_LOOKAHEAD_DAYS
 
+    try:
         # Timezone handling
         user_tz = pytz.FixedOffset(timezone_offset * 60)
-        utc = pytz.utc
-
-        # Date range calculation
-        today_start = datetime.combine(custom_date, datetime.min.time()).replace(tzinfo=user_tz)
-        today_end = today_start + timedelta(days=1)
-
-        # Convert to UTC for Notion query
-        today_start_utc = today_start.astimezone(utc)
-        today_end_utc = today_end.astimezone(utc)
-
-        # Query with UTC dates
-        results = notion.databases.query(
-            database_id=USER_DATABASE_ID,
-            filter={
-                "property": "Date",
-                "date": {
-                    "on_or_after": today_start_utc.isoformat(),
-                    "before": today_end_utc.isoformat()
-                }
-            }
-        )
 
-        tasks = {"today_due": [], "in_progress": [], "future": [], "completed": []}
+        # Query the local day widened by the configured window
+        window_start, window_end = local_window(custom_date, user_tz, lookback_days, lookahead_days)
+        results = query_window(notion, USER_DATABASE_ID, TASK_PROPERTIES, window_start, window_end,
+                               exclude_completed=not include_completed)
 
-        for row in results.get("results", []):
+        tasks = []
+        for row in results:
             try:
-                # Extract date property
-                date_prop = row.get('properties', {}).get('Date', {}).get('date', {})
-                if not date_prop:
+                # Parse dates, priority and flags once into a Task
+                task = Task.from_notion_row(row, user_tz)
+                if task is None:
                     print("Skipping task: No date property")
                     continue
-
-                # Parse start and end dates with UTC conversion
-                start_utc = datetime.fromisoformat(date_prop['start'].replace('Z', '+00:00')).astimezone(utc)
-                end_utc = datetime.fromisoformat(date_prop['end'].replace('Z', '+00:00')).astimezone(utc) if date_prop.get('end') else None
-
-                # Convert to user timezone
-                start_local = start_utc.astimezone(user_tz)
-                end_local = end_utc.astimezone(user_tz) if end_utc else None
-
-                # Extract other properties safely
-                priority = row.get('properties', {}).get('Priority', {}).get('select', {}).get('name', 'NA')
-                task_type = row.get('properties', {}).get('Type', {}).get('select', {}).get('name', 'Task')
-                remaining_days = row.get('properties', {}).get('剩余天数', {}).get('number', None)
-                eta = row.get('properties', {}).get('# ETA', {}).get('checkbox', False)
-
-                # Fix: Correct task name extraction
-                name = ''.join(
-                    t.get('text', {}).get('content', '') 
-                    for t in row.get('properties', {}).get('Name', {}).get('title', [])
-                ).strip()
-
-                task = {
-                    'Name': name or "Untitled",
-                    'Type': task_type,
-                    'Start': start_local.strftime('%Y-%m-%d %H:%M'),
-                    'End': end_local.strftime('%Y-%m-%d %H:%M') if end_local else 'N/A',
-                    'Priority': priority,
-                    'RemainingDays': remaining_days,
-                    'ETA': eta,
-                    'Completed': row.get('properties', {}).get('Complete', {}).get('checkbox', False)
-                }
-
-                # Classification logic
-                if task['Completed']:
-                    if include_completed:
-                        tasks["completed"].append(task)
-                else:
-                    if end_local and end_local.date() == custom_date:
-                        tasks["today_due"].append(task)
-                    elif start_local.date() <= custom_date:
-                        tasks["in_progress"].append(task)
-                    elif start_local.date() > custom_date:
-                        tasks["future"].append(task)
+                tasks.append(task)
 
             except Exception as e:
                 print(f"Skipping task due to error: {str(e)}")
                 continue
 
-        return tasks
+        return classify_tasks(tasks, custom_date, include_completed)
 
     except Exception as e:
         print(f"Task Error: {str(e)}")
-        return {k: [] for k in ["today_due", "in_progress", "future", "completed"]}
\ No newline at end of file
+        return {k: [] for k in TASK_BUCKETS}
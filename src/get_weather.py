@@ -1,39 +1,284 @@
 # src/get_weather.py
 import os
-import requests
+import re
+import threading
+import time
+from collections import Counter
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
+from config import WEATHER_MODE, WEATHER_CACHE_TTL_HOURS, OPENWEATHER_API_BASE, HTTP_TIMEOUT
+from src.utils import http_pool
+from src.utils.cache import load_json, save_json
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_weather_forecast(location: str, tz_offset: int) -> dict:
-    """Get structured weather data with error handling"""
+CURRENT_URL = f"{OPENWEATHER_API_BASE}/weather"
+FORECAST_URL = f"{OPENWEATHER_API_BASE}/forecast"
+GROUP_URL = f"{OPENWEATHER_API_BASE}/group"
+GROUP_LIMIT = 20  # city ids per /group request
+
+LOCATIONS_CACHE = "weather/locations.json"
+
+# Current conditions seen during this run, keyed by city id
+_current_by_city = {}
+_locations_lock = threading.Lock()
+
+
+def _api_key():
     OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-    
     if not OPENWEATHER_API_KEY:
         raise ValueError("OpenWeather API key not found in environment variables")
+    return OPENWEATHER_API_KEY
+
+
+def _params(**params):
+    return dict(params, appid=_api_key(), units="metric")
+
+
+def _get_json(url, params):
+    """GET over the shared keep-alive session."""
+    response = http_pool.session().get(url, params=params, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+async def _get_json_async(url, params):
+    """GET over the shared async connection pool."""
+    response = await http_pool.async_client().get(url, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def normalize_location(location: str) -> str:
+    """Spelling-insensitive key: "  New York ,US" and "new york, us" share one entry."""
+    text = re.sub(r"\s+", " ", (location or "").strip().casefold())
+    return re.sub(r"\s*,\s*", ",", text)
+
+
+def _current_from_payload(data: dict) -> dict:
+    return {
+        "temp": data["main"]["temp"],
+        "feels_like": data["main"]["feels_like"],
+        "description": data["weather"][0]["description"],
+        "humidity": data["main"]["humidity"],
+        "wind_speed": data["wind"]["speed"]
+    }
+
+
+def _cached_location(location):
+    with _locations_lock:
+        return load_json(LOCATIONS_CACHE, {}).get(normalize_location(location))
+
+
+def _remember_location(location, data):
+    resolved = {
+        "id": data["id"],
+        "name": data.get("name", location),
+        "lat": data["coord"]["lat"],
+        "lon": data["coord"]["lon"],
+    }
+    # The lookup already carries current conditions; keep them for this run
+    _current_by_city[resolved["id"]] = _current_from_payload(data)
+
+    with _locations_lock:
+        locations = load_json(LOCATIONS_CACHE, {})
+        locations[normalize_location(location)] = resolved
+        save_json(LOCATIONS_CACHE, locations)
+    return resolved
+
+
+def resolve_location(location: str) -> dict:
+    """Map a PRESENT_LOCATION string to OpenWeather's canonical city id and coordinates.
+
+    Resolved once with a /weather lookup and kept in the local cache, so later
+    runs never geocode the same free-text name again.
+    """
+    return _cached_location(location) or _remember_location(
+        location, _get_json(CURRENT_URL, _params(q=location.strip())))
+
+
+async def resolve_location_async(location: str) -> dict:
+    return _cached_location(location) or _remember_location(
+        location, await _get_json_async(CURRENT_URL, _params(q=location.strip())))
+
+
+def get_current_weather_bulk(city_ids) -> dict:
+    """Current conditions for many cities via /group, GROUP_LIMIT ids per request."""
+    city_ids = sorted(set(city_ids))
+    results = {}
+    for i in range(0, len(city_ids), GROUP_LIMIT):
+        chunk = city_ids[i:i + GROUP_LIMIT]
+        data = _get_json(GROUP_URL, _params(id=",".join(str(city_id) for city_id in chunk)))
+        for item in data.get("list", []):
+            results[item["id"]] = _current_from_payload(item)
+    return results
+
+
+def prefetch_weather(locations) -> None:
+    """Resolve every distinct location once and warm the weather caches for the run.
+
+    Current mode costs one /group request per GROUP_LIMIT distinct cities.
+    Forecast mode costs one forecast per distinct city id (the endpoint has no
+    bulk variant), shared by every user in that city and by the next run.
+    """
+    city_ids = set()
+    for location in {loc for loc in locations if loc and loc != "MISSING"}:
+        try:
+            city_ids.add(resolve_location(location)["id"])
+        except Exception as e:
+            print(f"\n⚠️ Could not resolve location '{location}': {str(e)}")
+
+    try:
+        if WEATHER_MODE == "current":
+            _current_by_city.update(get_current_weather_bulk(city_ids - set(_current_by_city)))
+        else:
+            for city_id in city_ids:
+                fetch_forecast_slots(city_id)
+    except Exception as e:
+        print(f"\n⚠️ Weather prefetch error: {str(e)}")
+    print(f"🌤️ Weather ready for {len(city_ids)} distinct cities")
+
+
+def get_current_weather(location: str) -> dict:
+    """Current conditions only (/data/2.5/weather)"""
+    try:
+        city_id = resolve_location(location)["id"]
+        if city_id not in _current_by_city:
+            _current_by_city[city_id] = _current_from_payload(_get_json(CURRENT_URL, _params(id=city_id)))
+        return _current_by_city[city_id]
+
+    except Exception as e:
+        print(f"\n⚠️ Weather API error: {str(e)}")
+        return {}
+
+
+async def get_current_weather_async(location: str) -> dict:
+    try:
+        city_id = (await resolve_location_async(location))["id"]
+        if city_id not in _current_by_city:
+            _current_by_city[city_id] = _current_from_payload(
+                await _get_json_async(CURRENT_URL, _params(id=city_id)))
+        return _current_by_city[city_id]
+
+    except Exception as e:
+        print(f"\n⚠️ Weather API error: {str(e)}")
+        return {}
+
+
+def _forecast_cache_name(city_id):
+    return f"weather/forecast_{city_id}.json"
+
+
+def _cached_forecast(city_id):
+    cached = load_json(_forecast_cache_name(city_id))
+    if cached and time.time() - cached.get("fetched_at", 0) < WEATHER_CACHE_TTL_HOURS * 3600:
+        return cached["list"]
+    return None
+
+
+def _store_forecast(city_id, data):
+    slots = data.get("list", [])
+    save_json(_forecast_cache_name(city_id), {"fetched_at": time.time(), "list": slots})
+    return slots
+
+
+def fetch_forecast_slots(city_id: int) -> list:
+    """Raw 3-hour slots from /data/2.5/forecast, shared through the local cache.
+
+    Keyed by city id, so every spelling of a location and both the morning and
+    night runs reuse one stored response while it is younger than
+    WEATHER_CACHE_TTL_HOURS.
+    """
+    slots = _cached_forecast(city_id)
+    if slots is None:
+        slots = _store_forecast(city_id, _get_json(FORECAST_URL, _params(id=city_id)))
+    return slots
+
+
+async def fetch_forecast_slots_async(city_id: int) -> list:
+    slots = _cached_forecast(city_id)
+    if slots is None:
+        slots = _store_forecast(city_id, await _get_json_async(FORECAST_URL, _params(id=city_id)))
+    return slots
 
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "q": location,
-        "appid": OPENWEATHER_API_KEY,
-        "units": "metric"
+
+def summarize_slots(slots: list) -> dict:
+    """Aggregate 3-hour slots of one local day into a daily summary."""
+    if not slots:
+        return {}
+    winds = [max(s.get("wind", {}).get("speed", 0), s.get("wind", {}).get("gust", 0)) for s in slots]
+    descriptions = Counter(s["weather"][0]["description"] for s in slots if s.get("weather"))
+    first = slots[0]
+    return {
+        "temp": first["main"]["temp"],
+        "feels_like": first["main"].get("feels_like"),
+        "temp_min": min(s["main"].get("temp_min", s["main"]["temp"]) for s in slots),
+        "temp_max": max(s["main"].get("temp_max", s["main"]["temp"]) for s in slots),
+        "description": descriptions.most_common(1)[0][0] if descriptions else "No data",
+        "humidity": round(sum(s["main"]["humidity"] for s in slots) / len(slots)),
+        "wind_speed": first.get("wind", {}).get("speed"),
+        "wind_peak": max(winds),
+        "rain_probability": max(s.get("pop", 0) for s in slots),
+        "rain_mm": round(sum(s.get("rain", {}).get("3h", 0) for s in slots), 1),
+    }
+
+
+# The 5-day forecast comes in 3-hour slots; "dt" is the start of each
+FORECAST_SLOT_SECONDS = 3 * 3600
+
+
+def split_days(slots: list, tz_offset: int, now: datetime = None) -> dict:
+    """Group forecast slots by the user's local date and summarise today and tomorrow.
+
+    Slots that ended before `now` are dropped (the one covering `now` is kept),
+    so a summary made ahead of time for `now` matches one made at that moment
+    from a fresher forecast.
+    """
+    tz = timezone(timedelta(hours=tz_offset))
+    now = (now or datetime.now(tz)).astimezone(tz)
+    today = now.date()
+    tomorrow = today + timedelta(days=1)
+    by_day = {today: [], tomorrow: []}
+    for slot in slots:
+        if slot["dt"] + FORECAST_SLOT_SECONDS <= now.timestamp():
+            continue
+        day = datetime.fromtimestamp(slot["dt"], tz).date()
+        if day in by_day:
+            by_day[day].append(slot)
+    return {
+        "today": summarize_slots(by_day[today]),
+        "tomorrow": summarize_slots(by_day[tomorrow]),
     }
-    
+
+
+def get_weather_forecast(location: str, tz_offset: int, now: datetime = None) -> dict:
+    """Get {"today": {...}, "tomorrow": {...}} summaries in the user's time zone.
+
+    In forecast mode (default) this is one call to the 5-day/3-hour endpoint per
+    city; WEATHER_MODE=current falls back to current conditions for today only.
+    now shifts "today" to another moment, e.g. a precomputed digest's delivery time.
+    """
+    if WEATHER_MODE == "current":
+        return {"today": get_current_weather(location), "tomorrow": {}}
+
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        return {
-            "temp": data["main"]["temp"],
-            "feels_like": data["main"]["feels_like"],
-            "description": data["weather"][0]["description"],
-            "humidity": data["main"]["humidity"],
-            "wind_speed": data["wind"]["speed"]
-        }
-        
+        return split_days(fetch_forecast_slots(resolve_location(location)["id"]), tz_offset, now)
+
+    except Exception as e:
+        print(f"\n⚠️ Weather API error: {str(e)}")
+        return {}
+
+
+async def get_weather_forecast_async(location: str, tz_offset: int) -> dict:
+    """get_weather_forecast() over the shared async connection pool."""
+    if WEATHER_MODE == "current":
+        return {"today": await get_current_weather_async(location), "tomorrow": {}}
+
+    try:
+        city = await resolve_location_async(location)
+        return split_days(await fetch_forecast_slots_async(city["id"]), tz_offset)
+
     except Exception as e:
         print(f"\n⚠️ Weather API error: {str(e)}")
-        return {}
\ No newline at end of file
+        return {}
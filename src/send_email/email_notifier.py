@@ -1,50 +1,95 @@
 import re
 import pytz
-import requests
-from datetime import datetime
-from config import MAILGUN_API_KEY, MAILGUN_DOMAIN  # Make sure these are properly configured
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from config import MAILGUN_API_KEY, MAILGUN_DOMAIN, MAILGUN_API_BASE, HTTP_TIMEOUT  # Make sure these are properly configured
+from src.utils import http_pool
 
-def send_email(body, email_receiver, email_title, timeoffset):
+# Mailgun accepts o:deliverytime up to 3 days ahead
+MAX_SCHEDULE_AHEAD = timedelta(days=3)
+
+def _build_message(body, email_receiver, email_title, timeoffset, deliver_at=None):
+    """Validate the inputs and return (url, form data) for the Mailgun messages API.
+
+    deliver_at (aware datetime) schedules the message with o:deliverytime; the
+    subject then carries the user's local date at delivery. A deliver_at that
+    has passed by the time the message is built (a long run reached this user
+    late) is sent right away instead.
+    """
+    # Validate required parameters
+    if not all([email_receiver, email_title, MAILGUN_API_KEY, MAILGUN_DOMAIN]):
+        raise ValueError("Missing required email parameters or Mailgun credentials")
+
+    # Clean email body
+    cleaned_body = re.sub(r'```(?:html)?', '', body)
+
+    # Calculate local time
+    utc_now = datetime.utcnow().replace(tzinfo=pytz.utc)
+    if deliver_at is not None and deliver_at > utc_now + MAX_SCHEDULE_AHEAD:
+        raise ValueError(f"Delivery time {deliver_at.isoformat()} is not within the next 3 days")
+    local_now = (deliver_at or utc_now).astimezone(pytz.FixedOffset(int(timeoffset) * 60))
+    custom_date = local_now.strftime('%Y-%m-%d')
+    if deliver_at is not None and deliver_at <= utc_now:
+        print(f"⏩ Delivery time {deliver_at.isoformat()} has passed, sending now")
+        deliver_at = None
+
+    # Prepare email data
+    data = {
+        "from": f"LifeSync-AI <mailgun@{MAILGUN_DOMAIN}>",
+        "to": [email_receiver.strip()],  # Ensure email is properly formatted
+        "subject": f"{email_title} {custom_date}",
+        "html": cleaned_body
+    }
+    if deliver_at is not None:
+        # RFC 2822, e.g. "Mon, 10 Mar 2025 23:00:00 +0000"
+        data["o:deliverytime"] = format_datetime(deliver_at.astimezone(pytz.utc))
+    return f"{MAILGUN_API_BASE}/{MAILGUN_DOMAIN}/messages", data
+
+
+def _report(response, email_receiver):
+    if response.status_code == 200:
+        print(f"✅ Email successfully sent to {email_receiver}")
+    else:
+        print(f"⚠️ Mailgun API Error: {response.status_code}")
+        print(f"Response: {response.text}")
+
+
+def send_email(body, email_receiver, email_title, timeoffset, deliver_at=None):
     """Send email through Mailgun API with proper validation and error handling"""
     print("Attempting to send email...")
-    
+
     try:
-        # Validate required parameters
-        if not all([email_receiver, email_title, MAILGUN_API_KEY, MAILGUN_DOMAIN]):
-            raise ValueError("Missing required email parameters or Mailgun credentials")
-
-        # Clean email body
-        cleaned_body = re.sub(r'```(?:html)?', '', body)
-
-        # Calculate local time
-        utc_now = datetime.utcnow().replace(tzinfo=pytz.utc)
-        timezone_str = f'Etc/GMT{"+" if timeoffset < 0 else "-"}{abs(timeoffset)}'
-        local_timezone = pytz.timezone(timezone_str)
-        local_now = utc_now.astimezone(local_timezone)
-        custom_date = local_now.strftime('%Y-%m-%d')
-
-        # Prepare email data
-        data = {
-            "from": f"LifeSync-AI <mailgun@{MAILGUN_DOMAIN}>",
-            "to": [email_receiver.strip()],  # Ensure email is properly formatted
-            "subject": f"{email_title} {custom_date}",
-            "html": cleaned_body
-        }
-
-        # Send request to Mailgun
-        response = requests.post(
-            f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
+        url, data = _build_message(body, email_receiver, email_title, timeoffset, deliver_at)
+
+        # Send request to Mailgun over the shared keep-alive session
+        response = http_pool.session().post(
+            url,
             auth=("api", MAILGUN_API_KEY),
-            data=data
+            data=data,
+            timeout=HTTP_TIMEOUT
         )
 
         # Handle response
-        if response.status_code == 200:
-            print(f"✅ Email successfully sent to {email_receiver}")
-        else:
-            print(f"⚠️ Mailgun API Error: {response.status_code}")
-            print(f"Response: {response.text}")
+        _report(response, email_receiver)
 
     except Exception as e:
         print(f"🔥 Critical email error: {str(e)}")
         raise  # Re-raise exception to handle in calling code
+
+
+async def send_email_async(body, email_receiver, email_title, timeoffset, deliver_at=None):
+    """send_email() over the shared async connection pool"""
+    print("Attempting to send email...")
+
+    try:
+        url, data = _build_message(body, email_receiver, email_title, timeoffset, deliver_at)
+        response = await http_pool.async_client().post(
+            url,
+            auth=("api", MAILGUN_API_KEY),
+            data=data
+        )
+        _report(response, email_receiver)
+
+    except Exception as e:
+        print(f"🔥 Critical email error: {str(e)}")
+        raise
@@ -0,0 +1,32 @@
+# src/utils/cache.py
+import json
+import os
+import tempfile
+import threading
+from config import CACHE_DIR
+
+_lock = threading.Lock()
+
+
+def cache_path(name, directory=None):
+    return os.path.join(directory or CACHE_DIR, name)
+
+
+def load_json(name, default=None, directory=None):
+    """Read a JSON file from the cache directory, or return default when missing or unreadable."""
+    try:
+        with open(cache_path(name, directory), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(name, data, directory=None):
+    """Atomically write data as JSON into the cache directory (or another directory)."""
+    path = cache_path(name, directory)
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
@@ -0,0 +1,285 @@
+"""Record and replay every HTTP exchange of a digest run (Notion, OpenWeather, LLM, Mailgun).
+
+LIFESYNC_CASSETTE=record captures each request and response to
+CASSETTE_DIR/<run>.json with API keys, tokens and credentials scrubbed;
+LIFESYNC_CASSETTE=replay serves them back without touching the network, each
+after its recorded latency times CASSETTE_LATENCY_SCALE (0 = no delay).
+
+    LIFESYNC_CACHE_DIR=/tmp/rec LIFESYNC_CASSETTE=record python morning_email.py
+    LIFESYNC_CACHE_DIR=/tmp/rep LIFESYNC_CASSETTE=replay python morning_email.py
+
+Start both from an empty cache directory so the same requests are made. The
+hooks sit on the requests adapter (session, openai) and the httpx transports
+(Notion SDK, ZhipuAI, async pool). Replay matches a request by method, host and
+path, preferring the recording with the same query and body; prompts and date
+filters that moved with the clock fall back to recording order.
+"""
+import atexit
+import base64
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from config import CASSETTE_DIR, CASSETTE_LATENCY_SCALE, CASSETTE_MODE
+
+SCRUBBED = "<SCRUBBED>"
+SECRET_PARAMS = {"appid", "api_key", "apikey", "key", "token", "access_token"}
+SECRET_ENV = re.compile(r"KEY|TOKEN|SECRET|PASSWORD")
+# Config table columns holding credentials (USER_NOTION_TOKEN, ...); DAILY_TOKEN_BUDGET is not one
+SECRET_COLUMN = re.compile(r"(^|_)(KEY|TOKEN|SECRET|PASSWORD)$", re.I)
+# Response headers kept; bodies are stored decoded, so encoding and length headers are dropped
+KEPT_HEADERS = {"content-type"}
+
+
+class CassetteMiss(Exception):
+    """Replay found no recorded response for a request."""
+
+
+class Cassette:
+    def __init__(self, path, mode, latency_scale=1.0):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._secrets = {value for name, value in os.environ.items() if SECRET_ENV.search(name) and len(value) >= 8}
+        self._queues = defaultdict(deque)
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                self.interactions = json.load(f)["interactions"]
+            for interaction in self.interactions:
+                self._queues[self._route(interaction["method"], interaction["url"])].append(interaction)
+
+    # ----- scrubbing -----
+    # Interactions are kept raw while recording and scrubbed in save(), once every
+    # secret of the run is known: a token read from the config table shows up in
+    # a response before (or without) ever being sent as a Bearer token.
+    def _learn_secret(self, authorization):
+        if authorization:
+            value = authorization.split(" ", 1)[-1]
+            if len(value) >= 8:
+                with self._lock:
+                    self._secrets.add(value)
+
+    def _redact_columns(self, node, inside=False):
+        """node with the text of every secret-named Notion property (or plain JSON key) replaced.
+
+        The values are also learned as secrets, so other copies of them (a
+        Bearer header, a URL) are scrubbed as well.
+        """
+        if isinstance(node, dict):
+            redacted = {}
+            for key, value in node.items():
+                secret = bool(SECRET_COLUMN.search(str(key)))
+                if isinstance(value, str) and value and (secret or (inside and key in ("plain_text", "content"))):
+                    if len(value) >= 8:
+                        with self._lock:
+                            self._secrets.add(value)
+                    redacted[key] = SCRUBBED
+                else:
+                    redacted[key] = self._redact_columns(value, inside or secret)
+            return redacted
+        if isinstance(node, list):
+            return [self._redact_columns(value, inside) for value in node]
+        return node
+
+    def _redact_body(self, body):
+        if body.lstrip()[:1] not in ("{", "["):
+            return body
+        try:
+            return json.dumps(self._redact_columns(json.loads(body)), ensure_ascii=False)
+        except ValueError:
+            return body
+
+    def scrub(self, text):
+        # Longest first, so a secret containing another is replaced whole
+        for secret in sorted(self._secrets, key=len, reverse=True):
+            text = text.replace(secret, SCRUBBED)
+        return text
+
+    def scrub_url(self, url):
+        parts = urlsplit(url)
+        query = [(name, SCRUBBED if name.lower() in SECRET_PARAMS else value)
+                 for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return self.scrub(urlunsplit(parts._replace(query=urlencode(query, safe="<>"))))
+
+    @staticmethod
+    def _route(method, url):
+        parts = urlsplit(url)
+        return method.upper(), parts.netloc, parts.path
+
+    # ----- record -----
+    def record(self, method, url, authorization, request_body, status, headers, body, latency):
+        self._learn_secret(authorization)
+        try:
+            stored = {"body": body.decode("utf-8")}
+        except UnicodeDecodeError:
+            stored = {"body_b64": base64.b64encode(body).decode("ascii")}
+        interaction = {
+            "method": method.upper(),
+            "url": url,
+            "request_body": (request_body or b"").decode("utf-8", "replace"),
+            "status": status,
+            "headers": {name.lower(): value for name, value in headers.items() if name.lower() in KEPT_HEADERS},
+            "latency": round(latency, 4),
+            **stored,
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self):
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            interactions = list(self.interactions)
+        # Redact every body first: that is where secrets from the config table are learned
+        interactions = [dict(i, body=self._redact_body(i["body"])) if "body" in i else i for i in interactions]
+        data = {"recorded_at": time.time(), "interactions": [self._scrubbed(i) for i in interactions]}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        print(f"📼 Cassette recorded: {len(data['interactions'])} requests -> {self.path}")
+
+    def _scrubbed(self, interaction):
+        interaction = dict(interaction, url=self.scrub_url(interaction["url"]),
+                           request_body=self.scrub(interaction["request_body"]))
+        if "body" in interaction:
+            interaction["body"] = self.scrub(interaction["body"])
+        return interaction
+
+    # ----- replay -----
+    def play(self, method, url, request_body):
+        """The recorded interaction for a request, after waiting its scaled latency."""
+        url = self.scrub_url(url)
+        body = self.scrub((request_body or b"").decode("utf-8", "replace"))
+        with self._lock:
+            queue = self._queues.get(self._route(method, url))
+            if not queue:
+                raise CassetteMiss(f"No recorded response for {method.upper()} {url}")
+            match = next((i for i in queue if i["url"] == url and i["request_body"] == body), queue[0])
+            queue.remove(match)
+        if self.latency_scale:
+            time.sleep(match["latency"] * self.latency_scale)
+        return match
+
+    @staticmethod
+    def body_of(interaction):
+        if "body_b64" in interaction:
+            return base64.b64decode(interaction["body_b64"])
+        return interaction["body"].encode("utf-8")
+
+
+_active = None
+
+
+def _request_body(body):
+    if body is None:
+        return b""
+    return body.encode("utf-8") if isinstance(body, str) else bytes(body)
+
+
+def _patch_requests(cassette):
+    from requests.adapters import HTTPAdapter
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    original = HTTPAdapter.send
+
+    def send(adapter, request, **kwargs):
+        body = _request_body(request.body)
+        if cassette.mode == "replay":
+            interaction = cassette.play(request.method, request.url, body)
+            response = Response()
+            response.status_code = interaction["status"]
+            response.headers = CaseInsensitiveDict(interaction["headers"])
+            response._content = cassette.body_of(interaction)
+            response._content_consumed = True
+            response.raw = io.BytesIO(response._content)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            response.connection = adapter
+            return response
+
+        started = time.perf_counter()
+        response = original(adapter, request, **kwargs)
+        content = response.content
+        cassette.record(request.method, request.url, request.headers.get("Authorization"), body,
+                        response.status_code, response.headers, content, time.perf_counter() - started)
+        return response
+
+    HTTPAdapter.send = send
+
+
+def _patch_httpx(cassette):
+    import httpx
+
+    def replayed(request):
+        interaction = cassette.play(request.method, str(request.url), request.content)
+        return httpx.Response(interaction["status"], headers=interaction["headers"],
+                              content=cassette.body_of(interaction), request=request)
+
+    def recorded(request, response, content, started):
+        cassette.record(request.method, str(request.url), request.headers.get("Authorization"), request.content,
+                        response.status_code, response.headers, content, time.perf_counter() - started)
+        # The body was read (and decoded) here, so hand back a plain copy
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    sync_original = httpx.HTTPTransport.handle_request
+    async_original = httpx.AsyncHTTPTransport.handle_async_request
+
+    def handle_request(transport, request):
+        request.read()
+        if cassette.mode == "replay":
+            return replayed(request)
+        started = time.perf_counter()
+        response = sync_original(transport, request)
+        content = response.read()
+        response.close()
+        return recorded(request, response, content, started)
+
+    async def handle_async_request(transport, request):
+        await request.aread()
+        if cassette.mode == "replay":
+            # Sleeping in a worker thread keeps the event loop free, as a real response would
+            import asyncio
+            return await asyncio.get_running_loop().run_in_executor(None, replayed, request)
+        started = time.perf_counter()
+        response = await async_original(transport, request)
+        content = await response.aread()
+        await response.aclose()
+        return recorded(request, response, content, started)
+
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+
+def install(run_name, mode=None):
+    """Hook requests and httpx for LIFESYNC_CASSETTE=record|replay; a no-op when it is unset.
+
+    Call once at startup, before any client sends a request.
+    """
+    global _active
+    mode = (mode or CASSETTE_MODE or "").lower()
+    if not mode or _active is not None:
+        return _active
+    if mode not in ("record", "replay"):
+        raise ValueError(f"LIFESYNC_CASSETTE must be 'record' or 'replay', not {mode!r}")
+
+    _active = Cassette(os.path.join(CASSETTE_DIR, f"{run_name}.json"), mode, CASSETTE_LATENCY_SCALE)
+    _patch_requests(_active)
+    _patch_httpx(_active)
+    if mode == "record":
+        atexit.register(_active.save)
+        print(f"📼 Recording HTTP traffic to {_active.path}")
+    else:
+        print(f"📼 Replaying {len(_active.interactions)} recorded requests from {_active.path} "
+              f"(latency x{CASSETTE_LATENCY_SCALE:g})")
+    return _active
@@ -0,0 +1,61 @@
+# src/utils/http_pool.py
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS
+
+_session = None
+_session_lock = threading.Lock()
+
+# httpx clients are bound to the event loop that first used them
+_async_clients = {}
+
+# One Notion SDK client per integration token
+_notion_clients = {}
+
+
+def session() -> requests.Session:
+    """Process-wide requests.Session, so sync calls reuse keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_MAX_CONNECTIONS, pool_maxsize=HTTP_MAX_CONNECTIONS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def notion_client(token):
+    """Process-wide notion_client.Client for one token, so its connection pool stays warm across users and runs."""
+    from notion_client import Client
+
+    with _session_lock:
+        client = _notion_clients.get(token)
+        if client is None:
+            client = _notion_clients[token] = Client(auth=token)
+        return client
+
+
+def async_client():
+    """Shared httpx.AsyncClient for the running event loop, created on first use."""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the running loop's client; call before the loop shuts down."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,155 @@
+"""CPU and memory profiling of a digest run, per user and stage (--profile).
+
+Each stage timed by DurationHistory.stage() also runs under cProfile and
+tracemalloc. The report goes to PROFILE_DIR/<run>/:
+
+- <user>/<stage>.pstats      cProfile data (python -m pstats, snakeviz, ...)
+- <user>/<stage>.collapsed   "a;b;c microseconds" stacks for flamegraph.pl / speedscope
+- <user>/all.pstats          every stage of the user merged
+- memory.txt                 peak traced memory per user and stage, with the top allocation sites
+
+cProfile only sees the thread that runs the stage, so work handed to pools
+(concurrent fetches, section-parallel night calls) shows up as waiting time.
+"""
+import cProfile
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from config import PROFILE_DIR
+
+TRACE_FRAMES = 10
+TOP_ALLOCATIONS = 5
+MAX_STACK_DEPTH = 60
+
+
+def _safe_name(name):
+    return re.sub(r"[^\w.-]", "_", str(name)) or "_"
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-ins such as <built-in method time.sleep>
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed_stacks(stats):
+    """Approximate call stacks from cProfile's caller/callee edges, as {"a;b;c": microseconds}.
+
+    cProfile keeps one level of callers per function, so time is split down the
+    tree in proportion to each edge's cumulative time (as flameprof does).
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+
+    stacks = {}
+
+    def walk(func, share, path):
+        _, _, own, cumulative, _ = stats.stats[func]
+        if cumulative <= 0 or share <= 0:
+            return
+        scale = min(share / cumulative, 1.0)
+        path = path + [_label(func)]
+        key = ";".join(path)
+        stacks[key] = stacks.get(key, 0) + own * scale * 1e6
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, []):
+            if _label(callee) not in path:  # cut recursion
+                walk(callee, edge_time * scale, path)
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [])
+    return {stack: int(us) for stack, us in stacks.items() if us >= 1}
+
+
+class Profiler:
+    """Collects cProfile stats and tracemalloc peaks for every (user, stage) of one run.
+
+    Stages must not overlap in time when memory peaks are to be attributed;
+    the digest scripts run users one at a time while profiling.
+    """
+
+    def __init__(self, run, out_dir=None):
+        self.dir = os.path.join(out_dir or PROFILE_DIR, _safe_name(run))
+        self._stats = {}
+        self.memory = {}
+        self._lock = threading.Lock()
+        tracemalloc.start(TRACE_FRAMES)
+
+    @staticmethod
+    def _memory_baseline():
+        """Start a fresh peak; returns the traced bytes the peak is measured from."""
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+        # Python 3.8 has no reset_peak: restarting clears the traces, so the peak counts from zero
+        tracemalloc.stop()
+        tracemalloc.start(TRACE_FRAMES)
+        return 0
+
+    @contextmanager
+    def stage(self, user_id, stage):
+        baseline = self._memory_baseline()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            with self._lock:
+                key = (user_id, stage)
+                if key in self._stats:
+                    self._stats[key].add(profile)
+                else:
+                    self._stats[key] = pstats.Stats(profile)
+                entry = self.memory.setdefault(user_id, {}).get(stage)
+                if entry is None or peak > entry["peak"]:
+                    self.memory[user_id][stage] = {
+                        "peak": peak,
+                        "top": [(str(stat.traceback[0]), stat.size) for stat in top],
+                    }
+
+    def _write_stats(self):
+        by_user = {}
+        for (user_id, stage), stats in self._stats.items():
+            user_dir = os.path.join(self.dir, _safe_name(user_id))
+            os.makedirs(user_dir, exist_ok=True)
+            stats.dump_stats(os.path.join(user_dir, f"{_safe_name(stage)}.pstats"))
+            with open(os.path.join(user_dir, f"{_safe_name(stage)}.collapsed"), "w", encoding="utf-8") as f:
+                for stack, us in sorted(collapsed_stacks(stats).items()):
+                    f.write(f"{stack} {us}\n")
+            by_user.setdefault(user_id, pstats.Stats()).add(stats)
+        for user_id, stats in by_user.items():
+            stats.dump_stats(os.path.join(self.dir, _safe_name(user_id), "all.pstats"))
+        return by_user
+
+    def report(self):
+        """Write all profiles and the memory report, print a per-user summary and stop tracing."""
+        with self._lock:
+            os.makedirs(self.dir, exist_ok=True)
+            by_user = self._write_stats()
+            lines = []
+            for user_id, stages in self.memory.items():
+                peak = max(entry["peak"] for entry in stages.values())
+                lines.append(f"{user_id}: peak {peak / 1024:.0f} KiB")
+                for stage, entry in stages.items():
+                    lines.append(f"  {stage:<10} peak {entry['peak'] / 1024:>9.0f} KiB")
+                    for site, size in entry["top"]:
+                        lines.append(f"      {size / 1024:>9.1f} KiB  {site}")
+            with open(os.path.join(self.dir, "memory.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        tracemalloc.stop()
+
+        print(f"\n🔬 Profiles written to {self.dir}")
+        for user_id, stats in by_user.items():
+            peak = max(entry["peak"] for entry in self.memory.get(user_id, {}).values() or [{"peak": 0}])
+            print(f"  {user_id}: {stats.total_tt:.2f}s CPU-profiled, peak {peak / 1024:.0f} KiB")
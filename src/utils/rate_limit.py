@@ -0,0 +1,58 @@
+import threading
+import time
+from config import NOTION_REQUESTS_PER_SECOND
+
+RATE_LIMIT_RETRIES = 3
+
+
+class TokenBucket:
+    """Blocking token bucket: at most `rate` acquisitions per second on average, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# Notion limits each integration token, so every thread using a token shares its bucket
+_notion_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def notion_limiter(token):
+    with _buckets_lock:
+        bucket = _notion_buckets.get(token)
+        if bucket is None:
+            bucket = _notion_buckets[token] = TokenBucket(NOTION_REQUESTS_PER_SECOND)
+        return bucket
+
+
+def limited(bucket, call, *args, **kwargs):
+    """call(*args, **kwargs) after taking a token; a Notion 429 (code "rate_limited") is retried with backoff."""
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        bucket.acquire()
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, "code", None) != "rate_limited" or attempt == RATE_LIMIT_RETRIES:
+                raise
+            delay = 2 ** attempt
+            print(f"⏳ Notion rate limited, retrying in {delay}s")
+            time.sleep(delay)
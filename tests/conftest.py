@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# config.py reads the environment on import: keep caches and the ledger away from the real ones
+os.environ["LIFESYNC_CACHE_DIR"] = tempfile.mkdtemp(prefix="lifesync-tests-")
+os.environ["LLM_LEDGER"] = "false"
+os.environ.pop("LIFESYNC_CASSETTE", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
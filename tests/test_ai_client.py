@@ -0,0 +1,71 @@
+import time
+
+from src.ai_operations import ai_client
+from src.ai_operations.ai_client import estimate_tokens, html_closed
+
+
+def chunks(*pieces, usage=None):
+    for piece in pieces:
+        yield {"choices": [{"delta": {"content": piece}}]}
+    if usage:
+        yield {"choices": [], "usage": usage}
+
+
+def test_html_closed_waits_for_the_outer_block():
+    closed = html_closed()
+    assert closed("<div><div>inner</div>") is False
+    text = "<div><div>inner</div></div> trailing"
+    assert text[:closed(text)] == "<div><div>inner</div></div>"
+
+
+def test_html_closed_counts_blocks_and_ignores_text_before_the_first_div():
+    closed = html_closed(2)
+    assert closed("</div> <div>a</div>") is False
+    assert closed("</div> <div>a</div><div>b</div>x") == len("</div> <div>a</div><div>b</div>")
+
+
+def test_html_closed_handles_tags_split_across_chunks():
+    text, _, _, _, early = ai_client._consume_stream(chunks("<div>", "x</d", "iv", ">", " after"),
+                                                     time.perf_counter(), html_closed())
+    assert early and text == "<div>x</div>"
+
+
+def test_html_closed_is_reusable_for_a_new_stream():
+    closed = html_closed()
+    assert closed("<div>one</div>")
+    assert closed("<div>2</div>") == len("<div>2</div>")
+
+
+def test_stream_without_stop_condition_reads_everything():
+    text, usage, ttft, count, early = ai_client._consume_stream(
+        chunks("<div>", "a</div>", usage={"prompt_tokens": 5, "completion_tokens": 2}), time.perf_counter(), None)
+    assert (text, count, early) == ("<div>a</div>", 2, False)
+    assert usage["usage"]["prompt_tokens"] == 5
+    assert ttft is not None
+
+
+def test_cut_short_stream_records_estimated_usage():
+    prompt = "系统提示" + "hello world " * 10
+    text, usage, _, count, early = ai_client._consume_stream(
+        chunks("<div>", "你好</div>", "never read"), time.perf_counter(), html_closed())
+    assert early and usage is None
+    entry = ai_client.record_usage("gpt-4o", usage, stage="html", streamed_tokens=count, stopped_early=early,
+                                   prompt_text=prompt, completion_text=text)
+    assert entry["estimated"] is True
+    assert entry["prompt_tokens"] == estimate_tokens(prompt) > 0
+    assert entry["completion_tokens"] >= count
+    assert entry["cached_tokens"] == 0
+
+
+def test_reported_usage_is_not_estimated():
+    entry = ai_client.record_usage("gpt-4o", {"usage": {"prompt_tokens": 10, "completion_tokens": 3,
+                                                        "prompt_tokens_details": {"cached_tokens": 4}}},
+                                   prompt_text="ignored")
+    assert (entry["prompt_tokens"], entry["completion_tokens"], entry["cached_tokens"]) == (10, 3, 4)
+    assert entry["estimated"] is False
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcdefgh") == 2
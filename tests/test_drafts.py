@@ -0,0 +1,39 @@
+from datetime import date, timedelta, timezone
+
+from src.digest import drafts
+from src.digest.drafts import input_fingerprint, save_draft, take_draft
+from src.get_env.user_config import UserConfig
+from src.get_notion.models import Task
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+CONFIG = UserConfig.from_fields("u1", {"GPT_VERSION": "gpt-4o", "PRESENT_LOCATION": "Shanghai",
+                                       "USER_CAREER": "student", "SCHEDULE_PROMPT": "mornings for study"})
+WEATHER = {"description": "light rain", "temp": 12.3, "temp_min": 9.8, "temp_max": 14.2, "humidity": 81,
+           "wind_speed": 3.2, "wind_peak": 5.1, "rain_probability": 0.62}
+
+
+def ai_data(weather=WEATHER, end="2025-03-10 18:00"):
+    task = Task.from_dict({"id": "t1", "Name": "Essay", "Start": "2025-03-09 09:00", "End": end}, TZ)
+    return {"weather": dict(weather), "today_tasks": [task], "in_progress_tasks": [], "future_tasks": []}
+
+
+def test_forecast_jitter_keeps_the_fingerprint():
+    jittered = dict(WEATHER, temp=12.4, humidity=83, rain_probability=0.64)
+    assert input_fingerprint(ai_data(jittered), CONFIG, TODAY) == input_fingerprint(ai_data(), CONFIG, TODAY)
+
+
+def test_material_changes_change_the_fingerprint():
+    base = input_fingerprint(ai_data(), CONFIG, TODAY)
+    assert input_fingerprint(ai_data(end="2025-03-11 18:00"), CONFIG, TODAY) != base
+    assert input_fingerprint(ai_data(dict(WEATHER, description="sunny")), CONFIG, TODAY) != base
+    assert input_fingerprint(ai_data(), CONFIG, TODAY + timedelta(days=1)) != base
+    assert input_fingerprint({}, CONFIG, TODAY) != base
+
+
+def test_draft_is_only_taken_for_the_same_date_and_inputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(drafts, "DRAFTS_CACHE", str(tmp_path / "drafts.json"))
+    save_draft("u1", TODAY, "abc", "<div>body</div>")
+    assert take_draft("u1", TODAY, "other") is None
+    assert take_draft("u1", TODAY + timedelta(days=1), "abc") is None
+    assert take_draft("u1", TODAY, "abc") == "<div>body</div>"
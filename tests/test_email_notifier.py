@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from src.send_email import email_notifier
+
+
+@pytest.fixture(autouse=True)
+def mailgun(monkeypatch):
+    monkeypatch.setattr(email_notifier, "MAILGUN_API_KEY", "key")
+    monkeypatch.setattr(email_notifier, "MAILGUN_DOMAIN", "mg.example.com")
+
+
+def build(deliver_at, offset=8):
+    return email_notifier._build_message("```html\n<div>hi</div>```", " a@example.com ", "Digest", offset, deliver_at)[1]
+
+
+def test_future_delivery_is_scheduled_with_the_local_date():
+    deliver_at = datetime.now(pytz.utc).replace(hour=14, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    data = build(deliver_at, offset=-10)
+    assert data["o:deliverytime"].endswith("14:00:00 +0000")
+    assert data["subject"] == f"Digest {(deliver_at - timedelta(hours=10)).strftime('%Y-%m-%d')}"
+    assert data["html"] == "\n<div>hi</div>" and data["to"] == ["a@example.com"]
+
+
+def test_passed_delivery_time_is_sent_now():
+    # A long run reached this user after the delivery hour computed at run start
+    deliver_at = datetime.now(pytz.utc) - timedelta(minutes=5)
+    data = build(deliver_at)
+    assert "o:deliverytime" not in data
+    assert data["subject"] == f"Digest {deliver_at.astimezone(pytz.FixedOffset(480)).strftime('%Y-%m-%d')}"
+
+
+def test_delivery_more_than_three_days_ahead_is_rejected():
+    with pytest.raises(ValueError):
+        build(datetime.now(pytz.utc) + timedelta(days=4))
@@ -0,0 +1,39 @@
+from datetime import date, timedelta, timezone
+
+from src.get_notion.event_from_notion import classify_events
+from src.get_notion.models import Event
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+
+
+def event(name, start, end=None, completed=False):
+    return Event.from_dict({"id": name, "Name": name, "Start": start, "End": end, "Completed": completed}, TZ)
+
+
+def names(bucket):
+    return [item.name for item in bucket]
+
+
+def test_events_by_day():
+    buckets = classify_events([
+        event("multi-day", "2025-03-09 09:00", "2025-03-11 18:00"),
+        event("past", "2025-03-08 09:00", "2025-03-08 10:00"),
+        event("tomorrow", "2025-03-11 09:00"),
+        event("later", "2025-03-13 09:00"),
+        event("done", "2025-03-10 09:00", completed=True),
+    ], TODAY)
+    assert names(buckets["in_progress"]) == ["multi-day"]
+    assert names(buckets["tomorrow"]) == ["tomorrow"]
+    assert names(buckets["upcoming"]) == ["later"]
+    assert names(buckets["completed"]) == ["done"]
+
+
+def test_completed_events_can_be_left_out():
+    events = [event("done", "2025-03-10 09:00", completed=True), event("open", "2025-03-10 09:00", "2025-03-10 23:59")]
+    buckets = classify_events(events, TODAY, include_completed=False)
+    assert buckets["completed"] == [] and names(buckets["in_progress"]) == ["open"]
+
+
+def test_no_events():
+    assert all(bucket == [] for bucket in classify_events([], TODAY).values())
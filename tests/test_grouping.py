@@ -0,0 +1,38 @@
+import threading
+
+from src.ai_operations import ai_iterator
+from src.digest.grouping import GroupCache, group_key
+
+
+def test_group_key_ignores_dashes_and_case():
+    assert group_key("ABC-def-1", "2025-03-10", 8) == group_key("abcdef1", "2025-03-10", 8)
+    assert group_key("abc", "2025-03-10", 8) != group_key("abc", "2025-03-10", -8)
+
+
+def test_value_is_computed_once_across_threads():
+    cache, calls = GroupCache(), []
+
+    def compute():
+        calls.append(1)
+        return "analysis"
+
+    threads = [threading.Thread(target=cache.get_or_compute, args=("k", compute)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (7, 1)
+
+
+def test_failed_analysis_is_not_shared(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(ai_iterator, "chat_completion", fail)
+    cache = GroupCache()
+    assert cache.get_or_compute("k", lambda: ai_iterator.iterator("prompt", "gpt-4o")) is None
+    # The next user in the group tries again instead of reusing the failure
+    monkeypatch.setattr(ai_iterator, "chat_completion", lambda *args, **kwargs: "analysis")
+    assert cache.get_or_compute("k", lambda: ai_iterator.iterator("prompt", "gpt-4o")) == "analysis"
+    assert cache.get_or_compute("k", lambda: None) == "analysis"
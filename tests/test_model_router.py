@@ -0,0 +1,28 @@
+from src.ai_operations import model_router
+from src.ai_operations.model_router import estimate_cost, resolve_stage_models, stage_model
+
+
+def test_user_column_then_default_then_base(monkeypatch):
+    monkeypatch.setattr(model_router, "STAGE_DEFAULTS", {"analysis": "gpt-4o-mini", "html": ""})
+    models = resolve_stage_models({"GPT_VERSION": "gpt-4o", "GPT_VERSION_HTML": " gpt-4.1 "})
+    assert models == {"analysis": "gpt-4o-mini", "html": "gpt-4.1"}
+
+
+def test_missing_and_blank_columns_are_unset(monkeypatch):
+    monkeypatch.setattr(model_router, "STAGE_DEFAULTS", {"analysis": "MISSING", "html": None})
+    models = resolve_stage_models({"GPT_VERSION": "glm-4", "GPT_VERSION_ANALYSIS": "MISSING",
+                                   "GPT_VERSION_HTML": "  "})
+    assert models == {"analysis": "glm-4", "html": "glm-4"}
+
+
+def test_stage_model_accepts_a_name_or_a_mapping():
+    assert stage_model("gpt-4o", "html") == "gpt-4o"
+    assert stage_model({"analysis": "a", "html": "h"}, "html") == "h"
+    assert stage_model({"analysis": "a"}, "html") == "a"
+
+
+def test_estimate_cost_by_prefix_and_cache():
+    entry = {"model": "gpt-4o-2024-08-06", "prompt_tokens": 1_000_000, "cached_tokens": 400_000,
+             "completion_tokens": 100_000}
+    assert round(estimate_cost(entry), 4) == round(0.6 * 2.50 + 0.4 * 1.25 + 0.1 * 10.00, 4)
+    assert estimate_cost({"model": "unknown", "prompt_tokens": 10}) == 0.0
@@ -0,0 +1,55 @@
+import threading
+from datetime import timedelta, timezone
+
+from src.get_notion import page_content
+from src.get_notion.models import Task
+from src.utils.cache import load_json
+
+TZ = timezone(timedelta(hours=8))
+
+
+class FakeNotion:
+    def __init__(self, barrier=None):
+        self.calls = []
+        self.blocks = self
+        self.children = self
+        self.barrier = barrier
+
+    def list(self, block_id, page_size):
+        self.calls.append(block_id)
+        if self.barrier:
+            self.barrier.wait(timeout=5)
+        return {"results": [{"type": "paragraph", "paragraph": {"rich_text": [{"plain_text": f"body of {block_id}"}]}},
+                            {"type": "image", "image": {}}]}
+
+
+def task(page_id, edited="2025-03-10T00:00:00.000Z"):
+    return Task.from_dict({"id": page_id, "Name": page_id, "Start": "2025-03-10 09:00",
+                           "last_edited_time": edited}, TZ)
+
+
+def test_concurrent_users_keep_each_others_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_content, "PAGE_CACHE", str(tmp_path / "bodies.json"))
+    # Both users fetch at the same time, then both save
+    notion = FakeNotion(threading.Barrier(2))
+    monkeypatch.setattr(page_content, "notion_client", lambda token: notion)
+    users = [[task("a1")], [task("b1")]]
+    threads = [threading.Thread(target=page_content.attach_descriptions, args=("token", tasks), kwargs={"workers": 1})
+               for tasks in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(load_json(page_content.PAGE_CACHE)) == ["a1", "b1"]
+    assert users[1][0].description == "body of b1"
+
+
+def test_cached_bodies_are_reused_until_edited(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_content, "PAGE_CACHE", str(tmp_path / "bodies.json"))
+    notion = FakeNotion()
+    monkeypatch.setattr(page_content, "notion_client", lambda token: notion)
+    page_content.attach_descriptions("token", [task("p")])
+    again = page_content.attach_descriptions("token", [task("p")])
+    assert notion.calls == ["p"] and again[0].description == "body of p"
+    page_content.attach_descriptions("token", [task("p", edited="2025-03-11T00:00:00.000Z")])
+    assert notion.calls == ["p", "p"]
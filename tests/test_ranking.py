@@ -0,0 +1,50 @@
+from datetime import date, timedelta, timezone
+
+from src.digest.ranking import keywords, omitted_summary, select_top_k, selection_key
+from src.get_notion.models import Task
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+LABELS = {"today_tasks": "今日", "in_progress_tasks": "进行中", "future_tasks": "未来"}
+
+
+def task(name, end, priority=None, eta=True):
+    return Task.from_dict({"id": name, "Name": name, "Start": "2025-03-09 09:00", "End": end,
+                           "Priority": priority, "ETA": eta}, TZ)
+
+
+def test_keeps_the_k_best_and_counts_the_rest():
+    data = {
+        "weather": {},
+        "today_tasks": [task("urgent", "2025-03-10 18:00", "High"), task("minor", "2025-03-10 18:00", "Low")],
+        "in_progress_tasks": [task("thesis draft", "2025-03-11 18:00", "Medium", eta=False)],
+        "future_tasks": [task("someday", "2025-04-30 18:00")],
+    }
+    ranked = select_top_k(data, 2, TODAY, keywords("thesis"))
+    assert [t.name for t in ranked["today_tasks"]] == ["urgent"]
+    assert [t.name for t in ranked["in_progress_tasks"]] == ["thesis draft"]
+    assert ranked["future_tasks"] == []
+    assert ranked["omitted_tasks"] == {"today_tasks": 1, "future_tasks": 1}
+    assert omitted_summary(ranked, LABELS) == "今日 1, 未来 1"
+    assert selection_key(ranked) == ("urgent", "thesis draft")
+    assert "omitted_tasks" not in data
+
+
+def test_small_pools_and_disabled_ranking_are_untouched():
+    data = {"today_tasks": [task("only", "2025-03-10 18:00")]}
+    assert select_top_k(data, 5, TODAY) is data
+    assert select_top_k(data, 0, TODAY) is data
+    assert omitted_summary(data, LABELS) == ""
+
+
+def test_empty_buckets():
+    data = {"today_tasks": [], "in_progress_tasks": [], "future_tasks": []}
+    assert select_top_k(data, 1, TODAY) is data
+    assert select_top_k({}, 1, TODAY) == {}
+    assert selection_key({}) == ()
+
+
+def test_keywords_split_cjk_into_bigrams():
+    assert keywords("Write the thesis") == {"write", "thesis"}
+    assert keywords("写论文") == {"写论", "论文"}
+    assert keywords("MISSING", None) == set()
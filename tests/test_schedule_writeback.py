@@ -0,0 +1,110 @@
+from src.get_notion import schedule_writeback as writeback
+from src.get_notion.schedule_writeback import parse_schedule
+
+NIGHT = """
+<div class="section"><div class="section-header"><h2><strong>🌙 Tomorrow</strong></h2></div>
+<ul class="timeline">
+  <li class="timeline-item"><div class="timeline-time">09:00</div>
+    <div class="timeline-content"><h3 class="timeline-title">Deep work</h3>
+    <span class="task-label">已完成</span><p class="timeline-desc">Chapter 2<br>draft</p></div></li>
+  <li class="timeline-item"><div class="timeline-time">14:00</div>
+    <div class="timeline-content"><h3 class="timeline-title">Review</h3></div></div></li>
+</ul></div>
+"""
+
+# Filled from ai_morning_advice.HTML_SKELETON; the model writes free-form HTML inside div.ai-analysis
+MORNING = """
+<div class="morning-brief">
+    <h1>Morning Briefing - Monday, March 10</h1>
+    <div class="weather-section">
+        <h2>🌤️ Current Weather</h2>
+        <p>Temperature: 12°C</p>
+    </div>
+    <div class="task-priorities">
+        <h2>🔝 Priority Tasks</h2>
+        <ul><li class="priority-high"><h3>Essay</h3><p class="task-desc">08:00 draft</p></li></ul>
+    </div>
+    <div class="schedule-recommendations">
+        <h2>⏳ Recommended Schedule</h2>
+        <div class="ai-analysis">
+            <p>08:00 - 09:30 <strong>Gym</strong><br>before the rain</p>
+            <ul>
+                <li>10:00：Write report</li>
+            </ul>
+            <p>Call mum</p>
+            <p>   </p>
+        </div>
+    </div>
+</div>
+"""
+
+
+def test_night_timeline_items():
+    items = parse_schedule(NIGHT)
+    assert [(i.section, i.time, i.title) for i in items] == [("🌙 Tomorrow", "09:00", "Deep work"),
+                                                               ("🌙 Tomorrow", "14:00", "Review")]
+    assert items[0].done and items[0].desc == "Chapter 2 draft"
+    assert not items[1].done
+    assert items[0].to_block()["to_do"]["checked"] is True
+    # A stray closing tag does not end the list early
+    assert items[1].text() == "14:00 Review"
+
+
+def test_morning_schedule_lines():
+    items = parse_schedule(MORNING)
+    assert [(i.time, i.title) for i in items] == [("08:00 - 09:30", "Gym before the rain"),
+                                                   ("10:00", "Write report"), ("", "Call mum")]
+    assert {i.section for i in items} == {"⏳ Recommended Schedule"}
+
+
+def test_content_hash_ignores_label_wording_but_not_completion():
+    first, second = parse_schedule(NIGHT)
+    assert first.content_hash() != second.content_hash()
+    reparsed = parse_schedule(NIGHT.replace("已完成", "Done"))[0]
+    assert reparsed.content_hash() == first.content_hash()
+    assert parse_schedule(NIGHT.replace("已完成", "进行中"))[0].content_hash() != first.content_hash()
+
+
+def test_empty_and_missing_html():
+    assert parse_schedule("") == []
+    assert parse_schedule(None) == []
+    assert parse_schedule("<div><p>No schedule today</p></div>") == []
+
+
+class FakeNotion:
+    def __init__(self):
+        self.appends, self.deleted, self.next_id = [], [], 0
+        self.blocks = self
+        self.children = self
+
+    def append(self, block_id, children):
+        self.appends.append((block_id, len(children)))
+        self.next_id += len(children)
+        return {"results": [{"id": f"b{self.next_id - len(children) + i}"} for i in range(len(children))]}
+
+    def delete(self, block_id):
+        self.deleted.append(block_id)
+
+
+def schedule_html(titles):
+    lines = "".join(f"<p>{title}</p>" for title in titles)
+    return f'<div class="schedule-recommendations"><h2>Plan</h2><div class="ai-analysis">{lines}</div></div>'
+
+
+def test_write_schedule_batches_and_only_sends_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(writeback, "WRITEBACK_CACHE", str(tmp_path / "writeback.json"))
+    notion = FakeNotion()
+    monkeypatch.setattr(writeback, "notion_client", lambda token: notion)
+    titles = [f"Item {n}" for n in range(150)]
+
+    assert writeback.write_schedule("token", "page", "2025-03-10", "Plan", schedule_html(titles)) == (150, 0, 0)
+    # One heading on the page, then the items under it in batches of APPEND_BATCH
+    assert notion.appends == [("page", 1), ("b0", 100), ("b0", 50)]
+
+    assert writeback.write_schedule("token", "page", "2025-03-10", "Plan", schedule_html(titles)) == (0, 0, 150)
+    assert len(notion.appends) == 3
+
+    changed = titles[1:] + ["Item new"]
+    assert writeback.write_schedule("token", "page", "2025-03-10", "Plan", schedule_html(changed)) == (1, 1, 149)
+    assert notion.deleted == ["b1"] and notion.appends[-1] == ("b0", 1)
+    assert writeback.write_schedule("token", "page", "2025-03-10", "Plan", "") == (0, 0, 0)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from src.digest.scheduler import (DigestJob, delivery_deadline, model_seconds, next_delivery, order_jobs, predict,
+                                  same_day_delivery)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=pytz.utc)
+
+
+def test_delivery_deadline_keeps_a_recent_miss_and_rolls_older_ones():
+    # 22:00 at UTC+8 is 14:00 UTC; at 15:00 UTC the user is an hour late
+    assert delivery_deadline(8, 22, utc(2025, 3, 10, 15)) == utc(2025, 3, 10, 14)
+    # 13 hours late rolls to tomorrow
+    assert delivery_deadline(8, 22, utc(2025, 3, 11, 3)) == utc(2025, 3, 11, 14)
+
+
+def test_delivery_deadline_negative_offset_across_utc_midnight():
+    # 07:00 at UTC-5 is 12:00 UTC; at 02:00 UTC it is still 21:00 of the previous local day
+    assert delivery_deadline(-5, 7, utc(2025, 3, 11, 2)) == utc(2025, 3, 11, 12)
+    assert delivery_deadline(-10, 22, utc(2025, 3, 11, 7)) == utc(2025, 3, 11, 8)
+
+
+def test_next_delivery_respects_the_lead_time():
+    assert next_delivery(8, 7, utc(2025, 3, 10, 22, 49)) == utc(2025, 3, 10, 23)
+    assert next_delivery(8, 7, utc(2025, 3, 10, 22, 51)) == utc(2025, 3, 11, 23)
+    assert next_delivery(-7, 7, utc(2025, 3, 11, 5)) == utc(2025, 3, 11, 14)
+
+
+def test_same_day_delivery_only_for_tonight():
+    # 20:00 local at UTC+8: tonight's 22:00 is still ahead
+    assert same_day_delivery(8, 22, utc(2025, 3, 10, 12)) == utc(2025, 3, 10, 14)
+    # 23:00 local: the next 22:00 is tomorrow's, which must not be written today
+    assert same_day_delivery(8, 22, utc(2025, 3, 10, 15)) is None
+    # 23:30 local at UTC-10 is 09:30 UTC the next day
+    assert same_day_delivery(-10, 22, utc(2025, 3, 11, 9, 30)) is None
+    assert same_day_delivery(-10, 22, utc(2025, 3, 11, 6)) == utc(2025, 3, 11, 8)
+
+
+def test_order_jobs_earliest_deadline_then_longest_first():
+    base = utc(2025, 3, 10, 14)
+    jobs = [
+        DigestJob("late-short", base + timedelta(hours=2), 5),
+        DigestJob("short", base, 5),
+        DigestJob("long", base + timedelta(minutes=10), 30),
+    ]
+    assert [job.user_id for job in order_jobs(jobs, window_minutes=30)] == ["long", "short", "late-short"]
+    assert order_jobs([]) == []
+
+
+def test_predict_reports_makespan_and_late_users():
+    now = utc(2025, 3, 10, 14)
+    jobs = [DigestJob("a", now + timedelta(seconds=10), 10),
+            DigestJob("b", now + timedelta(seconds=10), 10),
+            DigestJob("c", now + timedelta(seconds=15), 10)]
+    assert predict(jobs, 2, now) == (20, ["c"])
+    assert predict(jobs, 3, now) == (10, [])
+    assert predict([], 0, now) == (0.0, [])
+
+
+def test_model_seconds_uses_the_longest_known_prefix():
+    assert model_seconds("gpt-4o-mini-2024-07-18") == 6.0
+    assert model_seconds("GPT-4o") == 15.0
+    assert model_seconds(None) == model_seconds("unknown-model") == 12.0
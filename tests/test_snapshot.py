@@ -0,0 +1,52 @@
+from datetime import date, timedelta, timezone
+
+from src.digest.snapshot import compact_tasks, diff_tasks, load_morning_snapshot, save_morning_snapshot
+from src.get_notion.models import Task
+from src.get_notion.task_from_notion import classify_tasks
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+
+
+def task(page_id, start="2025-03-10 09:00", end="2025-03-10 18:00", completed=False):
+    return Task.from_dict({"id": page_id, "Name": page_id, "Start": start, "End": end, "Completed": completed}, TZ)
+
+
+def buckets(*tasks):
+    return classify_tasks(list(tasks), TODAY, include_completed=True)
+
+
+def test_completed_before_the_morning_is_not_new():
+    morning = compact_tasks(buckets(task("early", completed=True), task("later")))
+    diff = diff_tasks(morning, buckets(task("early", completed=True), task("later", completed=True)))
+    assert [t.name for t in diff.completed] == ["later"]
+    assert diff.unchanged == 1
+
+
+def test_added_rescheduled_and_dropped():
+    morning = compact_tasks(buckets(task("kept"), task("moved"), task("deleted")))
+    diff = diff_tasks(morning, buckets(task("kept"), task("moved", end="2025-03-12 18:00"), task("new")))
+    assert [t.name for t in diff.added] == ["new"]
+    assert [t.name for t, _ in diff.rescheduled] == ["moved"]
+    assert diff.rescheduled[0][1] == "2025-03-10 09:00 → 2025-03-10 18:00"
+    assert diff.dropped == ["deleted"]
+    assert diff.unchanged == 1
+
+
+def test_open_counts_and_due_today():
+    diff = diff_tasks({}, buckets(task("due"), task("future", start="2025-03-14 09:00", end=None)))
+    assert diff.open_counts == {"today_due": 1, "future": 1}
+    assert diff.due_today == ["due"]
+
+
+def test_empty_snapshot_and_fetch():
+    diff = diff_tasks({}, buckets())
+    assert (diff.completed, diff.added, diff.dropped, diff.unchanged) == ([], [], [], 0)
+    assert "新完成 0 项" in diff.summary()
+
+
+def test_morning_snapshot_round_trip():
+    key = ("db-snapshot", "2025-03-10", 8)
+    saved = save_morning_snapshot(key, buckets(task("kept"), task("done", completed=True)))
+    assert load_morning_snapshot(key) == saved
+    assert saved["done"]["c"] is True and saved["kept"]["b"] == "today_due"
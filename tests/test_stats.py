@@ -0,0 +1,83 @@
+from datetime import date, timedelta, timezone
+
+import numpy as np
+
+from src.digest.stats import productivity_stats, record_and_render, stats_html, window_stats
+from src.get_notion.models import Task
+from src.get_notion.task_from_notion import classify_tasks
+
+TODAY = 100
+
+
+def columns(rows):
+    """rows: (run_day, task, due_day, completed, eta, priority)"""
+    run_day, task, due_day, completed, eta, priority = zip(*rows) if rows else ((),) * 6
+    return {
+        "run_day": np.array(run_day, dtype=np.int32),
+        "task": np.array(task, dtype=np.int32),
+        "due_day": np.array(due_day, dtype=np.int32),
+        "completed": np.array(completed, dtype=bool),
+        "eta": np.array(eta, dtype=bool),
+        "priority": np.array(priority, dtype=np.int8),
+    }
+
+
+def test_empty_window_is_none():
+    assert window_stats(columns([]), TODAY, 30) is None
+    # Only rows older than the window
+    assert window_stats(columns([(50, 0, 50, True, True, 3)]), TODAY, 30) is None
+    assert stats_html({30: None, 90: None}) == ""
+
+
+def test_completion_rate_eta_accuracy_and_throughput():
+    stats = window_stats(columns([
+        # task 0: due day 98, done on time with an ETA
+        (97, 0, 98, False, True, 3),
+        (98, 0, 98, True, True, 3),
+        # task 1: due day 99, done late
+        (99, 1, 99, False, True, 1),
+        (100, 1, 99, True, True, 1),
+        # task 2: due day 99, never done
+        (100, 2, 99, False, False, 2),
+    ]), TODAY, 7)
+    assert stats["days"] == 4
+    assert stats["completion_rate"] == 2 / 3
+    assert stats["eta_accuracy"] == 0.5
+    assert stats["throughput"] == {"NA": 0.0, "Low": 1.0, "Medium": 0.0, "High": 1.0}
+
+
+def test_overdue_streak_counts_trailing_run_days():
+    stats = window_stats(columns([
+        (97, 0, 96, False, False, 0),   # overdue
+        (98, 0, 96, True, False, 0),    # done, nothing overdue
+        (99, 1, 98, False, False, 0),   # overdue
+        (100, 1, 98, False, False, 0),  # still overdue
+    ]), TODAY, 30)
+    assert stats["overdue_streak"] == 2
+    assert stats["completion_rate"] == 0.5
+    assert stats["eta_accuracy"] is None
+    assert "2 runs" in stats_html({30: stats})
+
+
+def run(database, day, *rows):
+    tz = timezone(timedelta(hours=-5))
+    tasks = [Task.from_dict({"id": page_id, "Name": page_id, "Start": start, "Priority": "High",
+                             "ETA": True, "Completed": completed}, tz)
+             for page_id, start, completed in rows]
+    return record_and_render(database, day, classify_tasks(tasks, day, include_completed=True))
+
+
+def test_late_and_early_completions_reach_the_history():
+    run("db-late", date(2025, 3, 9), ("late", "2025-03-09 17:00", False), ("early", "2025-03-12 09:00", False))
+    # Finished a day after it was due, and two days before
+    html = run("db-late", date(2025, 3, 10), ("late", "2025-03-09 17:00", True), ("early", "2025-03-12 09:00", True))
+    stats = productivity_stats("db-late", date(2025, 3, 10))[30]
+    assert stats["completion_rate"] == 1.0
+    assert stats["eta_accuracy"] == 0.0
+    assert stats["throughput"]["High"] == round(2 / (30 / 7), 2)
+    assert "completion 100%" in html
+
+
+def test_nothing_fetched_records_nothing():
+    assert run("db-empty", date(2025, 3, 10)) == ""
+    assert productivity_stats("db-empty", date(2025, 3, 10)) == {}
@@ -0,0 +1,66 @@
+from datetime import date, timedelta, timezone
+
+from src.get_notion.models import Task, parse_notion_datetime
+from src.get_notion.task_from_notion import classify_tasks
+
+TZ = timezone(timedelta(hours=8))
+TODAY = date(2025, 3, 10)
+
+
+def task(name, start, end=None, completed=False, tz=TZ):
+    return Task.from_dict({"id": name, "Name": name, "Start": start, "End": end, "Completed": completed}, tz)
+
+
+def names(bucket):
+    return [item.name for item in bucket]
+
+
+def test_tasks_sorted_into_every_bucket():
+    buckets = classify_tasks([
+        task("due", "2025-03-08 09:00", "2025-03-10 18:00"),
+        task("started", "2025-03-09 09:00", "2025-03-12 18:00"),
+        task("tomorrow", "2025-03-11 09:00"),
+        task("later", "2025-03-14 09:00"),
+        task("done", "2025-03-10 08:00", completed=True),
+    ], TODAY, include_completed=True)
+    assert names(buckets["today_due"]) == ["due"]
+    assert names(buckets["in_progress"]) == ["started"]
+    assert names(buckets["future"]) == ["tomorrow", "later"]
+    assert names(buckets["tomorrow"]) == ["tomorrow"]
+    assert names(buckets["upcoming"]) == ["later"]
+    assert names(buckets["completed"]) == ["done"]
+
+
+def test_completed_tasks_only_when_asked():
+    tasks = [task("today", "2025-03-10 08:00", completed=True),
+             task("late", "2025-03-09 08:00", completed=True),
+             task("early", "2025-03-12 08:00", "2025-03-12 18:00", completed=True)]
+    buckets = classify_tasks(tasks, TODAY)
+    assert buckets["completed"] == [] and buckets["all_completed"] == []
+    buckets = classify_tasks(tasks, TODAY, include_completed=True)
+    # The digest lists what was dated today; the history sees every completion in the window
+    assert names(buckets["completed"]) == ["today"]
+    assert names(buckets["all_completed"]) == ["today", "late", "early"]
+    assert buckets["today_due"] == buckets["in_progress"] == buckets["future"] == []
+
+
+def test_day_boundaries_are_local():
+    # 23:59 and 00:00 local fall on different days whatever UTC says
+    buckets = classify_tasks([task("late", "2025-03-10 23:59"), task("midnight", "2025-03-11 00:00")], TODAY)
+    assert names(buckets["in_progress"]) == ["late"]
+    assert names(buckets["tomorrow"]) == ["midnight"]
+
+
+def test_negative_utc_offset_moves_the_local_date():
+    tz = timezone(timedelta(hours=-7))
+    # 05:00 UTC on the 11th is still the evening of the 10th at UTC-7
+    start = parse_notion_datetime("2025-03-11T05:00:00.000Z", tz)
+    assert start.date() == TODAY
+    # Date-only values are local midnight, not UTC midnight
+    assert parse_notion_datetime("2025-03-10", tz).utcoffset() == timedelta(hours=-7)
+    buckets = classify_tasks([task("evening", start.strftime("%Y-%m-%d %H:%M"), tz=tz)], TODAY)
+    assert names(buckets["in_progress"]) == ["evening"]
+
+
+def test_empty_input_gives_empty_buckets():
+    assert all(bucket == [] for bucket in classify_tasks([], TODAY, include_completed=True).values())
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+from src.get_weather import split_days
+
+
+def slot(when, temp, pop=0.0):
+    return {"dt": int(when.timestamp()), "main": {"temp": temp, "humidity": 50},
+            "weather": [{"description": "clear sky"}], "pop": pop}
+
+
+def test_slot_covering_now_is_kept():
+    tz = timezone(timedelta(hours=8))
+    day = datetime(2025, 3, 10, tzinfo=tz)
+    slots = [slot(day + timedelta(hours=h), h) for h in range(0, 48, 3)]
+    summary = split_days(slots, 8, day + timedelta(hours=7))
+    # The 06:00 slot still covers 07:00
+    assert summary["today"]["temp"] == 6
+    assert summary["today"]["temp_min"] == 6 and summary["today"]["temp_max"] == 21
+    assert summary["tomorrow"]["temp"] == 24
+
+
+def test_negative_offset_groups_by_local_date():
+    tz = timezone(timedelta(hours=-5))
+    now = datetime(2025, 3, 10, 22, tzinfo=tz)  # 03:00 UTC on the 11th
+    slots = [slot(now + timedelta(hours=h), h, pop=h / 100) for h in range(0, 30, 3)]
+    summary = split_days(slots, -5, now)
+    assert summary["today"]["temp"] == 0 and summary["today"]["temp_max"] == 0
+    assert summary["tomorrow"]["temp"] == 3
+    assert summary["tomorrow"]["rain_probability"] == 0.24
+
+
+def test_no_slots_left_gives_empty_days():
+    now = datetime(2025, 3, 10, 12, tzinfo=timezone.utc)
+    old = [slot(now - timedelta(hours=6), 1)]
+    assert split_days([], 0, now) == {"today": {}, "tomorrow": {}}
+    assert split_days(old, 0, now) == {"today": {}, "tomorrow": {}}
@@ -0,0 +1,155 @@
+"""Long-lived digest worker: runs one user's morning or night digest on demand.
+
+Imports, the Notion/LLM/HTTP clients and the local caches stay warm between
+triggers, so a single digest only pays for its own fetches and model calls.
+
+    python worker.py
+    curl -X POST -H "Authorization: Bearer $WORKER_TOKEN" http://127.0.0.1:8765/digest/morning/<USER_ID>
+    curl http://127.0.0.1:8765/health
+
+POST /digest/<morning|night>/<USER_ID>[?precompute=1] runs the digest and
+answers 200 once the email was handed to Mailgun, 502 when the digest ran but
+no email was accepted (details in the worker log). A trigger for a digest that
+is already running for the same user is refused with 409. USER_ID is
+URL-encoded when it contains spaces or non-ASCII characters.
+"""
+import argparse
+import hmac
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytz
+
+import morning_email
+import night_email
+from config import WORKER_HOST, WORKER_PORT, WORKER_TOKEN
+from src.ai_operations import ledger
+from src.digest.grouping import GroupCache
+from src.digest.scheduler import DurationHistory
+from src.get_env.user_config import load_user_configs
+from src.get_weather import prefetch_weather
+from src.utils import cassette
+
+DIGESTS = {
+    "morning": morning_email.process_user,
+    "night": night_email.process_user,
+}
+
+
+class Worker:
+    """Runs digests for single users; refuses a second run of the same user and digest at once."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.runs = 0
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Sync the config snapshot and weather cache before the first trigger."""
+        configs = load_user_configs()
+        prefetch_weather(config.get("PRESENT_LOCATION") for config in configs.values())
+        print(f"🔥 Worker warm: {len(configs)} user configurations")
+
+    def trigger(self, digest, user_id, precompute=False):
+        """(HTTP status, response body) for one on-demand digest."""
+        if digest not in DIGESTS:
+            return 404, {"error": f"Unknown digest {digest!r}"}
+        # Incremental sync: one small Notion query picks up config edits
+        config = load_user_configs().get(user_id)
+        if config is None:
+            return 404, {"error": f"Unknown user {user_id!r}"}
+        if not config.is_valid(digest):
+            return 400, {"error": config.errors[digest] or ["Invalid user configuration"]}
+
+        key = (digest, user_id)
+        with self._lock:
+            if key in self._running:
+                return 409, {"error": f"{digest} digest for {user_id} is already running"}
+            self._running.add(key)
+        try:
+            started = time.perf_counter()
+            history = DurationHistory(digest)
+            sent = DIGESTS[digest](user_id, config, datetime.now(pytz.utc), GroupCache(), history,
+                                   ledger.start_run(digest), precompute)
+            history.save()
+            seconds = round(time.perf_counter() - started, 2)
+            if not sent:
+                return 502, {"error": f"{digest} digest for {user_id} was not sent; see the worker log",
+                             "seconds": seconds}
+            with self._lock:
+                self.runs += 1
+            return 200, {"digest": digest, "user_id": user_id, "seconds": seconds}
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    worker = None
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not WORKER_TOKEN:
+            return True
+        given = self.headers.get("Authorization", "").encode()
+        return hmac.compare_digest(given, f"Bearer {WORKER_TOKEN}".encode())
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self._reply(404, {"error": "Not found"})
+        self._reply(200, {"status": "ok", "uptime": round(time.time() - self.worker.started), "runs": self.worker.runs})
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._reply(401, {"error": "Unauthorized"})
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "digest":
+            return self._reply(404, {"error": "Use POST /digest/<morning|night>/<USER_ID>"})
+        precompute = parse_qs(url.query).get("precompute", ["0"])[0].lower() in ("1", "true", "yes")
+        try:
+            status, payload = self.worker.trigger(parts[1], unquote(parts[2]), precompute)
+        except Exception as e:
+            print(f"🔥 Worker error: {str(e)}")
+            status, payload = 500, {"error": str(e)}
+        self._reply(status, payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=WORKER_HOST)
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    args = parser.parse_args()
+
+    if not WORKER_TOKEN and args.host not in ("127.0.0.1", "localhost", "::1"):
+        print("⚠️ WORKER_TOKEN is not set; anyone who can reach this address can trigger digests")
+
+    cassette.install("worker")
+    worker = Worker()
+    worker.warm_up()
+    WorkerHandler.worker = worker
+    server = ThreadingHTTPServer((args.host, args.port), WorkerHandler)
+    server.daemon_threads = True
+    print(f"🚀 Digest worker listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()